@@ -1 +1,2 @@
-from data.ORM import track, user, recognized, artist
+from data.ORM import track, user, recognized, artist, cached_recognition, fingerprint, artist_info, related_track, \
+    user_unique_track, artist_stats, platform_counter
@@ -0,0 +1,18 @@
+from sqlalchemy_serializer import SerializerMixin
+from .db_session import SqlAlchemyBase
+import sqlalchemy
+
+
+# Класс для создания таблицы с кэшем информации об исполнителях (ответы ShazamAPI):
+class ArtistInfo(SqlAlchemyBase, SerializerMixin):
+    __tablename__ = 'artist_info_cache'
+
+    shazam_id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)  # ID исполнителя в Shazam
+    artist = sqlalchemy.Column(sqlalchemy.String)  # Название исполнителя
+    genre = sqlalchemy.Column(sqlalchemy.String)  # Жанр исполнителя
+    background = sqlalchemy.Column(sqlalchemy.String)  # Ссылка на изображение исполнителя (в Shazam)
+
+    # Лучшие треки исполнителя: список [shazam_id трека, название, исполнитель, ссылка на обложку]:
+    top_songs = sqlalchemy.Column(sqlalchemy.JSON, default=list)
+
+    updated = sqlalchemy.Column(sqlalchemy.Float)  # Время загрузки информации (UNIX-время)
@@ -0,0 +1,77 @@
+from sqlalchemy_serializer import SerializerMixin
+from sqlalchemy.dialects.sqlite import insert
+from .db_session import SqlAlchemyBase
+from sqlalchemy import orm
+from .platform_counter import stored_values, add_counters, TRACKS, POPULARITY, ARTISTS
+from .track import Track
+import sqlalchemy
+
+
+# Класс для создания таблицы со статистикой исполнителей (количество треков на платформе и сумма их распознаний):
+class ArtistStats(SqlAlchemyBase, SerializerMixin):
+    __tablename__ = 'artist_stats'
+
+    artist_id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)  # ID исполнителя в Shazam
+    tracks = sqlalchemy.Column(sqlalchemy.Integer, default=0)  # Количество треков исполнителя на платформе
+    popularity = sqlalchemy.Column(sqlalchemy.Integer, default=0)  # Сколько раз распознаны треки исполнителя
+
+    # Индексы для рейтингов исполнителей:
+    __table_args__ = (sqlalchemy.Index('ix_artist_stats_popularity', 'popularity'),
+                      sqlalchemy.Index('ix_artist_stats_tracks_popularity', 'tracks', 'popularity'))
+
+
+def _popularity(track):
+    """ Количество распознаний трека (до записи в БД у нового трека может быть не указано) """
+    return track.popularity if track.popularity is not None else 1
+
+
+# Статистика исполнителей обновляется в той же транзакции, в которой записываются треки:
+# перед каждой записью изменений сессии подсчитываем изменения по каждому исполнителю.
+@sqlalchemy.event.listens_for(orm.Session, 'before_flush')
+def update_artist_stats(session, flush_context, instances):
+    deltas = dict()  # ID исполнителя -> [изменение количества треков, изменение количества распознаний]
+
+    def add(artist_id, tracks, popularity):
+        delta = deltas.setdefault(artist_id, [0, 0])
+        delta[0] += tracks
+        delta[1] += popularity
+
+    for obj in session.new:
+        if isinstance(obj, Track):
+            add(obj.artist_id, 1, _popularity(obj))
+
+    for obj in session.deleted:
+        if isinstance(obj, Track):
+            artist_id, popularity = stored_values(session, obj, 'artist_id', 'popularity')
+            add(artist_id, -1, -(popularity or 0))
+
+    for obj in session.dirty:
+        if not isinstance(obj, Track):
+            continue
+        attrs = sqlalchemy.inspect(obj).attrs
+        if not attrs.artist_id.history.has_changes() and not attrs.popularity.history.has_changes():
+            continue
+
+        # Трек переносится из статистики прежнего исполнителя (с прежней популярностью) в статистику текущего:
+        artist_id, popularity = stored_values(session, obj, 'artist_id', 'popularity')
+        add(artist_id, -1, -(popularity or 0))
+        add(obj.artist_id, 1, _popularity(obj))
+
+    deltas = {artist_id: delta for artist_id, delta in deltas.items() if artist_id is not None and any(delta)}
+    if not deltas:
+        return
+
+    # Количество треков исполнителей до изменений (для счётчика исполнителей, у которых есть треки на платформе):
+    before = dict(session.query(ArtistStats.artist_id, ArtistStats.tracks)
+                  .filter(ArtistStats.artist_id.in_(list(deltas.keys()))).all())
+
+    for artist_id, (tracks, popularity) in deltas.items():
+        statement = insert(ArtistStats).values(artist_id=artist_id, tracks=tracks, popularity=popularity)
+        session.execute(statement.on_conflict_do_update(
+            index_elements=[ArtistStats.artist_id],
+            set_={'tracks': ArtistStats.tracks + tracks, 'popularity': ArtistStats.popularity + popularity}))
+
+    add_counters(session, {TRACKS: sum(tracks for tracks, popularity in deltas.values()),
+                           POPULARITY: sum(popularity for tracks, popularity in deltas.values()),
+                           ARTISTS: sum((before.get(artist_id, 0) + tracks > 0) - (before.get(artist_id, 0) > 0)
+                                        for artist_id, (tracks, popularity) in deltas.items())})
@@ -0,0 +1,21 @@
+from sqlalchemy_serializer import SerializerMixin
+from .db_session import SqlAlchemyBase
+import sqlalchemy
+
+
+# Класс для создания таблицы с кэшем распознаваний (ключ - хеш содержимого загруженного аудиофайла):
+class CachedRecognition(SqlAlchemyBase, SerializerMixin):
+    __tablename__ = 'recognition_cache'
+
+    file_hash = sqlalchemy.Column(sqlalchemy.String, primary_key=True)  # SHA-256 содержимого аудиофайла
+
+    # Данные, которые вернул recognize_song_handler:
+    track_key = sqlalchemy.Column(sqlalchemy.Integer)  # KEY (ключ) трека в Shazam
+    shazam_id = sqlalchemy.Column(sqlalchemy.Integer)  # ID песни в Shazam
+    artist_id = sqlalchemy.Column(sqlalchemy.Integer)  # ID исполнителя в Shazam
+    track = sqlalchemy.Column(sqlalchemy.String)  # Название песни
+    band = sqlalchemy.Column(sqlalchemy.String)  # Название исполнителя
+    background = sqlalchemy.Column(sqlalchemy.String)  # Ссылка на обложку трека
+
+    created = sqlalchemy.Column(sqlalchemy.Float)  # Время записи в кэш (UNIX-время)
+    last_used = sqlalchemy.Column(sqlalchemy.Float, index=True)  # Время последнего обращения (UNIX-время)
@@ -2,6 +2,9 @@ import sqlalchemy as sa  # Сначала импортируем необход
 import sqlalchemy.orm as orm  # Часть библиотеки, которая отвечает за функциональность ORM
 from sqlalchemy.orm import Session  # Объект Session, отвечающий за соединение с базой данных
 import sqlalchemy.ext.declarative as dec  # Модуль declarative — он поможет нам объявить нашу базу данных
+from data.system_files.constants import DB_POOL_SIZE, DB_POOL_OVERFLOW  # Размер пула соединений
+from data.system_files.constants import SQLITE_PRAGMAS  # Настройки SQLite (WAL и т.д.)
+import threading
 
 
 # Абстрактная декларативная база, в которую позднее будем наследовать все наши модели
@@ -10,9 +13,19 @@ SqlAlchemyBase = dec.declarative_base()
 # Используем для получения сессий подключения к нашей базе данных
 __factory = None
 
+# Реестр сессий, привязанных к текущему потоку (одна сессия на один запрос к серверу)
+__scoped = None
+
+# Движок БД и отметка о том, что таблицы созданы, а миграции выполнены (см. migrate):
+__engine = None
+__migrated = False
+__migrate_lock = threading.Lock()
+
 
 def global_init(db_file):
-    global __factory
+    """ Настраивает подключение к БД. Сама БД при этом не открывается: соединения создаются при первом запросе,
+        а таблицы и миграции - явным вызовом migrate() """
+    global __factory, __scoped, __engine
 
     # Проверка: не создали ли мы уже фабрику подключений. Если уже создали, то завершаем работу,
     # так как начальную инициализацию надо проводить только единожды:
@@ -32,18 +45,53 @@ def global_init(db_file):
 
     # Прим. Если в функцию create_engine() передать параметр echo со значением True, в консоль будут выводиться все
     # SQL-запросы, которые сделает SQLAlchemy, что очень удобно для отладки:
-    engine = sa.create_engine(conn_str, echo=False)
+    # Соединения берутся из пула (и возвращаются в него при закрытии сессии), а не открываются на каждый запрос:
+    engine = sa.create_engine(conn_str, echo=False, poolclass=sa.pool.QueuePool,
+                              pool_size=DB_POOL_SIZE, max_overflow=DB_POOL_OVERFLOW, pool_pre_ping=True)
+
+    # Каждое новое соединение настраиваем для одновременной работы нескольких потоков: в режиме WAL читатели
+    # не ждут окончания записи, а писатели ждут освобождения блокировки, а не завершаются ошибкой "database is locked":
+    @sa.event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+        cursor.close()
 
     # Создаем фабрику подключений к нашей базе данных, которая будет работать с нужным нам движком
+    __engine = engine
     __factory = orm.sessionmaker(bind=engine)
+    __scoped = orm.scoped_session(__factory)
 
     # Импортируем все из файла __all_models.py — именно тут SQLalchemy узнает о всех наших моделях:
     # noinspection PyUnresolvedReferences
     from . import __all_models
 
-    # Заставляем нашу базу данных создать все объекты, которые она пока не создала.
-    # Обратите внимание: все таблицы, которые были уже созданы в базе данных, останутся без изменений:
-    SqlAlchemyBase.metadata.create_all(engine)
+
+def migrate():
+    """ Создаёт недостающие таблицы и выполняет ещё не выполненные миграции (см. migrations.py).
+        Вызывается явно: при запуске сервера, перед первым запросом к нему или командой
+        python -m data.ORM.migrations. Повторные вызовы ничего не делают. """
+    global __migrated
+    if __engine is None:
+        raise Exception("Сначала необходимо вызвать global_init().")
+
+    # Флаг проверяется до блокировки (и ещё раз - под блокировкой), поэтому после подготовки БД
+    # вызовы не ждут друг друга:
+    if __migrated:
+        return
+    with __migrate_lock:
+        if __migrated:
+            return
+
+        # Заставляем нашу базу данных создать все объекты, которые она пока не создала.
+        # Обратите внимание: все таблицы, которые были уже созданы в базе данных, останутся без изменений:
+        SqlAlchemyBase.metadata.create_all(__engine)
+
+        # Изменения уже созданных таблиц (индексы и т.д.) выполняются миграциями (см. migrations.py):
+        from .migrations import run_migrations
+        run_migrations(__engine)
+        __migrated = True
 
 
 # Функция create_session нужна для получения сессии подключения к нашей базе данных. Часть -> Session нужна лишь для
@@ -52,3 +100,23 @@ def global_init(db_file):
 def create_session() -> Session:
     global __factory
     return __factory()
+
+
+# Функция scoped возвращает реестр сессий текущего потока: обращения к нему (query, add, commit и т.д.) передаются
+# сессии текущего запроса. По окончании запроса сессию необходимо закрыть функцией remove_session:
+def scoped() -> orm.scoped_session:
+    global __scoped
+    return __scoped
+
+
+# Сессия текущего запроса (создаётся при первом обращении в течение запроса):
+def current_session() -> Session:
+    global __scoped
+    return __scoped()
+
+
+# Закрытие сессии текущего запроса (соединение возвращается в пул):
+def remove_session():
+    global __scoped
+    if __scoped is not None:
+        __scoped.remove()
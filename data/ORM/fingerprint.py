@@ -0,0 +1,19 @@
+from .db_session import SqlAlchemyBase
+from sqlalchemy import orm
+import sqlalchemy
+
+
+# Класс для создания таблицы с отпечатками аудио (инвертированный индекс: хеш пары пиков -> трек):
+class Fingerprint(SqlAlchemyBase):
+    __tablename__ = 'fingerprints'
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
+    hash = sqlalchemy.Column(sqlalchemy.Integer, index=True)  # Хеш пары пиков спектрограммы
+
+    # ID трека, которому принадлежит отпечаток (связан с tracks.id):
+    track_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("tracks.id"), index=True)
+
+    offset = sqlalchemy.Column(sqlalchemy.Integer)  # Позиция первого пика пары (номер кадра спектрограммы)
+
+    # Связываемся с таблицей Tracks:
+    track = orm.relationship('Track')
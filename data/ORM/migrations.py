@@ -0,0 +1,160 @@
+""" Миграции схемы базы данных.
+
+    SqlAlchemyBase.metadata.create_all() создаёт только недостающие таблицы и не изменяет уже существующие
+    (например, не добавляет индексы в таблицы существующей базы данных PyJam.db). Поэтому изменения схемы
+    оформляются в виде миграций: каждая миграция выполняется один раз, а номера выполненных миграций
+    хранятся в таблице schema_migrations.
+
+    Миграции запускаются явно функцией db_session.migrate(): при запуске сервера (python server.py), перед первым
+    запросом к серверу (если приложение запущено WSGI-сервером) или командой:
+        python -m data.ORM.migrations --db db/PyJam.db """
+import argparse
+import time
+
+
+# Индексы для столбцов, по которым выполняется поиск почти на каждой странице:
+# (название, таблица, столбцы, уникальный ли индекс)
+INDEXES = [
+    ('ix_tracks_shazam_id', 'tracks', ('shazam_id',), True),
+    ('ix_tracks_artist_id', 'tracks', ('artist_id',), False),
+    ('ix_artists_shazam_id', 'artists', ('shazam_id',), False),
+    ('ix_recognized_user_id_track_id', 'recognized', ('user_id', 'track_id'), False),
+    ('ix_recognized_track_id', 'recognized', ('track_id',), False),
+]
+
+# Индексы для статистики и топов главной страницы (самые популярные треки, самые активные пользователи,
+# количество избранных треков). Порядок столбцов совпадает с порядком сортировки топов:
+STATS_INDEXES = [
+    ('ix_tracks_popularity', 'tracks', ('popularity DESC', 'id'), False),
+    ('ix_users_unique_total', 'users', ('unique_total DESC', 'id'), False),
+    ('ix_recognized_is_favourite', 'recognized', ('is_favourite',), False),
+]
+
+
+def index_sql(name, table, columns, unique=False):
+    """ SQL-запрос создания индекса (если его ещё нет) """
+    return f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})'
+
+
+def deduplicate_tracks(connection):
+    """ Объединяет треки с одинаковым shazam_id (остаётся трек с наименьшим ID): переносит на него записи
+        библиотек, похожих песен, отпечатков и распознанных пользователями треков, суммирует популярность """
+    duplicates = connection.exec_driver_sql(
+        'SELECT shazam_id, MIN(id) FROM tracks WHERE shazam_id IS NOT NULL '
+        'GROUP BY shazam_id HAVING COUNT(*) > 1').fetchall()
+
+    replaced = dict()  # ID удаляемого трека -> ID оставшегося трека
+    for shazam_id, keeper in duplicates:
+        ids = [row[0] for row in connection.exec_driver_sql(
+            'SELECT id FROM tracks WHERE shazam_id = ? AND id != ?', (shazam_id, keeper))]
+        marks = ', '.join('?' * len(ids))
+
+        connection.exec_driver_sql(f'UPDATE tracks SET popularity = (SELECT SUM(popularity) FROM tracks '
+                                   f'WHERE shazam_id = ?) WHERE id = ?', (shazam_id, keeper))
+        for table in ('recognized', 'related_tracks', 'fingerprints'):
+            connection.exec_driver_sql(f'UPDATE {table} SET track_id = ? WHERE track_id IN ({marks})',
+                                       (keeper, *ids))
+        # Если в библиотеке пользователя были оба дубликата, то остаётся одна запись (избранная, если такая есть):
+        connection.exec_driver_sql(
+            'DELETE FROM recognized WHERE track_id = ? AND id NOT IN ('
+            'SELECT (SELECT r.id FROM recognized r WHERE r.user_id = u.user_id AND r.track_id = ? '
+            'ORDER BY r.is_favourite DESC, r.id LIMIT 1) '
+            'FROM (SELECT DISTINCT user_id FROM recognized WHERE track_id = ?) u)', (keeper, keeper, keeper))
+        connection.exec_driver_sql(f'DELETE FROM tracks WHERE id IN ({marks})', tuple(ids))
+        replaced.update({track_id: keeper for track_id in ids})
+
+    if not replaced:
+        return
+
+    # ID уникальных треков пользователей хранятся строкой (разделитель - &):
+    for user_id, unique in connection.exec_driver_sql('SELECT id, "unique" FROM users').fetchall():
+        track_ids = [int(i) for i in (unique or '').split('&') if i]
+        merged = list(dict.fromkeys(replaced.get(i, i) for i in track_ids))
+        if merged != track_ids:
+            connection.exec_driver_sql('UPDATE users SET "unique" = ?, unique_total = ? WHERE id = ?',
+                                       (''.join(f'{i}&' for i in merged), len(merged), user_id))
+
+
+def add_lookup_indexes(connection):
+    """ Миграция 1: индексы для поиска треков, исполнителей и распознанных треков """
+    deduplicate_tracks(connection)
+    for name, table, columns, unique in INDEXES:
+        connection.exec_driver_sql(index_sql(name, table, columns, unique))
+
+
+def backfill_user_unique_tracks(connection):
+    """ Миграция 2: переносит ID уникальных треков пользователей из строки users.unique (разделитель - &)
+        в таблицу user_unique_tracks и пересчитывает users.unique_total """
+    for user_id, unique in connection.exec_driver_sql('SELECT id, "unique" FROM users').fetchall():
+        track_ids = {int(i) for i in (unique or '').split('&') if i}
+        if track_ids:
+            connection.exec_driver_sql('INSERT OR IGNORE INTO user_unique_tracks (user_id, track_id) VALUES (?, ?)',
+                                       [(user_id, track_id) for track_id in track_ids])
+
+    connection.exec_driver_sql('UPDATE users SET unique_total = (SELECT COUNT(*) FROM user_unique_tracks '
+                               'WHERE user_unique_tracks.user_id = users.id)')
+
+
+def build_artist_stats(connection):
+    """ Миграция 3: заполняет таблицу artist_stats (количество треков и сумма распознаний каждого исполнителя) """
+    connection.exec_driver_sql('DELETE FROM artist_stats')
+    connection.exec_driver_sql('INSERT INTO artist_stats (artist_id, tracks, popularity) '
+                               'SELECT artist_id, COUNT(*), COALESCE(SUM(popularity), 0) FROM tracks '
+                               'WHERE artist_id IS NOT NULL GROUP BY artist_id')
+
+
+def add_stats_indexes(connection):
+    """ Миграция 4: индексы для статистики и топов главной страницы """
+    for name, table, columns, unique in STATS_INDEXES:
+        connection.exec_driver_sql(index_sql(name, table, columns, unique))
+
+
+def build_platform_counters(connection):
+    """ Миграция 5: заполняет таблицу platform_counters (счётчики статистики главной страницы) """
+    connection.exec_driver_sql('DELETE FROM platform_counters')
+    connection.exec_driver_sql(
+        "INSERT INTO platform_counters (name, value) "
+        "SELECT 'users', COUNT(*) FROM users UNION ALL "
+        "SELECT 'library', COUNT(*) FROM recognized UNION ALL "
+        "SELECT 'favourites', COUNT(*) FROM recognized WHERE is_favourite = 1 UNION ALL "
+        "SELECT 'tracks', COALESCE(SUM(tracks), 0) FROM artist_stats UNION ALL "
+        "SELECT 'popularity', COALESCE(SUM(popularity), 0) FROM artist_stats UNION ALL "
+        "SELECT 'artists', COUNT(*) FROM artist_stats WHERE tracks > 0")
+
+
+# Все миграции: (номер, название, функция). Новые миграции добавляются в конец списка:
+MIGRATIONS = [
+    (1, 'add_lookup_indexes', add_lookup_indexes),
+    (2, 'backfill_user_unique_tracks', backfill_user_unique_tracks),
+    (3, 'build_artist_stats', build_artist_stats),
+    (4, 'add_stats_indexes', add_stats_indexes),
+    (5, 'build_platform_counters', build_platform_counters),
+]
+
+
+def run_migrations(engine):
+    """ Выполняет все ещё не выполненные миграции (каждую - в отдельной транзакции) """
+    with engine.begin() as connection:
+        connection.exec_driver_sql('CREATE TABLE IF NOT EXISTS schema_migrations '
+                                   '(version INTEGER PRIMARY KEY, name VARCHAR, applied FLOAT)')
+        applied = {row[0] for row in connection.exec_driver_sql('SELECT version FROM schema_migrations')}
+
+    for version, name, migration in MIGRATIONS:
+        if version in applied:
+            continue
+
+        with engine.begin() as connection:
+            migration(connection)
+            connection.exec_driver_sql('INSERT INTO schema_migrations (version, name, applied) VALUES (?, ?, ?)',
+                                       (version, name, time.time()))
+        print(f'Выполнена миграция базы данных {version}: {name}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Создание таблиц и миграции базы данных')
+    parser.add_argument('--db', default='db/PyJam.db')
+    args = parser.parse_args()
+
+    from data.ORM import db_session
+    db_session.global_init(args.db)
+    db_session.migrate()
@@ -0,0 +1,77 @@
+from sqlalchemy_serializer import SerializerMixin
+from sqlalchemy.dialects.sqlite import insert
+from .db_session import SqlAlchemyBase
+from .recognized import Recognized
+from sqlalchemy import orm
+from .user import User
+import sqlalchemy
+
+
+# Счётчики платформы (поддерживаются в той же транзакции, в которой изменяются соответствующие таблицы):
+USERS = 'users'  # количество зарегистрированных пользователей
+LIBRARY = 'library'  # количество треков в библиотеках пользователей
+FAVOURITES = 'favourites'  # количество избранных треков в библиотеках пользователей
+TRACKS = 'tracks'  # количество треков на платформе (см. artist_stats.py)
+POPULARITY = 'popularity'  # сколько раз распознаны треки платформы (см. artist_stats.py)
+ARTISTS = 'artists'  # количество исполнителей, у которых есть треки на платформе (см. artist_stats.py)
+
+
+# Класс для создания таблицы со счётчиками платформы (статистика главной страницы):
+class PlatformCounter(SqlAlchemyBase, SerializerMixin):
+    __tablename__ = 'platform_counters'
+
+    name = sqlalchemy.Column(sqlalchemy.String, primary_key=True)  # Название счётчика
+    value = sqlalchemy.Column(sqlalchemy.Integer, default=0)  # Значение счётчика
+
+
+def stored_values(session, obj, *names):
+    """ Значения атрибутов объекта, записанные в БД (до изменений в текущей сессии) """
+    attrs = sqlalchemy.inspect(obj).attrs
+    values = []
+    for name in names:
+        history = attrs[name].history
+        if history.deleted:
+            values.append(history.deleted[0])
+        elif history.added:
+            # Значение изменено без загрузки прежнего значения (например, после коммита) - читаем его из БД:
+            model = type(obj)
+            return session.query(*[getattr(model, n) for n in names]).filter(model.id == obj.id).one()
+        else:
+            values.append(getattr(obj, name))
+    return values
+
+
+def add_counters(session, deltas):
+    """ Изменяет счётчики платформы: deltas[dict] - {название счётчика: изменение} """
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        statement = insert(PlatformCounter).values(name=name, value=delta)
+        session.execute(statement.on_conflict_do_update(index_elements=[PlatformCounter.name],
+                                                        set_={'value': PlatformCounter.value + delta}))
+
+
+# Перед каждой записью изменений сессии подсчитываем новых и удалённых пользователей, а также изменения библиотек:
+@sqlalchemy.event.listens_for(orm.Session, 'before_flush')
+def update_platform_counters(session, flush_context, instances):
+    deltas = {USERS: 0, LIBRARY: 0, FAVOURITES: 0}
+
+    for obj in session.new:
+        if isinstance(obj, User):
+            deltas[USERS] += 1
+        elif isinstance(obj, Recognized):
+            deltas[LIBRARY] += 1
+            deltas[FAVOURITES] += bool(obj.is_favourite)
+
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            deltas[USERS] -= 1
+        elif isinstance(obj, Recognized):
+            deltas[LIBRARY] -= 1
+            deltas[FAVOURITES] -= bool(stored_values(session, obj, 'is_favourite')[0])
+
+    for obj in session.dirty:
+        if isinstance(obj, Recognized) and sqlalchemy.inspect(obj).attrs.is_favourite.history.has_changes():
+            deltas[FAVOURITES] += bool(obj.is_favourite) - bool(stored_values(session, obj, 'is_favourite')[0])
+
+    add_counters(session, deltas)
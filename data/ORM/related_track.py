@@ -0,0 +1,21 @@
+from sqlalchemy_serializer import SerializerMixin
+from .db_session import SqlAlchemyBase
+from sqlalchemy import orm
+import sqlalchemy
+
+
+# Класс для создания таблицы с кэшем похожих песен (ключ - track_key трека, для которого искались похожие песни):
+class RelatedTrack(SqlAlchemyBase, SerializerMixin):
+    __tablename__ = 'related_tracks'
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
+    track_key = sqlalchemy.Column(sqlalchemy.Integer, index=True)  # KEY (ключ) исходного трека
+    position = sqlalchemy.Column(sqlalchemy.Integer)  # Порядковый номер похожей песни в ответе ShazamAPI
+
+    # ID похожей песни в БД:
+    track_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("tracks.id"))
+
+    updated = sqlalchemy.Column(sqlalchemy.Float)  # Время загрузки списка похожих песен (UNIX-время)
+
+    # Связываемся с таблицей Tracks:
+    track = orm.relationship('Track')
@@ -17,10 +17,11 @@ class User(SqlAlchemyBase, UserMixin, SerializerMixin):
     gender = sqlalchemy.Column(sqlalchemy.String)  # Пол (Мужской / Женский) пользователя
     hashed_password = sqlalchemy.Column(sqlalchemy.String)  # Пароль пользователя
 
-    # ID уникальных треков, которые распознал пользователь (разделитель - &):
+    # УСТАРЕВШЕЕ ПОЛЕ: ID уникальных треков, которые распознал пользователь (разделитель - &).
+    # Уникальные треки хранятся в таблице user_unique_tracks (см. user_unique_track.py):
     unique = sqlalchemy.Column(sqlalchemy.String, default='')
 
-    # Всего распознано уникальных треков:
+    # Всего распознано уникальных треков (количество строк пользователя в таблице user_unique_tracks):
     unique_total = sqlalchemy.Column(sqlalchemy.Integer, default=0)
     background = sqlalchemy.Column(sqlalchemy.String)  # Изображение профиля
     date = sqlalchemy.Column(sqlalchemy.String, default=get_valid_date)  # Дата регистрации
@@ -0,0 +1,12 @@
+from sqlalchemy_serializer import SerializerMixin
+from .db_session import SqlAlchemyBase
+import sqlalchemy
+
+
+# Класс для создания таблицы с уникальными треками, которые распознал пользователь (одна строка - один трек):
+class UserUniqueTrack(SqlAlchemyBase, SerializerMixin):
+    __tablename__ = 'user_unique_tracks'
+
+    # ID пользователя (связан с users.id) и ID распознанного им трека (связан с tracks.id):
+    user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("users.id"), primary_key=True)
+    track_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("tracks.id"), primary_key=True)
@@ -1,7 +1,7 @@
 """ REST-API для сбора JSON-файла с данными об исполнителях на платформе """
 from flask_restful import Resource, Api, abort
 from data.ORM.artist import Artist
-from data.ORM.track import Track
+from data.system_files.artist_stats import artist_stats, artists_with_stats
 from data.ORM import db_session
 from flask import jsonify
 import requests
@@ -9,7 +9,7 @@ import requests
 
 # Возврат сообщения о работе сервера:
 def abort_404(artist_id):
-    session = db_session.create_session()
+    session = db_session.current_session()
     artist = session.query(Artist).get(artist_id)
     if not artist:
         abort(404)
@@ -22,8 +22,8 @@ class ArtistJsonAPI(Resource):
         # Проверяем существование исполнителя с ID [artist_id]:
         abort_404(artist_id)
 
-        # Создаём сессию, загружаем информацию и отправляем её:
-        session = db_session.create_session()
+        # Получаем сессию текущего запроса, загружаем информацию и отправляем её:
+        session = db_session.current_session()
         artist = session.query(Artist).get(artist_id)
 
         get_data = dict()
@@ -33,9 +33,7 @@ class ArtistJsonAPI(Resource):
         get_data['shazam_id'] = artist.shazam_id
         get_data['name'] = artist.artist
         get_data['genre'] = artist.genre
-        get_data['recognized'] = sum([t.popularity for t in
-                                      session.query(Track).filter(Track.artist_id == artist.shazam_id).all()])
-        get_data['track_on_platform'] = len(session.query(Track).filter(Track.artist_id == artist.shazam_id).all())
+        get_data['track_on_platform'], get_data['recognized'] = artist_stats(session, artist.shazam_id)
         return jsonify({'artist': get_data})
 
 
@@ -43,23 +41,22 @@ class ArtistJsonAPI(Resource):
 class ArtistAllJsonAPI(Resource):
     def get(self):
 
-        # Создаём сессию, загружаем информацию и отправляем её:
-        session = db_session.create_session()
-        artists = session.query(Artist).all()
+        # Получаем сессию текущего запроса, загружаем информацию и отправляем её:
+        session = db_session.current_session()
+        artists = artists_with_stats(session)
 
         get_data = dict()
         get_data['artist'] = []
 
-        for artist in artists:
+        for artist, recognized, track_on_platform in artists:
             artist_data = dict()
             if artist.id:
                 artist_data['platform_id'] = artist.id
             artist_data['shazam_id'] = artist.shazam_id
             artist_data['name'] = artist.artist
             artist_data['genre'] = artist.genre
-            artist_data['recognized'] = sum([t.popularity for t in
-                                          session.query(Track).filter(Track.artist_id == artist.shazam_id).all()])
-            artist_data['track_on_platform'] = len(session.query(Track).filter(Track.artist_id == artist.shazam_id).all())
+            artist_data['recognized'] = recognized
+            artist_data['track_on_platform'] = track_on_platform
 
             get_data['artist'].append(artist_data)
 
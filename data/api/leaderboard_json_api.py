@@ -0,0 +1,17 @@
+""" REST-API для сбора JSON-файла с топом пользователей платформы (постранично) """
+from data.system_files.constants import LEADERBOARD_PAGE_SIZE
+from data.system_files.leaderboard import leaderboard_page
+from flask_restful import Resource
+from data.ORM import db_session
+from flask import jsonify, request
+
+
+# Класс REST-API для сбора страницы топа пользователей: ?page=<номер страницы>&per_page=<пользователей на странице>
+class LeaderboardJsonAPI(Resource):
+    def get(self):
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', LEADERBOARD_PAGE_SIZE, type=int)
+
+        # Получаем сессию текущего запроса, загружаем страницу топа и отправляем её:
+        session = db_session.current_session()
+        return jsonify({'leaderboard': leaderboard_page(session, page, per_page)})
@@ -0,0 +1,106 @@
+""" REST-API для фонового распознавания треков: постановка задачи в очередь и получение её статуса """
+from data.system_files.recognition_jobs import recognition_queue, QueueOverflowError, DONE
+from data.system_files.recognition_service import spool_upload, spool_batch, recognize_upload, recognize_cached, \
+    recognize_batch_job, BatchTooLargeError
+from data.system_files.constants import BATCH_RECOGNITION_LIMIT
+from flask_restful import Resource, abort
+from flask_login import current_user
+from data.ORM import db_session
+from flask import jsonify, request
+import zipfile
+
+
+# Класс REST-API для постановки аудиофайла в очередь распознавания.
+# Сразу возвращает ID задачи, по которому можно узнать результат распознавания:
+class RecognizeJsonAPI(Resource):
+    def post(self):
+
+        # Проверяем, что пользователь отправил файл:
+        f = request.files.get('file')
+        if f is None or not f.filename:
+            abort(400, message='Файл не отправлен')
+
+        # Читаем файл в буфер и вычисляем хеш его содержимого:
+        buffer, digest = spool_upload(f.stream)
+
+        # Если такой же файл уже распознавался, то сразу возвращаем результат из кэша:
+        user_id = current_user.id if current_user.is_authenticated else None
+        track_id = recognize_cached(db_session.current_session(), digest, user_id)
+        if track_id is not None:
+            buffer.close()
+            return jsonify({'job': {'id': None, 'status': DONE, 'track_id': track_id}})
+
+        # Ставим задачу в очередь:
+        try:
+            job_id = recognition_queue.submit(recognize_upload, buffer, user_id, digest)
+        except QueueOverflowError:
+            buffer.close()
+            abort(503, message='Очередь распознавания переполнена')
+
+        response = jsonify({'job': {'id': job_id, 'status_url': f'/api/v1/recognize/{job_id}'}})
+        response.status_code = 202
+        return response
+
+
+# Класс REST-API для получения статуса задачи распознавания с ID [job_id]:
+class RecognizeJobJsonAPI(Resource):
+    def get(self, job_id):
+
+        # Проверяем существование задачи:
+        job = recognition_queue.status(job_id)
+        if job is None:
+            abort(404)
+
+        get_data = dict()
+        get_data['id'] = job['id']
+        get_data['status'] = job['status']
+        get_data['track_id'] = job['result']
+        get_data['error'] = job['error']
+        return jsonify({'job': get_data})
+
+
+# Класс REST-API для пакетного распознавания: принимает несколько файлов и/или ZIP-архивы (поле files),
+# ставит их распознавание в очередь и сразу возвращает ID задачи, по которому можно получить отчёт:
+class RecognizeBatchJsonAPI(Resource):
+    def post(self):
+
+        # Читаем все файлы (и содержимое архивов) в буферы. Количество и размер файлов проверяются до распаковки:
+        try:
+            uploads = spool_batch(request.files.getlist('files'))
+        except zipfile.BadZipFile:
+            abort(400, message='Повреждённый ZIP-архив')
+        except BatchTooLargeError as e:
+            abort(400, message=str(e))
+
+        if not uploads:
+            abort(400, message=f'Необходимо отправить от 1 до {BATCH_RECOGNITION_LIMIT} аудиофайлов')
+
+        # Ставим задачу в очередь распознавания:
+        user_id = current_user.id if current_user.is_authenticated else None
+        try:
+            job_id = recognition_queue.submit(recognize_batch_job, uploads, user_id)
+        except QueueOverflowError:
+            for name, buffer, digest in uploads:
+                buffer.close()
+            abort(503, message='Очередь распознавания переполнена')
+
+        response = jsonify({'job': {'id': job_id, 'status_url': f'/api/v1/recognize/batch/{job_id}'}})
+        response.status_code = 202
+        return response
+
+
+# Класс REST-API для получения статуса задачи пакетного распознавания с ID [job_id] и отчёта по каждому файлу:
+class RecognizeBatchJobJsonAPI(Resource):
+    def get(self, job_id):
+
+        # Проверяем существование задачи:
+        job = recognition_queue.status(job_id)
+        if job is None:
+            abort(404)
+
+        get_data = dict()
+        get_data['id'] = job['id']
+        get_data['status'] = job['status']
+        get_data['report'] = job['result']
+        get_data['error'] = job['error']
+        return jsonify({'batch': get_data})
@@ -9,7 +9,7 @@ import requests
 
 # Возврат сообщения о работе сервера:
 def abort_404(track_id):
-    session = db_session.create_session()
+    session = db_session.current_session()
     track = session.query(Track).get(track_id)
     if not track:
         abort(404)
@@ -21,8 +21,8 @@ class TrackJsonAPI(Resource):
         # Проверяем существование трека с ID [track_id]:
         abort_404(track_id)
 
-        # Создаём сессию, загружаем информацию и отправляем её:
-        session = db_session.create_session()
+        # Получаем сессию текущего запроса, загружаем информацию и отправляем её:
+        session = db_session.current_session()
         track = session.query(Track).get(track_id)
 
         get_data = dict()
@@ -40,8 +40,8 @@ class TrackJsonAPI(Resource):
 class TrackAllJsonAPI(Resource):
     def get(self):
 
-        # Создаём сессию, загружаем информацию и отправляем её:
-        session = db_session.create_session()
+        # Получаем сессию текущего запроса, загружаем информацию и отправляем её:
+        session = db_session.current_session()
         tracks = session.query(Track).all()
 
         get_data = dict()
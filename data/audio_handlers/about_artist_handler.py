@@ -1,11 +1,16 @@
 """ SHAZAM API -> Shazamio. Получение информации об исполнителе по его ID"""
+from data.audio_handlers.shazam_client import shazam_client
+from data.system_files.async_runtime import run
+from data.system_files.single_flight import coalesce
 from shazamio.schemas.artists import ArtistQuery
 from shazamio.schemas.enums import ArtistView
-from shazamio import Shazam
-from pprint import pprint
+import logging
 import asyncio
 
 
+log = logging.getLogger(__name__)
+
+
 def artwork_handler(artwork):
     """ Функция возвращает аватарку исходя из переданного параметра artwork;
         artwork[dict] -> словарь со ссылкой на изображение, а также шириной и высотой изображения """
@@ -21,7 +26,7 @@ def artwork_handler(artwork):
 async def best_artist_tracks(artist_id):
     """ Функция возвращает самые популярные треки определённого исполнителя
         Примечание: на странице отображается ТОП-3 трека, и вместе с остальными треками они загружаются в БД """
-    shazam = Shazam()
+    shazam = shazam_client()
     about_artist = await shazam.artist_about(artist_id,
                                              query=ArtistQuery(views=[ArtistView.TOP_SONGS]))
     return about_artist
@@ -30,8 +35,11 @@ async def best_artist_tracks(artist_id):
 async def artist_info(artist_id):
     """ Функция возвращает краткую информацию об исполнителе
         artist_id[int] -> ID исполнителя, по которому будем искать его с помощью Shazamio """
-    shazam = Shazam()
-    about_artist = await shazam.artist_about(artist_id)
+    shazam = shazam_client()
+
+    # Информация об исполнителе и его лучшие треки загружаются параллельно:
+    about_artist, artist_best = await asyncio.gather(shazam.artist_about(artist_id),
+                                                     best_artist_tracks(artist_id))
 
     # Если исполнителя удалось найти - загружаем информацию о нём:
     if about_artist:
@@ -46,7 +54,7 @@ async def artist_info(artist_id):
         artist_artwork = about_artist['artwork']  # [Артворк] с данными об изображении исполнителя
         artist_background = artwork_handler(artist_artwork)  # Ссылка на изображение
 
-        artist_best = await best_artist_tracks(artist_id)  # Возвращаем информацию с лучшими треками исполнителя
+        # Информация с лучшими треками исполнителя:
         artist_best = artist_best['data'][0]['views']['top-songs']['data']
 
         artist_best_tracks = list()
@@ -71,9 +79,30 @@ async def artist_info(artist_id):
     return None
 
 
-# Обработчик функции Artist_info():
+# Обработчик функции Artist_info() (корутина выполняется в общем цикле событий,
+# одновременные запросы одного исполнителя объединяются в один):
+@coalesce
 def get_artist_info(artist_id):
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+    return run(artist_info(artist_id))
+
+
+async def artists_info(artist_ids):
+    """ Функция параллельно загружает информацию о нескольких исполнителях (см. artist_info).
+        Возвращает словарь {ID исполнителя: информация}; для исполнителей, которых нет в Shazam, информация - None,
+        а исполнители, которых не удалось загрузить (ошибка запроса), пропускаются.
+
+        artist_ids[list] - список ID исполнителей. """
+    results = await asyncio.gather(*(artist_info(artist_id) for artist_id in artist_ids), return_exceptions=True)
+
+    infos = dict()
+    for artist_id, result in zip(artist_ids, results):
+        if isinstance(result, Exception):
+            log.warning(f'Не удалось загрузить информацию об исполнителе {artist_id}: {result}')
+        else:
+            infos[artist_id] = result
+    return infos
+
 
-    return loop.run_until_complete(artist_info(artist_id))
+# Обработчик функции Artists_info() (корутина выполняется в общем цикле событий):
+def get_artists_info(artist_ids):
+    return run(artists_info(list(artist_ids)))
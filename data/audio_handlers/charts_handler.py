@@ -7,13 +7,12 @@
     РАБОТЫ НЕ СНИЗИТСЯ. БУДЕМ НАДЕЯТЬСЯ НА ТО, ЧТО КОМАНДА РАЗРАБОТЧИКОВ SHAZAM СМОЖЕТ ИСПРАВИТЬ ДАННУЮ ПРОБЛЕМУ.
 
 """
-from shazamio import Shazam, GenreMusic
-from data.system_files.constants import UNKNOWN_SONG, LIMIT_CONSTANT
-import asyncio
-
-
-# Специальное условие асинхронной функции для ОС Windows:
-asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+from data.system_files.constants import UNKNOWN_SONG, LIMIT_CONSTANT, CHARTS_CACHE_TTL
+from data.system_files.ttl_cache import StaleWhileRevalidateCache
+from data.audio_handlers.shazam_client import shazam_client
+from data.system_files.async_runtime import run
+from data.system_files.single_flight import coalesce
+from shazamio import GenreMusic
 
 
 # Словарь с жанрами. Значения словаря должны подаваться на вход функции для получения информации:
@@ -32,7 +31,7 @@ genres_library = {
 async def world_top():
     """ Функция возвращает информацию о самых популярных треках в мире.
         LIMIT_CONSTANT - количество позиций в топе. """
-    return await Shazam().top_world_tracks(limit=LIMIT_CONSTANT)
+    return await shazam_client().top_world_tracks(limit=LIMIT_CONSTANT)
 
 
 async def world_top_by_genre(genre):
@@ -40,14 +39,14 @@ async def world_top_by_genre(genre):
         Genre[str] - жанр, по которому нужно произвести запрос;
         LIMIT_CONSTANT - количество позиций в топе. """
     get_g = genres_library[genre]
-    return await Shazam().top_world_genre_tracks(genre=get_g, limit=LIMIT_CONSTANT)
+    return await shazam_client().top_world_genre_tracks(genre=get_g, limit=LIMIT_CONSTANT)
 
 
 async def country_top(country):
     """ Функция возвращает информацию о самых популярных треках в определённой стране.
         Country[str] - страна, по которой нужно произвести запрос;
         LIMIT_CONSTANT - количество позиций в топе."""
-    return await Shazam().top_country_tracks(country, LIMIT_CONSTANT)
+    return await shazam_client().top_country_tracks(country, LIMIT_CONSTANT)
 
 
 async def country_top_by_genre(country, genre):
@@ -56,13 +55,12 @@ async def country_top_by_genre(country, genre):
         Genre[str] - жанр, по которому нужно произвести запрос. В данном случае выступает в роли фильтра;
         LIMIT_CONSTANT - количество позиций в топе. """
     get_g = genres_library[genre]
-    return await Shazam().top_country_genre_tracks(country_code=country, genre=get_g,
-                                                   limit=LIMIT_CONSTANT)
+    return await shazam_client().top_country_genre_tracks(country_code=country, genre=get_g,
+                                                          limit=LIMIT_CONSTANT)
 
 
-def charts_handler(country, genre=None):
-    """ Данная функция обрабатывает полученные от пользователя данные, а затем возвращает информацию о
-        хит-парадах*, исходя из избранных фильтров.
+async def fetch_charts(country, genre=None):
+    """ Корутина загружает хит-парад* и возвращает список треков (см. charts_handler).
 
         Country[str] - страна, по которой нужно произвести запрос.
         Genre[str] - жанр, по которому нужно произвести запрос. В данном случае выступает в роли фильтра.
@@ -72,20 +70,18 @@ def charts_handler(country, genre=None):
     # Создаём список, который будем отправлять на сервер сайта. В нём будет храниться данные со всеми треками,
     # включенными в хит-парад:
     rating = []
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
 
     # Фильтрация запроса:
     if genre is None:
         if country == 'world':
-            data = loop.run_until_complete(world_top())['tracks']
+            data = (await world_top())['tracks']
         else:
-            data = loop.run_until_complete(country_top(country))['tracks']
+            data = (await country_top(country))['tracks']
     else:
         if country == 'world':
-            data = loop.run_until_complete(world_top_by_genre(genre))['tracks']
+            data = (await world_top_by_genre(genre))['tracks']
         else:
-            data = loop.run_until_complete(country_top_by_genre(country, genre))['tracks']
+            data = (await country_top_by_genre(country, genre))['tracks']
 
     # Создание списка списков с информацией о топе:
     for i in data:
@@ -115,6 +111,31 @@ def charts_handler(country, genre=None):
     return rating
 
 
+@coalesce
+def charts_handler(country, genre=None):
+    """ Данная функция обрабатывает полученные от пользователя данные, а затем возвращает информацию о
+        хит-парадах*, исходя из избранных фильтров.
+
+        Country[str] - страна, по которой нужно произвести запрос.
+        Genre[str] - жанр, по которому нужно произвести запрос. В данном случае выступает в роли фильтра.
+
+        *По версии Shazam """
+
+    # Корутина выполняется в общем цикле событий:
+    return run(fetch_charts(country, genre))
+
+
+# Кэш хит-парадов (ключ - страна и жанр). Хит-парады меняются лишь несколько раз в день, поэтому
+# в течение CHARTS_CACHE_TTL секунд они берутся из кэша, а устаревший хит-парад обновляется в фоне.
+# При сбое на стороне ShazamAPI отображается последний удачно загруженный хит-парад:
+charts_cache = StaleWhileRevalidateCache(charts_handler, ttl=CHARTS_CACHE_TTL)
+
+
+def get_charts(country, genre=None):
+    """ Возвращает хит-парад из кэша (см. charts_handler и charts_cache) """
+    return charts_cache.get(country, genre)
+
+
 # Архивная функция: найти доступные фильтры по жанрам для отдельной страны (не учитывается в общей сумме строк кода)
 # def find_available_genres(country):
 #     available = list()
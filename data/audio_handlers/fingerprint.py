@@ -0,0 +1,236 @@
+""" Локальное распознавание треков по отпечаткам аудио (без обращения к ShazamAPI).
+
+    Отпечаток строится так же, как у Shazam: по спектрограмме находятся пики ("созвездие"), каждая пара
+    близких пиков превращается в хеш (частота 1, частота 2, расстояние между пиками), а хеши с позицией
+    первого пика записываются в инвертированный индекс (таблица fingerprints) с привязкой к tracks.id.
+    При распознавании хеши фрагмента ищутся в индексе, и трек считается найденным, если достаточно
+    хешей совпало с одинаковым сдвигом по времени.
+
+    В индекс попадают только самые популярные треки платформы (см. FINGERPRINT_TOP_TRACKS): отпечатки
+    добавляются после успешного распознавания загруженного файла через ShazamAPI.
+
+    Проверка без доступа к сети (нужен FFMPEG, как и для распознавания):
+        python -m data.audio_handlers.fingerprint index <ID трека в БД> data/audio_handlers/music/file.mp3
+        python -m data.audio_handlers.fingerprint match data/audio_handlers/music/file.mp3
+"""
+from data.system_files.constants import FINGERPRINT_SAMPLE_RATE, FINGERPRINT_TOP_TRACKS, FINGERPRINT_MIN_MATCHES, \
+    FINGERPRINT_TRACK_LIMIT
+from numpy.lib.stride_tricks import sliding_window_view
+from collections import Counter, defaultdict
+from data.ORM.fingerprint import Fingerprint
+from data.ORM.track import Track
+from data.ORM import db_session
+from pydub import AudioSegment
+from sqlalchemy import insert
+import numpy as np
+import sys
+import io
+
+
+# Параметры спектрограммы: размер окна БПФ и шаг между кадрами (в отсчётах):
+FFT_SIZE = 2048
+HOP_SIZE = 512
+
+# Размер окрестности (в кадрах и частотных полосах), в которой пик должен быть максимальным,
+# и количество самых громких пиков, которые остаются в каждом блоке из PEAK_BLOCK кадров (~1 секунда):
+PEAK_NEIGHBORHOOD = 10
+PEAK_BLOCK = 22
+PEAKS_PER_BLOCK = 30
+
+# Количество пиков, с которыми образует пары каждый пик, и максимальное расстояние между пиками пары (в кадрах):
+FAN_OUT = 10
+MAX_TIME_DELTA = 200
+
+# Количество хешей в одном SQL-запросе к индексу:
+QUERY_CHUNK = 500
+
+
+def decode_audio(file):
+    """ Декодирует аудиофайл в массив отсчётов: моно, частота FINGERPRINT_SAMPLE_RATE.
+        File[str | bytes | AudioSegment] - путь к файлу, содержимое файла или уже декодированное аудио. """
+    if isinstance(file, AudioSegment):
+        audio = file
+    elif isinstance(file, (bytes, bytearray)):
+        audio = AudioSegment.from_file(io.BytesIO(file))
+    else:
+        audio = AudioSegment.from_file(file)
+
+    audio = audio.set_channels(1).set_frame_rate(FINGERPRINT_SAMPLE_RATE)
+    samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+    return samples / float(1 << (8 * audio.sample_width - 1))
+
+
+def spectrogram(samples):
+    """ Логарифмическая амплитудная спектрограмма: массив [кадры, частотные полосы].
+        Полоса частоты Найквиста (последняя полоса БПФ) отбрасывается: остаётся FFT_SIZE / 2 = 1024 полосы,
+        номер которых помещается в 10 бит хеша (см. fingerprint). """
+    if len(samples) < FFT_SIZE:
+        return np.zeros((0, FFT_SIZE // 2), dtype=np.float32)
+
+    frames = sliding_window_view(samples, FFT_SIZE)[::HOP_SIZE]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FFT_SIZE), axis=1))[:, :FFT_SIZE // 2]
+    return np.log1p(spectrum)
+
+
+def find_peaks(spec):
+    """ Находит пики спектрограммы: точки, максимальные в своей окрестности и громче среднего уровня.
+        Возвращает массив пар [кадр, частотная полоса], отсортированный по времени. """
+    if not spec.size:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    # Максимум по окрестности считаем раздельно: сначала по времени, затем по частоте:
+    size = 2 * PEAK_NEIGHBORHOOD + 1
+    padded = np.pad(spec, PEAK_NEIGHBORHOOD, mode='constant', constant_values=0)
+    local_max = sliding_window_view(padded, size, axis=0).max(axis=-1)
+    local_max = sliding_window_view(local_max, size, axis=1).max(axis=-1)
+
+    peaks = np.argwhere((spec == local_max) & (spec > spec.mean()))
+
+    # Оставляем в каждом блоке только самые громкие пики, чтобы шум не добавлял случайных хешей:
+    strongest = []
+    for start in range(0, spec.shape[0], PEAK_BLOCK):
+        block = peaks[(peaks[:, 0] >= start) & (peaks[:, 0] < start + PEAK_BLOCK)]
+        order = np.argsort(-spec[block[:, 0], block[:, 1]], kind='stable')
+        strongest.append(block[order[:PEAKS_PER_BLOCK]])
+
+    peaks = np.concatenate(strongest)
+    return peaks[np.lexsort((peaks[:, 1], peaks[:, 0]))]
+
+
+def fingerprint(samples):
+    """ Возвращает список хешей фрагмента в виде пар (хеш, позиция первого пика) """
+    peaks = find_peaks(spectrogram(samples))
+    hashes = []
+
+    for i in range(len(peaks)):
+        t1, f1 = peaks[i]
+        for t2, f2 in peaks[i + 1:i + 1 + FAN_OUT]:
+            dt = t2 - t1
+            if 0 < dt <= MAX_TIME_DELTA:
+                # Хеш: 10 бит частоты первого пика, 10 бит частоты второго пика, 10 бит расстояния между ними:
+                hashes.append((int((f1 & 0x3FF) << 20 | (f2 & 0x3FF) << 10 | dt), int(t1)))
+    return hashes
+
+
+def match_hashes(session, hashes):
+    """ Ищет хеши фрагмента в индексе. Возвращает ID трека в БД, или None, если совпадений недостаточно.
+
+        session - сессия БД;
+        hashes[list] - хеши фрагмента (см. fingerprint). """
+    sample_offsets = defaultdict(list)
+    for h, offset in hashes:
+        sample_offsets[h].append(offset)
+
+    # Совпадения группируем по треку и сдвигу во времени: у настоящего совпадения сдвиг одинаковый:
+    votes = Counter()
+    keys = list(sample_offsets.keys())
+    for i in range(0, len(keys), QUERY_CHUNK):
+        rows = session.query(Fingerprint.hash, Fingerprint.track_id, Fingerprint.offset).filter(
+            Fingerprint.hash.in_(keys[i:i + QUERY_CHUNK])).all()
+        for h, track_id, offset in rows:
+            for sample_offset in sample_offsets[h]:
+                votes[(track_id, offset - sample_offset)] += 1
+
+    if not votes:
+        return None
+
+    # Из-за округления до кадров сдвиг может отличаться на единицу, поэтому учитываем и соседние сдвиги:
+    scores = {(track_id, delta): count + votes[(track_id, delta - 1)] + votes[(track_id, delta + 1)]
+              for (track_id, delta), count in votes.items()}
+    (track_id, delta), count = max(scores.items(), key=lambda item: item[1])
+    if count < FINGERPRINT_MIN_MATCHES:
+        return None
+    return track_id
+
+
+def local_recognize(file, session=None):
+    """ Распознаёт аудиофайл по локальному индексу. Возвращает данные о треке в формате
+        recognize_song_handler, или None, если трек в индексе не найден.
+
+        File[str | bytes | AudioSegment] - путь к файлу, содержимое файла или уже декодированное аудио;
+        session - сессия БД вызывающего кода (если не указана, то создаётся собственная сессия). """
+    own_session = session is None
+    if own_session:
+        session = db_session.create_session()
+    try:
+        # Если индекс пуст, то даже не декодируем файл:
+        if not session.query(Fingerprint.id).first():
+            return None
+
+        track_id = match_hashes(session, fingerprint(decode_audio(file)))
+        if track_id is None:
+            return None
+
+        track = session.query(Track).get(track_id)
+        return track.track_key, track.shazam_id, track.artist_id, track.track, track.band, track.background
+    finally:
+        if own_session:
+            session.close()
+
+
+def store_hashes(session, track_id, hashes):
+    """ Записывает хеши в индекс для трека с ID [track_id] (не более FINGERPRINT_TRACK_LIMIT хешей на трек).
+        Возвращает количество добавленных хешей. """
+    indexed = session.query(Fingerprint).filter(Fingerprint.track_id == track_id).count()
+    limit = max(0, FINGERPRINT_TRACK_LIMIT - indexed)
+
+    # Если хешей больше, чем можно добавить, то берём их равномерно по времени (каждый k-й по позиции пика),
+    # чтобы по индексу распознавался любой фрагмент трека, а не только хеши с наименьшими значениями:
+    hashes = sorted(set(hashes), key=lambda item: (item[1], item[0]))
+    if len(hashes) > limit:
+        step = len(hashes) / limit if limit else 0
+        hashes = [hashes[int(i * step)] for i in range(limit)]
+
+    if hashes:
+        session.execute(insert(Fingerprint), [{'hash': h, 'track_id': track_id, 'offset': offset}
+                                              for h, offset in hashes])
+        session.commit()
+    return len(hashes)
+
+
+def index_track(session, track_id, file):
+    """ Добавляет отпечатки аудиофайла в индекс для трека с ID [track_id].
+        Возвращает количество добавленных хешей.
+
+        session - сессия БД;
+        file[str | bytes] - путь к файлу или содержимое файла. """
+    return store_hashes(session, track_id, fingerprint(decode_audio(file)))
+
+
+def index_if_popular(session, track_id, file):
+    """ Добавляет отпечатки файла в индекс, если трек входит в FINGERPRINT_TOP_TRACKS самых популярных
+        треков платформы, а этот фрагмент трека ещё не распознаётся по индексу.
+        Возвращает количество добавленных хешей.
+
+        session - сессия БД;
+        track_id[int] - ID трека в БД;
+        file[str | bytes | AudioSegment] - путь к файлу, содержимое файла или уже декодированный фрагмент
+        (например, фрагмент, по которому трек распознан, - тогда файл не декодируется повторно). """
+    track = session.query(Track).get(track_id)
+    if track is None:
+        return 0
+
+    # Место трека в топе по популярности:
+    more_popular = session.query(Track).filter(Track.popularity > track.popularity).count()
+    if more_popular >= FINGERPRINT_TOP_TRACKS:
+        return 0
+
+    # Если фрагмент уже распознаётся по индексу, то повторно его не добавляем:
+    hashes = fingerprint(decode_audio(file))
+    if match_hashes(session, hashes) == track_id:
+        return 0
+    return store_hashes(session, track_id, hashes)
+
+
+if __name__ == '__main__':
+    # Работа с индексом из командной строки (см. описание модуля):
+    db_session.global_init("db/PyJam.db")
+    db_session.migrate()
+    db_sess = db_session.create_session()
+
+    if sys.argv[1:2] == ['index'] and len(sys.argv) == 4:
+        print(f'Добавлено хешей: {index_track(db_sess, int(sys.argv[2]), sys.argv[3])}')
+    elif sys.argv[1:2] == ['match'] and len(sys.argv) == 3:
+        print(f'ID трека: {match_hashes(db_sess, fingerprint(decode_audio(sys.argv[2])))}')
+    else:
+        print('Использование: python -m data.audio_handlers.fingerprint index <track_id> <файл> | match <файл>')
@@ -2,56 +2,175 @@
 
     ВНИМАНИЕ: ДЛЯ РАБОТЫ ФУНКЦИИ НЕОБХОДИМО ИСПОЛЬЗОВАНИЕ FFMPEG.EXE ПОСЛЕДНЕЙ ВЕРСИИ.
     ДАННЫЙ ФАЙЛ ДОЛЖЕН ХРАНИТЬСЯ В РАБОЧЕЙ ДИРЕКТОРИИ ПРОЕКТА ИЛИ ИМЕТЬ ДОСТУП В PATH.
+
+    Перед распознаванием файл декодируется один раз и только до конца самого дальнего фрагмента
+    (см. RECOGNITION_WINDOW_OFFSETS). Из декодированного аудио вырезается фрагмент длиной RECOGNITION_WINDOW секунд,
+    который сводится в моно и передискретизируется до частоты распознавателя. Если трек по фрагменту не распознан,
+    то пробуются фрагменты с других позиций: сначала те, что целиком помещаются в файл (для коротких записей -
+    фрагмент с начала), затем неполные фрагменты в конце файла.
 """
-from shazamio import Shazam
+from data.audio_handlers.shazam_client import shazam_client
+from data.audio_handlers.fingerprint import local_recognize
+from data.system_files.circuit_breaker import CircuitOpenError
+from data.system_files.async_runtime import run
+from data.system_files.metrics import stage
+from data.ORM import db_session
+from pydub import AudioSegment
 from data.system_files.constants import *
-import asyncio
+import io
+
+
+async def recognize_song(file):
+    """ Данная функция распознает аудиофайл, а затем возвращает данные о распознанном треке.
+        File[str | bytes] - путь к файлу или содержимое файла. """
+    return await shazam_client().recognize(file)
+
+
+def decode_file(file):
+    """ Декодирует аудиофайл до конца самого дальнего фрагмента распознавания (остальная часть файла не нужна).
+        Возвращает декодированное аудио (AudioSegment).
+
+        File[str | bytes | file-like] - путь к файлу, содержимое файла или буфер с содержимым файла
+        (например, буфер загруженного файла, который может храниться на диске). """
+    source = io.BytesIO(file) if isinstance(file, (bytes, bytearray)) else file
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return AudioSegment.from_file(source, duration=max(RECOGNITION_WINDOW_OFFSETS) + RECOGNITION_WINDOW)
+
+
+def window_offsets(length, duration=RECOGNITION_WINDOW):
+    """ Возвращает позиции фрагментов (в секундах) в порядке, в котором они пробуются: сначала фрагменты,
+        которые целиком помещаются в аудио (в порядке RECOGNITION_WINDOW_OFFSETS), затем неполные фрагменты.
+        Фрагменты короче RECOGNITION_MIN_WINDOW пропускаются.
+
+        length[int] - длина декодированного аудио (в миллисекундах);
+        duration[int] - длина фрагмента (в секундах). """
+    full = [offset for offset in RECOGNITION_WINDOW_OFFSETS if (offset + duration) * 1000 <= length]
+    partial = [offset for offset in RECOGNITION_WINDOW_OFFSETS
+               if offset not in full and length - offset * 1000 >= RECOGNITION_MIN_WINDOW]
+    return full + partial
 
 
-# Специальное условие асинхронной функции для ОС Windows:
-asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+def load_window(audio, offset, duration=RECOGNITION_WINDOW):
+    """ Вырезает фрагмент из декодированного аудио, сводит его в моно и передискретизирует до частоты
+        распознавателя (RECOGNITION_SAMPLE_RATE). Возвращает фрагмент (AudioSegment).
 
+        audio[AudioSegment] - декодированное аудио (см. decode_file);
+        offset[int] - начало фрагмента (в секундах);
+        duration[int] - длина фрагмента (в секундах). """
+    window = audio[offset * 1000:(offset + duration) * 1000]
+    return window.set_channels(1).set_frame_rate(RECOGNITION_SAMPLE_RATE)
 
-async def recognize_song(file: str):
-    """ Данная функция распознает аудиофайл, а затем возвращает данные о распознанном треке. """
-    return await Shazam().recognize(file)
 
+def export_wav(audio):
+    """ Возвращает фрагмент (AudioSegment) в виде содержимого WAV-файла """
+    buffer = io.BytesIO()
+    audio.export(buffer, format='wav')
+    return buffer.getvalue()
 
-def recognize_song_handler(file, all_info=None):
+
+def parse_track(data):
+    """ Заворачивает ответ ShazamAPI в кортеж: (ключ трека, Shazam_id трека, Shazam_id исполнителя,
+        название песни, название исполнителя, ссылка на обложку). Если трек не распознан - KeyError. """
+    track_key = data['track']['key']  # Ключ трека
+    artist_id = data['track']['artists'][0]['adamid']  # Shazam_id исполнителя трека:
+    title = data['track']['title']  # Название песни
+    band = data['track']['subtitle']  # Название исполнителя
+    shazam_id = data['matches'][0]['id']  # ID песни в Shazam (Track_Shazam_ID)
+
+    # Ссылка на изображение обложки песни
+    if 'images' in data['track']:
+        background = data['track']['images']['background']
+    else:
+        background = UNKNOWN_SONG
+
+    return track_key, shazam_id, artist_id, title, band, background
+
+
+def recognize_song_handler(file, all_info=None, session=None):
     """ Данная функция-обработчик получает информацию о распознанном треке, а затем заворачивает данные
         в удобный и понятный массив и возвращает его.
 
-        File - имя файла;
-        all_info[bool] - необходимо ли вернуть полную информацию о треке. """
+        File - имя файла, содержимое файла (bytes) или буфер с содержимым файла;
+        all_info[bool] - необходимо ли вернуть полную информацию о треке;
+        session - сессия БД для поиска по локальному индексу отпечатков (если не указана, то создаётся на время
+        распознавания). """
+    return recognize_song_window(file, all_info, session)[0]
 
-    # Получаем данные:
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
 
+def recognize_song_window(file, all_info=None, session=None):
+    """ То же, что recognize_song_handler, но возвращает пару: (данные о треке, фрагмент). Фрагмент (AudioSegment) -
+        это уже декодированный фрагмент файла, по которому ShazamAPI распознал трек (по нему трек можно добавить
+        в локальный индекс отпечатков без повторного декодирования файла), или None, если трек распознан
+        по локальному индексу, по файлу целиком или не распознан. """
+    own_session = session is None
+    if own_session:
+        session = db_session.create_session()
     try:
-        data = loop.run_until_complete(recognize_song(file))  # Получение информации о распознанном файле
+        return _recognize_windows(file, all_info, session)
+    finally:
+        if own_session:
+            session.close()
+
+
+def _recognize_windows(file, all_info, session):
+    # Декодируем файл один раз, а затем пробуем распознать трек по нескольким его фрагментам:
+    try:
+        with stage('decode'):
+            audio = decode_file(file)
+    except Exception as e:
+        status_error = e
+        audio = None
+
+    upstream_error = None
+    for offset in window_offsets(len(audio)) if audio is not None else []:
+        with stage('decode'):
+            window = load_window(audio, offset)
 
-        # Если полная информация не нужна,
-        # то функция вернёт название трека и исполнителя, а также ссылку альбома трека:
+        # Сначала пытаемся распознать трек по локальному индексу отпечатков (без обращения к ShazamAPI):
         if all_info is None:
-            track_key = data['track']['key']  # Ключ трека
-            artist_id = data['track']['artists'][0]['adamid']  # Shazam_id исполнителя трека:
-            title = data['track']['title']  # Название песни
-            band = data['track']['subtitle']  # Название исполнителя
-            shazam_id = data['matches'][0]['id']  # ID песни в Shazam (Track_Shazam_ID)
+            try:
+                with stage('local_index'):
+                    track_data = local_recognize(window, session)
+                if track_data is not None:
+                    return track_data, None
+            except Exception as e:
+                status_error = e
 
-            # Ссылка на изображение обложки песни
-            if 'images' in data['track']:
-                background = data['track']['images']['background']
-            else:
-                background = UNKNOWN_SONG
+        # Если локально распознать трек не удалось, то обращаемся к ShazamAPI (в общем цикле событий).
+        # Если ShazamAPI сейчас недоступен, то проверяем по локальному индексу остальные фрагменты:
+        if upstream_error is not None:
+            continue
+        try:
+            with stage('shazam'):
+                data = run(recognize_song(export_wav(window)))
+        except CircuitOpenError as e:
+            upstream_error = e
+            continue
+        if data.get('matches'):
+            try:
+                # Если полная информация не нужна,
+                # то функция вернёт название трека и исполнителя, а также ссылку альбома трека:
+                return (data if all_info else parse_track(data)), window
+            except KeyError:
+                continue
 
-            # Возвращаем указанную информацию:
-            return track_key, shazam_id, artist_id, title, band, background
+    # Если файл не удалось декодировать (например, формат не поддерживается FFMPEG),
+    # то передаём ShazamAPI файл целиком:
+    if audio is None:
+        if hasattr(file, 'read'):
+            file.seek(0)
+            file = file.read()
+        with stage('shazam'):
+            data = run(recognize_song(file))  # Получение информации о распознанном файле
+        try:
+            return (data if all_info else parse_track(data)), None
+        except KeyError:
+            return None, None
 
-        # Возвращаем полную информацию:
-        return data
+    # Если ShazamAPI недоступен, а локально трек не найден - сообщаем об ошибке (а не о том, что трек не найден):
+    if upstream_error is not None:
+        raise upstream_error
 
     # Если распознать трек не удалось, то возвращаем None:
-    except KeyError:
-        return None
+    return None, None
@@ -0,0 +1,94 @@
+""" SHAZAM API -> Shazamio. Общий для всех обработчиков клиент Shazam.
+
+    Стандартный HTTP-клиент Shazamio открывает новую сессию (и новые соединения) на каждый запрос.
+    Клиент этого модуля отправляет запросы через постоянную HTTP-сессию общей асинхронной среды
+    (data/system_files/async_runtime.py), поэтому соединения с серверами Shazam переиспользуются.
+    Все корутины, работающие с клиентом, выполняются в общем цикле событий (async_runtime.run).
+
+    Каждый метод Shazamio (recognize, top_world_tracks, related_tracks, artist_about и т.д.) вызывается
+    с ограничением времени ожидания (SHAZAM_TIMEOUT / SHAZAM_TIMEOUTS) и через свой предохранитель
+    (data/system_files/circuit_breaker.py): при сбоях на стороне Shazam запросы сразу завершаются ошибкой
+    CircuitOpenError, и обработчики переходят к локальным данным.
+
+    Для замеров без доступа к Shazam клиент может записывать ответы ShazamAPI и отправлять запросы на локальную
+    замену ShazamAPI (см. shazam_standin.py, SHAZAM_RECORD_DIR и SHAZAM_STANDIN_URL). """
+from shazamio.interfaces.client import HTTPClientInterface
+from shazamio.exceptions import FailedDecodeJson, BadMethod
+from data.system_files.constants import SHAZAM_TIMEOUT, SHAZAM_TIMEOUTS, SHAZAM_STANDIN_URL, SHAZAM_RECORD_DIR
+from data.audio_handlers.shazam_standin import URL_HEADER, save_recording
+from data.system_files.async_runtime import http_session
+from data.system_files.circuit_breaker import breaker
+from functools import wraps
+from shazamio import Shazam
+import asyncio
+import aiohttp
+
+
+class PooledHTTPClient(HTTPClientInterface):
+    """ HTTP-клиент для Shazamio, работающий через постоянную HTTP-сессию """
+
+    async def request(self, method, url, *args, **kwargs):
+        session = await http_session()
+        if method.upper() not in ('GET', 'POST'):
+            raise BadMethod('Accept only GET/POST')
+
+        # Запрос на локальную замену ShazamAPI (исходная ссылка передаётся в заголовке):
+        target = url
+        if SHAZAM_STANDIN_URL:
+            target = SHAZAM_STANDIN_URL
+            kwargs['headers'] = {**(kwargs.get('headers') or {}), URL_HEADER: url}
+
+        async with session.request(method.upper(), target, *args, **kwargs) as response:
+            try:
+                body = await response.json(content_type=None)
+            except (aiohttp.ContentTypeError, ValueError):
+                raise FailedDecodeJson('Check args, failed decode json')
+
+        # Запись ответа ShazamAPI для последующего воспроизведения:
+        if SHAZAM_RECORD_DIR and not SHAZAM_STANDIN_URL:
+            save_recording(SHAZAM_RECORD_DIR, method, url, body)
+        return body
+
+
+class GuardedShazam:
+    """ Обёртка над клиентом Shazam: каждый метод вызывается через предохранитель и с ограничением времени """
+
+    def __init__(self, shazam):
+        self._shazam = shazam
+
+    def __getattr__(self, name):
+        method = getattr(self._shazam, name)
+        if not asyncio.iscoroutinefunction(method):
+            return method
+
+        circuit = breaker(f'shazam.{name}')
+        timeout = SHAZAM_TIMEOUTS.get(name, SHAZAM_TIMEOUT)
+
+        @wraps(method)
+        async def guarded(*args, **kwargs):
+            circuit.allow()
+            try:
+                result = await asyncio.wait_for(method(*args, **kwargs), timeout)
+            except asyncio.CancelledError:
+                # Отмена запроса вызывающим кодом - не сбой сервиса:
+                circuit.release()
+                raise
+            except Exception:  # в том числе asyncio.TimeoutError
+                circuit.record_failure()
+                raise
+            circuit.record_success()
+            return result
+
+        return guarded
+
+
+# Общий клиент Shazam (создаётся при первом обращении):
+__shazam = None
+
+
+def shazam_client():
+    """ Возвращает общий клиент Shazam """
+    global __shazam
+    if __shazam is None:
+        __shazam = GuardedShazam(Shazam(http_client=PooledHTTPClient()))
+    return __shazam
@@ -0,0 +1,130 @@
+""" Локальная замена ShazamAPI для нагрузочного тестирования и замеров без доступа к Shazam.
+
+    Запись: если задана переменная окружения PYJAM_SHAZAM_RECORD (папка), то общий клиент Shazam
+    (shazam_client.py) сохраняет каждый ответ ShazamAPI в эту папку (один JSON-файл на запрос).
+
+    Воспроизведение: замена запускается командой
+        python -m data.audio_handlers.shazam_standin --recordings records --port 8765 --latency 0.2 --error-rate 0.05
+    а приложение переключается на неё переменной окружения PYJAM_SHAZAM_STANDIN=http://127.0.0.1:8765.
+    Клиент отправляет запрос на замену, передавая исходную ссылку в заголовке X-Shazam-Url. Замена ищет запись
+    с тем же ключом (метод, адрес и параметры без меняющихся частей - UUID, времени и т.д.), а если такой записи
+    нет - любую запись того же вида (recognize, top_tracks, related_tracks, artist_about). К каждому ответу
+    добавляется задержка (--latency, --jitter), а часть запросов (--error-rate) завершается ошибкой 503. """
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import argparse
+import hashlib
+import asyncio
+import random
+import json
+import os
+import re
+
+
+# Заголовок, в котором клиент передаёт замене исходную ссылку на ShazamAPI:
+URL_HEADER = 'X-Shazam-Url'
+
+# Части ссылок, которые меняются от запроса к запросу:
+UUID_PATTERN = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+VOLATILE_PARAMS = {'timestamp', 'samplems', 'uuid'}
+
+
+def endpoint_kind(url):
+    """ Возвращает вид запроса к ShazamAPI по ссылке """
+    path = urlsplit(url).path
+    if '/tag/' in path:
+        return 'recognize'
+    if 'similarities' in path or 'related' in path:
+        return 'related_tracks'
+    if '/artists/' in path:
+        return 'artist_about'
+    # Хит-парады: последняя часть пути - ip-global-chart, ip-country-chart-RU, genre-country-chart-RU-pop и т.д.:
+    if '-chart' in path.rstrip('/').rsplit('/', 1)[-1]:
+        return 'top_tracks'
+    return 'other'
+
+
+def recording_key(method, url):
+    """ Ключ записи: метод и ссылка без меняющихся частей """
+    parts = urlsplit(url)
+    path = UUID_PATTERN.sub('-', parts.path)
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                             if k.lower() not in VOLATILE_PARAMS))
+    return f'{method.upper()} {parts.netloc}{path}?{query}'
+
+
+def save_recording(directory, method, url, body):
+    """ Сохраняет ответ ShazamAPI в папку directory """
+    key = recording_key(method, url)
+    kind = endpoint_kind(url)
+    os.makedirs(directory, exist_ok=True)
+
+    filename = f'{kind}-{hashlib.sha1(key.encode()).hexdigest()[:16]}.json'
+    with open(os.path.join(directory, filename), 'w', encoding='utf-8') as file:
+        json.dump({'key': key, 'kind': kind, 'method': method.upper(), 'url': url, 'body': body},
+                  file, ensure_ascii=False)
+
+
+def load_recordings(directory):
+    """ Загружает все записи из папки directory. Возвращает словари {ключ: ответ} и {вид: [ответы]} """
+    by_key, by_kind = dict(), dict()
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        with open(os.path.join(directory, filename), encoding='utf-8') as file:
+            record = json.load(file)
+        by_key[record['key']] = record['body']
+        by_kind.setdefault(record['kind'], []).append(record['body'])
+    return by_key, by_kind
+
+
+def create_app(directory, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+    """ Создаёт приложение Aiohttp, воспроизводящее записанные ответы ShazamAPI.
+
+        directory[str] - папка с записями;
+        latency[float] - задержка каждого ответа (в секундах);
+        jitter[float] - случайное отклонение задержки (в секундах);
+        error_rate[float] - доля запросов, которые завершаются ошибкой 503;
+        seed[int] - начальное значение генератора случайных чисел (для воспроизводимых замеров). """
+    from aiohttp import web
+
+    by_key, by_kind = load_recordings(directory)
+    rng = random.Random(seed)
+    counters = dict()  # вид запроса -> номер следующего ответа (ответы одного вида выдаются по кругу)
+
+    async def replay(request):
+        url = request.headers.get(URL_HEADER, '')
+        await asyncio.sleep(max(0.0, latency + rng.uniform(-jitter, jitter)))
+
+        if rng.random() < error_rate:
+            return web.Response(status=503, text='Service Unavailable (injected)')
+
+        body = by_key.get(recording_key(request.method, url))
+        if body is None:
+            kind = endpoint_kind(url)
+            bodies = by_kind.get(kind)
+            if not bodies:
+                return web.Response(status=404, text=f'No recordings for {kind}')
+            counters[kind] = counters.get(kind, -1) + 1
+            body = bodies[counters[kind] % len(bodies)]
+        return web.json_response(body)
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_route('*', '/{tail:.*}', replay)
+    return app
+
+
+if __name__ == '__main__':
+    from aiohttp import web
+
+    parser = argparse.ArgumentParser(description='Локальная замена ShazamAPI (воспроизведение записанных ответов)')
+    parser.add_argument('--recordings', required=True, help='папка с записанными ответами')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа (в секундах)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='случайное отклонение задержки (в секундах)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля запросов с ошибкой 503')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    web.run_app(create_app(args.recordings, args.latency, args.jitter, args.error_rate, args.seed),
+                host=args.host, port=args.port)
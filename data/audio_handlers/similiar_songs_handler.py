@@ -1,7 +1,8 @@
 """ SHAZAM API -> Shazamio. Получение информации о похожих на определённый трек песнях. """
+from data.audio_handlers.shazam_client import shazam_client
+from data.system_files.async_runtime import run
+from data.system_files.single_flight import coalesce
 from data.system_files.constants import *
-from shazamio import Shazam
-import asyncio
 
 
 async def similiar_songs(track_key):
@@ -10,11 +11,12 @@ async def similiar_songs(track_key):
         Track_key - специальный ключ трека, по которому можно получить данную информацию. """
 
     # Получение информации:
-    data = await Shazam().related_tracks(track_id=track_key)
+    data = await shazam_client().related_tracks(track_id=track_key)
 
     # Создаём список, в который будем записывать данные о треках, а затем отправим его на сервер:
+    # (если похожих песен нет, то ShazamAPI возвращает ответ без списка треков):
     related = list()
-    for i in data['tracks']:
+    for i in data.get('tracks', []):
         track_key = i['key']  # Ключ трека
 
         # ShazamID исполнителя трека:
@@ -41,8 +43,8 @@ async def similiar_songs(track_key):
     return related
 
 
-# Обработчик функции:
+# Обработчик функции (корутина выполняется в общем цикле событий,
+# одновременные запросы для одного трека объединяются в один):
+@coalesce
 def get_similiar_songs(track_key):
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    return loop.run_until_complete(similiar_songs(track_key))
+    return run(similiar_songs(track_key))
@@ -0,0 +1,147 @@
+""" Кэш информации об исполнителях в БД (таблица artist_info_cache).
+
+    Информация об исполнителе и список его лучших треков загружаются из ShazamAPI только тогда, когда
+    их ещё нет в кэше. Свежая информация (не старше ARTIST_CACHE_TTL секунд) берётся из БД, устаревшая -
+    тоже берётся из БД, но в фоне запускается её обновление. Если обновить информацию не удалось,
+    то продолжает отображаться последняя сохранённая информация.
+
+    Если исполнителя нет в Shazam, то в кэш записывается пустая запись (без названия исполнителя): повторные
+    запросы такого исполнителя не обращаются к ShazamAPI, пока запись не старше ARTIST_NEGATIVE_CACHE_TTL секунд. """
+from data.audio_handlers.about_artist_handler import get_artist_info, get_artists_info
+from concurrent.futures import ThreadPoolExecutor
+from data.system_files.constants import ARTIST_CACHE_TTL, ARTIST_NEGATIVE_CACHE_TTL
+from data.system_files.single_flight import coalesce
+from data.ORM.artist_info import ArtistInfo
+from data.ORM import db_session
+from sqlalchemy.exc import IntegrityError
+import threading
+import logging
+import time
+
+
+log = logging.getLogger(__name__)
+
+# Потоки для фонового обновления информации и ID исполнителей, которые обновляются в данный момент:
+__executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='artist-refresh')
+__refreshing = set()
+__lock = threading.Lock()
+
+
+def _to_result(entry):
+    """ Преобразует запись кэша в формат get_artist_info (None - исполнителя нет в Shazam) """
+    if entry.artist is None:
+        return None
+    return [entry.shazam_id, entry.artist, entry.genre, entry.background], list(entry.top_songs or [])
+
+
+def _expired(entry):
+    """ Проверяет, устарела ли запись кэша (запись об отсутствии исполнителя устаревает быстрее) """
+    ttl = ARTIST_CACHE_TTL if entry.artist is not None else ARTIST_NEGATIVE_CACHE_TTL
+    return time.time() - entry.updated > ttl
+
+
+def _store(session, artist_shazam_id, info):
+    """ Записывает результат get_artist_info в кэш и возвращает запись.
+        Если info - None (исполнителя нет в Shazam), то записывается пустая запись. """
+    (shazam_id, name, genre, background), top_songs = info if info is not None else ((None, None, None, None), [])
+
+    entry = session.query(ArtistInfo).get(artist_shazam_id)
+    if entry is None:
+        entry = ArtistInfo(shazam_id=artist_shazam_id)
+        session.add(entry)
+
+    entry.artist = name
+    entry.genre = genre
+    entry.background = background
+    entry.top_songs = [list(song) for song in top_songs]
+    entry.updated = time.time()
+    session.commit()
+    return entry
+
+
+@coalesce
+def _fill(artist_shazam_id):
+    """ Первая загрузка информации об исполнителе (с собственной сессией БД). Одновременные запросы
+        одного исполнителя объединяются, поэтому запись в кэш выполняется один раз. """
+    session = db_session.create_session()
+    try:
+        return _to_result(_store(session, artist_shazam_id, get_artist_info(artist_shazam_id)))
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _refresh(artist_shazam_id):
+    """ Фоновое обновление информации об исполнителе (с собственной сессией БД) """
+    session = db_session.create_session()
+    try:
+        info = get_artist_info(artist_shazam_id)
+
+        # Если исполнитель перестал находиться, то продолжает отображаться последняя сохранённая информация:
+        entry = session.query(ArtistInfo).get(artist_shazam_id)
+        if info is not None or entry is None or entry.artist is None:
+            _store(session, artist_shazam_id, info)
+    except Exception as e:
+        session.rollback()
+        log.warning(f'Не удалось обновить информацию об исполнителе {artist_shazam_id}: {e}')
+    finally:
+        session.close()
+        with __lock:
+            __refreshing.discard(artist_shazam_id)
+
+
+def _schedule_refresh(artist_shazam_id):
+    """ Запускает фоновое обновление информации об исполнителе (одно на исполнителя) """
+    with __lock:
+        if artist_shazam_id not in __refreshing:
+            __refreshing.add(artist_shazam_id)
+            __executor.submit(_refresh, artist_shazam_id)
+
+
+def cached_artist_info(session, artist_shazam_id):
+    """ Возвращает информацию об исполнителе в формате get_artist_info:
+        ([shazam_id, название, жанр, ссылка на изображение], [[shazam_id трека, название, исполнитель, обложка], ...]).
+        Если исполнителя нет ни в кэше, ни в Shazam - возвращает None.
+
+        session - сессия БД;
+        artist_shazam_id[int] - ID исполнителя в Shazam. """
+    entry = session.query(ArtistInfo).get(artist_shazam_id)
+
+    # Информации нет в кэше - загружаем её синхронно:
+    if entry is None:
+        return _fill(artist_shazam_id)
+
+    # Устаревшую информацию отдаём сразу, а обновляем в фоне:
+    if _expired(entry):
+        _schedule_refresh(artist_shazam_id)
+    return _to_result(entry)
+
+
+def cached_artists_info(session, artist_shazam_ids):
+    """ Возвращает информацию о нескольких исполнителях: {ID исполнителя: информация (см. cached_artist_info)}.
+        Исполнители, которых нет в кэше, загружаются из ShazamAPI параллельно, одной пачкой;
+        исполнители, которых не удалось загрузить, в словарь не попадают.
+
+        session - сессия БД;
+        artist_shazam_ids[list] - список ID исполнителей в Shazam. """
+    infos, cached = dict(), set()
+    for entry in session.query(ArtistInfo).filter(ArtistInfo.shazam_id.in_(artist_shazam_ids)):
+        if _expired(entry):
+            _schedule_refresh(entry.shazam_id)
+        cached.add(entry.shazam_id)
+        infos[entry.shazam_id] = _to_result(entry)
+
+    missing = [artist_shazam_id for artist_shazam_id in artist_shazam_ids if artist_shazam_id not in cached]
+    if missing:
+        for artist_shazam_id, info in get_artists_info(missing).items():
+            # Исполнителя мог одновременно записать в кэш другой запрос - тогда берём его запись:
+            try:
+                infos[artist_shazam_id] = _to_result(_store(session, artist_shazam_id, info))
+            except IntegrityError:
+                session.rollback()
+                infos[artist_shazam_id] = _to_result(session.query(ArtistInfo).get(artist_shazam_id))
+
+    # Исполнителей, которых нет в Shazam, в словарь не добавляем:
+    return {artist_shazam_id: info for artist_shazam_id, info in infos.items() if info is not None}
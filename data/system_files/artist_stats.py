@@ -0,0 +1,84 @@
+""" Статистика исполнителей на платформе: количество треков исполнителя и сумма их распознаний.
+
+    Таблица artist_stats обновляется в той же транзакции, в которой добавляются треки или изменяется их
+    популярность (см. data/ORM/artist_stats.py), поэтому списки и рейтинги исполнителей читаются одним запросом
+    по индексу, а не подсчитываются по всем трекам. Проверка таблицы (вывод расхождений с треками) и её пересборка:
+        python -m data.system_files.artist_stats
+        python -m data.system_files.artist_stats --rebuild """
+from data.ORM.migrations import build_artist_stats
+from data.ORM.artist_stats import ArtistStats
+from data.ORM.artist import Artist
+from data.ORM.track import Track
+from data.ORM import db_session
+from sqlalchemy import func
+import argparse
+
+
+def artist_stats(session, artist_shazam_id):
+    """ Возвращает количество треков исполнителя на платформе и сумму их распознаний """
+    stats = session.query(ArtistStats).get(artist_shazam_id)
+    if stats is None:
+        return 0, 0
+    return stats.tracks, stats.popularity
+
+
+def artists_with_stats(session):
+    """ Возвращает список всех исполнителей на платформе в виде [исполнитель, распознаний, треков],
+        отсортированный по количеству распознаний """
+    rows = session.query(Artist, ArtistStats.popularity, ArtistStats.tracks) \
+        .outerjoin(ArtistStats, ArtistStats.artist_id == Artist.shazam_id) \
+        .order_by(ArtistStats.popularity.desc()).all()
+    return [[artist, popularity or 0, tracks or 0] for artist, popularity, tracks in rows]
+
+
+def top_artists(session, limit=3):
+    """ Возвращает самых популярных исполнителей (по количеству треков на платформе, затем - по распознаниям)
+        в виде словаря {Shazam-ID исполнителя: [треков, распознаний]} в порядке убывания популярности """
+    rows = session.query(ArtistStats.artist_id, ArtistStats.tracks, ArtistStats.popularity) \
+        .filter(ArtistStats.artist_id != 0, ArtistStats.tracks > 0) \
+        .order_by(ArtistStats.tracks.desc(), ArtistStats.popularity.desc()).limit(limit).all()
+    return {artist_id: [tracks, popularity] for artist_id, tracks, popularity in rows}
+
+
+def check_artist_stats(session):
+    """ Сравнивает таблицу artist_stats с треками. Возвращает список расхождений:
+        [(Shazam-ID исполнителя, (треков, распознаний) в artist_stats, (треков, распознаний) по трекам)] """
+    actual = {artist_id: (tracks, popularity or 0) for artist_id, tracks, popularity in
+              session.query(Track.artist_id, func.count(Track.id), func.sum(Track.popularity))
+              .filter(Track.artist_id.isnot(None)).group_by(Track.artist_id)}
+    stored = {stats.artist_id: (stats.tracks, stats.popularity) for stats in session.query(ArtistStats)}
+
+    mismatches = []
+    for artist_id in sorted(actual.keys() | stored.keys()):
+        expected = actual.get(artist_id, (0, 0))
+        if stored.get(artist_id, (0, 0)) != expected:
+            mismatches.append((artist_id, stored.get(artist_id), expected))
+    return mismatches
+
+
+def rebuild_artist_stats(session):
+    """ Пересобирает таблицу artist_stats по трекам (одной транзакцией) """
+    build_artist_stats(session.connection())
+    session.commit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Проверка и пересборка статистики исполнителей')
+    parser.add_argument('--db', default='db/PyJam.db')
+    parser.add_argument('--rebuild', action='store_true', help='пересобрать таблицу artist_stats')
+    args = parser.parse_args()
+
+    db_session.global_init(args.db)
+    db_session.migrate()
+    session = db_session.create_session()
+    try:
+        mismatches = check_artist_stats(session)
+        for artist_id, stored, actual in mismatches:
+            print(f'Исполнитель {artist_id}: в artist_stats {stored}, по трекам {actual}')
+        print(f'Расхождений: {len(mismatches)}')
+
+        if args.rebuild:
+            rebuild_artist_stats(session)
+            print(f'Таблица artist_stats пересобрана, расхождений: {len(check_artist_stats(session))}')
+    finally:
+        session.close()
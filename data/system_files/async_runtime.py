@@ -0,0 +1,79 @@
+""" Общая для всего приложения асинхронная среда выполнения.
+
+    Цикл событий Asyncio работает в отдельном потоке на протяжении всей работы сервера, а синхронные
+    обработчики Flask передают в него корутины с помощью функции run(). В этом же цикле живёт постоянная
+    HTTP-сессия Aiohttp с пулом соединений, поэтому соединения (и TLS-рукопожатия) переиспользуются
+    между запросами, а не создаются заново для каждого обращения к ShazamAPI или загрузки изображения. """
+from data.system_files.constants import HTTP_POOL_LIMIT, HTTP_POOL_LIMIT_PER_HOST
+import concurrent.futures
+import threading
+import asyncio
+import aiohttp
+import atexit
+import sys
+
+
+class AsyncRuntime:
+    """ Цикл событий в отдельном потоке и постоянная HTTP-сессия """
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    def loop(self):
+        """ Возвращает цикл событий, при первом обращении запускает поток с ним """
+        with self._lock:
+            if self._loop is None:
+                # На ОС Windows библиотеке Aiohttp необходим SelectorEventLoop:
+                if sys.platform == 'win32':
+                    self._loop = asyncio.SelectorEventLoop()
+                else:
+                    self._loop = asyncio.new_event_loop()
+
+                self._thread = threading.Thread(target=self._loop.run_forever, name='async-runtime', daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def run(self, coro, timeout=None):
+        """ Выполняет корутину в общем цикле событий и возвращает её результат (синхронно).
+
+            coro - корутина;
+            timeout[float] - максимальное время ожидания результата (в секундах), None - без ограничения. """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop())
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    async def http_session(self):
+        """ Возвращает постоянную HTTP-сессию (вызывается только из корутин общего цикла событий) """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=HTTP_POOL_LIMIT, limit_per_host=HTTP_POOL_LIMIT_PER_HOST)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def close(self):
+        """ Закрывает HTTP-сессию и останавливает цикл событий """
+        if self._loop is None:
+            return
+        if self._session is not None and not self._session.closed:
+            self.run(self._session.close(), timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+# Общая для всего приложения среда выполнения:
+runtime = AsyncRuntime()
+atexit.register(runtime.close)
+
+
+def run(coro, timeout=None):
+    """ Выполняет корутину в общем цикле событий и возвращает её результат (см. AsyncRuntime.run) """
+    return runtime.run(coro, timeout)
+
+
+async def http_session():
+    """ Возвращает постоянную HTTP-сессию общего цикла событий """
+    return await runtime.http_session()
@@ -0,0 +1,123 @@
+""" Замер стоимости поиска по часто используемым столбцам до и после добавления индексов (миграция 1).
+
+    Копия базы данных (по умолчанию db/PyJam.db) при необходимости дополняется синтетическими пользователями,
+    треками, исполнителями и распознаваниями (--users, --tracks, --recognized), чтобы каталог был похож на
+    большой. Затем запросы, которые выполняются почти на каждой странице, замеряются без индексов и с индексами:
+        python -m data.system_files.benchmark_lookups --users 5000 --tracks 200000 --recognized 500000
+    Исходная база данных не изменяется. """
+from data.ORM.migrations import INDEXES, index_sql
+import argparse
+import tempfile
+import sqlite3
+import shutil
+import random
+import time
+import os
+
+
+# Замеряемые запросы: (название, SQL-запрос, вид параметров запроса - см. sample_parameters)
+QUERIES = [
+    ('tracks.shazam_id', 'SELECT * FROM tracks WHERE shazam_id = ? LIMIT 1', 'track_shazam_id'),
+    ('tracks.artist_id', 'SELECT * FROM tracks WHERE artist_id = ?', 'artist_shazam_id'),
+    ('artists.shazam_id', 'SELECT * FROM artists WHERE shazam_id = ? LIMIT 1', 'artist_shazam_id'),
+    ('recognized.user_id', 'SELECT * FROM recognized WHERE user_id = ?', 'user_id'),
+    ('recognized.track_id', 'SELECT * FROM recognized WHERE track_id = ?', 'track_id'),
+    ('recognized(user_id, track_id)', 'SELECT * FROM recognized WHERE user_id = ? AND track_id = ? LIMIT 1',
+     'user_track'),
+    ('users.email', 'SELECT * FROM users WHERE email = ? LIMIT 1', 'email'),
+]
+
+
+def populate(connection, users, tracks, recognized, rng):
+    """ Добавляет синтетических пользователей, треки, исполнителей и распознавания """
+    if users:
+        base = (connection.execute('SELECT MAX(id) FROM users').fetchone()[0] or 0) + 1
+        connection.executemany('INSERT INTO users (email, name, surname, "unique", unique_total) '
+                               'VALUES (?, ?, ?, \'\', 0)',
+                               ((f'benchmark{base + i}@pyjam.local', 'user', str(i)) for i in range(users)))
+
+    if tracks:
+        base = (connection.execute('SELECT MAX(shazam_id) FROM tracks').fetchone()[0] or 0) + 1
+        artists = max(1, tracks // 20)
+        connection.executemany('INSERT INTO artists (shazam_id, artist, genre, background) VALUES (?, ?, ?, ?)',
+                               ((base + i, f'artist {i}', 'Pop', '') for i in range(artists)))
+        connection.executemany('INSERT INTO tracks (shazam_id, track_key, artist_id, track, band, background, '
+                               'popularity) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               ((base + i, i, base + rng.randrange(artists), f'track {i}', '', '',
+                                 rng.randint(1, 50)) for i in range(tracks)))
+
+    if recognized:
+        max_track = connection.execute('SELECT MAX(id) FROM tracks').fetchone()[0]
+        user_ids = [row[0] for row in connection.execute('SELECT id FROM users')]
+        connection.executemany('INSERT INTO recognized (user_id, track_id, is_favourite) VALUES (?, ?, 0)',
+                               ((rng.choice(user_ids), rng.randint(1, max_track)) for _ in range(recognized)))
+    connection.commit()
+
+
+def sample_parameters(connection, rng, count):
+    """ Параметры запросов: случайные существующие значения столбцов """
+    tracks = connection.execute('SELECT id, shazam_id, artist_id FROM tracks').fetchall()
+    users = connection.execute('SELECT id, email FROM users').fetchall()
+
+    samples = {name: [] for name in ('track_shazam_id', 'artist_shazam_id', 'user_id', 'track_id',
+                                     'user_track', 'email')}
+    for _ in range(count):
+        track_id, shazam_id, artist_id = rng.choice(tracks)
+        user_id, email = rng.choice(users)
+        samples['track_shazam_id'].append((shazam_id,))
+        samples['artist_shazam_id'].append((artist_id,))
+        samples['user_id'].append((user_id,))
+        samples['track_id'].append((track_id,))
+        samples['user_track'].append((user_id, track_id))
+        samples['email'].append((email,))
+    return samples
+
+
+def measure(connection, samples):
+    """ Возвращает среднее время выполнения каждого запроса (в миллисекундах) и план запроса """
+    results = dict()
+    for name, sql, parameters in QUERIES:
+        plan = ' / '.join(row[-1] for row in connection.execute(f'EXPLAIN QUERY PLAN {sql}',
+                                                                samples[parameters][0]))
+        start = time.perf_counter()
+        for values in samples[parameters]:
+            connection.execute(sql, values).fetchall()
+        results[name] = ((time.perf_counter() - start) * 1000 / len(samples[parameters]), plan)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Замер поиска по столбцам до и после добавления индексов')
+    parser.add_argument('--db', default='db/PyJam.db', help='база данных (копируется, исходная не изменяется)')
+    parser.add_argument('--users', type=int, default=0, help='количество синтетических пользователей')
+    parser.add_argument('--tracks', type=int, default=0, help='количество синтетических треков')
+    parser.add_argument('--recognized', type=int, default=0, help='количество синтетических распознаваний')
+    parser.add_argument('--queries', type=int, default=500, help='количество запросов каждого вида')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.db')
+        shutil.copy(args.db, path)
+        connection = sqlite3.connect(path)
+
+        # Копия базы данных без индексов миграции 1:
+        for name, table, columns, unique in INDEXES:
+            connection.execute(f'DROP INDEX IF EXISTS {name}')
+        populate(connection, args.users, args.tracks, args.recognized, rng)
+        samples = sample_parameters(connection, rng, args.queries)
+        before = measure(connection, samples)
+
+        # Та же копия с индексами:
+        for name, table, columns, unique in INDEXES:
+            connection.execute(index_sql(name, table, columns, unique))
+        connection.execute('ANALYZE')
+        after = measure(connection, samples)
+        connection.close()
+
+    print(f'{"Запрос":32}{"без индексов, мс":>18}{"с индексами, мс":>18}{"ускорение":>12}')
+    for name, sql, parameters in QUERIES:
+        (slow, slow_plan), (fast, fast_plan) = before[name], after[name]
+        print(f'{name:32}{slow:18.4f}{fast:18.4f}{slow / fast if fast else 0:11.1f}x')
+        print(f'    {slow_plan}  ->  {fast_plan}')
@@ -0,0 +1,119 @@
+""" Замер времени подсчёта статистики главной страницы в зависимости от размера базы данных.
+
+    Для каждого размера (--sizes) создаётся временная база данных с синтетическими треками и распознаваниями
+    (по N строк), пользователями (N / 10) и исполнителями (N / 20). Затем замеряется среднее время platform_stats()
+    (счётчики и запросы по индексам) и, для баз данных не больше --legacy-max строк, прежнего подсчёта в Python (загрузка
+    всех пользователей, распознаваний и треков):
+        python -m data.system_files.benchmark_stats --sizes 1000 10000 100000 1000000 """
+from data.system_files.platform_stats import platform_stats
+from data.ORM.migrations import build_artist_stats, build_platform_counters, run_migrations
+from data.ORM.db_session import SqlAlchemyBase
+from data.ORM.recognized import Recognized
+from data.ORM.track import Track
+from data.ORM.user import User
+import sqlalchemy.orm as orm
+import sqlalchemy as sa
+import argparse
+import tempfile
+import sqlite3
+import random
+import time
+import os
+
+
+def create_database(path, rows, rng):
+    """ Создаёт базу данных с актуальной схемой и заполняет её синтетическими данными """
+    engine = sa.create_engine(f'sqlite:///{path}')
+    # noinspection PyUnresolvedReferences
+    from data.ORM import __all_models
+    SqlAlchemyBase.metadata.create_all(engine)
+    run_migrations(engine)
+    engine.dispose()
+
+    users, artists = max(10, rows // 10), max(1, rows // 20)
+    connection = sqlite3.connect(path)
+    connection.executemany('INSERT INTO users (email, name, surname, "unique", unique_total, background) '
+                           'VALUES (?, ?, ?, \'\', ?, \'\')',
+                           ((f'benchmark{i}@pyjam.local', 'user', str(i), rng.randint(0, 500)) for i in range(users)))
+    connection.executemany('INSERT INTO tracks (shazam_id, track_key, artist_id, track, band, background, '
+                           'popularity) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           ((i + 1, i, rng.randrange(artists) + 1, f'track {i}', '', '', rng.randint(1, 50))
+                            for i in range(rows)))
+    connection.executemany('INSERT INTO recognized (user_id, track_id, is_favourite) VALUES (?, ?, ?)',
+                           ((rng.randint(1, users), rng.randint(1, rows), rng.random() < 0.1)
+                            for _ in range(rows)))
+    connection.commit()
+    connection.close()
+
+    engine = sa.create_engine(f'sqlite:///{path}')
+    with engine.begin() as connection:
+        build_artist_stats(connection)
+        build_platform_counters(connection)
+        connection.exec_driver_sql('ANALYZE')
+    return engine
+
+
+def legacy_stats(session):
+    """ Прежний подсчёт статистики главной страницы: все строки загружаются и обрабатываются в Python """
+    users = list(sorted(session.query(User).all(), key=lambda us: us.unique_total, reverse=True))
+    big_library = session.query(Recognized).all()
+    tracks = list(sorted(session.query(Track).all(), key=lambda t: t.popularity, reverse=True))
+
+    active_users = []
+    for u in users:
+        if u.id > 1:
+            active_users.append([u, len(session.query(Recognized).filter(Recognized.user_id == u.id).all())])
+        if len(active_users) == 3:
+            break
+
+    best_artists_info = dict()
+    for track in tracks:
+        best_artists_info.setdefault(track.artist_id, [0, 0])
+        best_artists_info[track.artist_id][0] += 1
+        best_artists_info[track.artist_id][1] += track.popularity
+    return (len(users), len(big_library), len([rec for rec in big_library if rec.is_favourite == 1]),
+            sum([track.popularity for track in tracks]), len(tracks), len(best_artists_info), active_users,
+            tracks[:3], sorted(best_artists_info, key=lambda x: best_artists_info[x], reverse=True)[:3])
+
+
+def measure(engine, function, repeats):
+    """ Среднее время выполнения function(session) (в миллисекундах) и количество запросов к БД """
+    statements = []
+
+    def count(*args):
+        statements.append(1)
+
+    sa.event.listen(engine, 'before_cursor_execute', count)
+    factory = orm.sessionmaker(bind=engine)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        session = factory()
+        function(session)
+        session.close()
+    elapsed = (time.perf_counter() - start) * 1000 / repeats
+    sa.event.remove(engine, 'before_cursor_execute', count)
+    return elapsed, len(statements) // repeats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Замер подсчёта статистики главной страницы')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                        help='количество треков и распознаваний в базе данных')
+    parser.add_argument('--repeats', type=int, default=50, help='количество повторов замера')
+    parser.add_argument('--legacy-max', type=int, default=100000,
+                        help='наибольший размер базы данных, для которого замеряется прежний подсчёт')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f'{"Строк":>10}{"platform_stats, мс":>22}{"запросов":>10}{"прежний подсчёт, мс":>22}{"запросов":>10}')
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_database(os.path.join(directory, 'benchmark.db'), size, random.Random(args.seed))
+            fast, fast_queries = measure(engine, platform_stats, args.repeats)
+            if size <= args.legacy_max:
+                slow, slow_queries = measure(engine, legacy_stats, max(1, args.repeats // 10))
+                legacy = f'{slow:22.2f}{slow_queries:10}'
+            else:
+                legacy = f'{"-":>22}{"-":>10}'
+            engine.dispose()
+        print(f'{size:10}{fast:22.2f}{fast_queries:10}{legacy}')
@@ -0,0 +1,127 @@
+""" Планировщик предварительной загрузки хит-парадов.
+
+    Страны (country_list) и жанры (AVAILABLE_GENRES) задают фиксированный набор страниц с хит-парадами.
+    Раз в CHARTS_PREWARM_INTERVAL секунд планировщик загружает все хит-парады параллельно (не более
+    CHARTS_PREWARM_CONCURRENCY одновременных запросов и не более CHARTS_PREWARM_RATE запросов в секунду),
+    записывает их в кэш хит-парадов, добавляет треки в БД одной пачкой и загружает недостающие обложки.
+    Поэтому каждый посетитель страницы хит-парадов получает уже загруженные данные. """
+from data.system_files.constants import CHARTS_PREWARM_INTERVAL, CHARTS_PREWARM_CONCURRENCY, CHARTS_PREWARM_RATE, \
+    AVAILABLE_GENRES, country_list
+from data.system_files.track_storage import bulk_upsert_tracks, missing_covers
+from data.audio_handlers.charts_handler import fetch_charts, charts_cache
+from data.system_files.image_downloader import download_image_handler
+from data.system_files.async_runtime import run
+from data.ORM import db_session
+import threading
+import logging
+import asyncio
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """ Ограничитель частоты запросов для корутин: не более rate запросов в секунду """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self._next = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        delay = max(0.0, self._next - now)
+        self._next = max(now, self._next) + self.interval
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def chart_keys():
+    """ Возвращает все пары (страна, жанр), для которых существуют страницы хит-парадов """
+    keys = []
+    for country in country_list:
+        keys.append((country, None))
+        for genre in AVAILABLE_GENRES.get(country, []):
+            keys.append((country, genre))
+    return keys
+
+
+async def fetch_all_charts(keys, concurrency=CHARTS_PREWARM_CONCURRENCY, rate=CHARTS_PREWARM_RATE):
+    """ Параллельно загружает хит-парады для всех пар (страна, жанр).
+        Возвращает список пар (ключ, хит-парад); при ошибке вместо хит-парада - None. """
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate)
+
+    async def fetch(key):
+        async with semaphore:
+            await limiter.wait()
+            try:
+                return key, await fetch_charts(*key)
+            except Exception as e:
+                log.warning(f'Не удалось загрузить хит-парад {key}: {e}')
+                return key, None
+
+    return await asyncio.gather(*(fetch(key) for key in keys))
+
+
+def prewarm_charts():
+    """ Загружает все хит-парады, записывает их в кэш, а треки - в БД, и загружает недостающие обложки.
+        Возвращает количество успешно загруженных хит-парадов. """
+    results = run(fetch_all_charts(chart_keys()))
+
+    # Записываем хит-парады в кэш и собираем все треки (у которых есть shazam_id):
+    items = []
+    loaded = 0
+    for key, rating in results:
+        if rating is None:
+            continue
+        charts_cache.put(rating, *key)
+        items.extend(i for i in rating if 'shazam_id' in i)
+        loaded += 1
+
+    # Добавляем треки в БД одной пачкой и загружаем обложки (в том числе ранее не загруженные):
+    session = db_session.create_session()
+    try:
+        tracks, background_to_download = bulk_upsert_tracks(session, items)
+        session.commit()
+
+        downloading = {filename for filename, url in background_to_download}
+        background_to_download += [cover for cover in missing_covers(tracks, items) if cover[0] not in downloading]
+        if background_to_download:
+            run(download_image_handler(background_to_download, 'track'))
+    finally:
+        session.close()
+    return loaded
+
+
+class ChartsPrewarmer:
+    """ Фоновый поток, который раз в interval секунд выполняет prewarm_charts() """
+
+    def __init__(self, interval=CHARTS_PREWARM_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """ Запускает поток планировщика (повторные вызовы ничего не делают) """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='charts-prewarmer', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                loaded = prewarm_charts()
+                log.info(f'Загружено хит-парадов: {loaded}')
+            except Exception as e:
+                log.warning(f'Ошибка предварительной загрузки хит-парадов: {e}')
+            self._stop.wait(self.interval)
+
+
+# Общий для всего приложения планировщик:
+charts_prewarmer = ChartsPrewarmer()
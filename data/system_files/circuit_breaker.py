@@ -0,0 +1,112 @@
+""" Мини-модуль предохранителя (circuit breaker) для обращений к внешним сервисам.
+
+    Предохранитель считает долю ошибок среди последних CIRCUIT_WINDOW запросов. Если она достигает
+    CIRCUIT_FAILURE_RATE, то предохранитель размыкается (OPEN): в течение CIRCUIT_RESET_TIMEOUT секунд
+    запросы не отправляются, а сразу завершаются ошибкой CircuitOpenError, и обработчики переходят к
+    локальным данным, не дожидаясь истечения времени ожидания. Затем предохранитель пропускает один пробный
+    запрос (HALF_OPEN): при успехе он замыкается (CLOSED), при ошибке - снова размыкается. """
+from data.system_files.constants import CIRCUIT_WINDOW, CIRCUIT_MIN_CALLS, CIRCUIT_FAILURE_RATE, \
+    CIRCUIT_RESET_TIMEOUT
+from collections import deque
+import threading
+import logging
+import time
+
+
+log = logging.getLogger(__name__)
+
+# Состояния предохранителя:
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """ Предохранитель разомкнут: запрос к сервису не отправлялся """
+    pass
+
+
+class CircuitBreaker:
+    """ Предохранитель одного вида запросов.
+
+        name[str] - название (например, метод ShazamAPI);
+        window[int] - количество последних запросов, по которым считается доля ошибок;
+        min_calls[int] - минимальное количество запросов, начиная с которого предохранитель может разомкнуться;
+        failure_rate[float] - доля ошибок, при которой предохранитель размыкается;
+        reset_timeout[float] - время (в секундах), через которое разрешается пробный запрос. """
+
+    def __init__(self, name, window=CIRCUIT_WINDOW, min_calls=CIRCUIT_MIN_CALLS,
+                 failure_rate=CIRCUIT_FAILURE_RATE, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.rejected = 0  # количество запросов, отклонённых без обращения к сервису
+        self._results = deque(maxlen=window)  # True - успешный запрос, False - ошибка
+        self._opened = 0.0  # время размыкания
+        self._trial = False  # выполняется ли пробный запрос
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """ Проверяет, можно ли отправить запрос; если нельзя - вызывает CircuitOpenError """
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened >= self.reset_timeout:
+                self.state = HALF_OPEN
+
+            if self.state == CLOSED or (self.state == HALF_OPEN and not self._trial):
+                self._trial = self.state == HALF_OPEN
+                return
+
+            self.rejected += 1
+        raise CircuitOpenError(f'Сервис {self.name} временно недоступен')
+
+    def record_success(self):
+        with self._lock:
+            self._results.append(True)
+            if self.state == HALF_OPEN:
+                log.info(f'Предохранитель {self.name} замкнут')
+                self.state = CLOSED
+                self._trial = False
+                self._results.clear()
+
+    def record_failure(self):
+        with self._lock:
+            self._results.append(False)
+            if self.state == HALF_OPEN or (len(self._results) >= self.min_calls and
+                                           self._results.count(False) / len(self._results) >= self.failure_rate):
+                if self.state != OPEN:
+                    log.warning(f'Предохранитель {self.name} разомкнут')
+                self.state = OPEN
+                self._opened = time.monotonic()
+                self._trial = False
+
+    def release(self):
+        """ Запрос отменён без ответа сервиса: результат не учитывается, пробный запрос можно отправить снова """
+        with self._lock:
+            self._trial = False
+
+    def stats(self):
+        with self._lock:
+            calls = len(self._results)
+            return {'state': self.state, 'calls': calls, 'rejected': self.rejected,
+                    'error_rate': round(self._results.count(False) / calls, 4) if calls else 0.0}
+
+
+__breakers = dict()
+__lock = threading.Lock()
+
+
+def breaker(name):
+    """ Возвращает предохранитель name (создаёт его при первом обращении) """
+    with __lock:
+        if name not in __breakers:
+            __breakers[name] = CircuitBreaker(name)
+        return __breakers[name]
+
+
+def stats():
+    """ Возвращает состояние всех предохранителей: {название: {state, calls, rejected, error_rate}} """
+    with __lock:
+        breakers = list(__breakers.items())
+    return {name: circuit.stats() for name, circuit in sorted(breakers)}
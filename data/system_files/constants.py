@@ -1,6 +1,7 @@
 from datetime import datetime
 from random import choice
 import string
+import os
 
 
 # Количество треков, которые нужно отобразить в топе:
@@ -99,3 +100,113 @@ AVAILABLE_GENRES = {
 UNKNOWN_SONG = 'unknown_song.png'
 MAN_PROFILE_PICTURE = 'img/user_profile/man.png'
 WOMAN_PROFILE_PICTURE = 'img/user_profile/woman.png'
+
+# Фоновое распознавание: количество потоков-обработчиков, максимальное количество задач в очереди
+# и время хранения информации о завершённой задаче (в секундах):
+RECOGNITION_WORKERS = 4
+RECOGNITION_QUEUE_LIMIT = 64
+RECOGNITION_JOB_TTL = 600
+
+# Кэш распознаваний: максимальное количество записей и время жизни записи (в секундах):
+RECOGNITION_CACHE_SIZE = 5000
+RECOGNITION_CACHE_TTL = 30 * 24 * 60 * 60
+
+# Размер загруженного аудиофайла (в байтах), после которого буфер распознавания переносится из памяти на диск:
+RECOGNITION_SPOOL_SIZE = 4 * 1024 * 1024
+
+# Пакетное распознавание: максимальное количество файлов в одном запросе, количество одновременно
+# распознаваемых файлов и расширения аудиофайлов, которые извлекаются из ZIP-архивов:
+BATCH_RECOGNITION_LIMIT = 50
+BATCH_RECOGNITION_CONCURRENCY = 4
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.wav', '.ogg', '.flac')
+
+# Ограничения пакетного распознавания: суммарный размер всех аудиофайлов запроса (в байтах; файлы ZIP-архивов
+# проверяются по оглавлению до распаковки) и максимальная степень сжатия одного файла архива (защита от ZIP-бомб):
+BATCH_UNCOMPRESSED_LIMIT = 200 * 1024 * 1024
+BATCH_COMPRESSION_RATIO_LIMIT = 100
+
+# Локальный индекс отпечатков: частота дискретизации аудио для отпечатков, количество самых популярных треков,
+# которые попадают в индекс, минимальное количество совпавших хешей для распознавания и максимальное
+# количество хешей на один трек:
+FINGERPRINT_SAMPLE_RATE = 11025
+FINGERPRINT_TOP_TRACKS = 100
+FINGERPRINT_MIN_MATCHES = 20
+FINGERPRINT_TRACK_LIMIT = 50000
+
+# Предварительная обработка аудио перед распознаванием: длина фрагмента (в секундах), позиции начала фрагментов,
+# которые пробуются по очереди (в секундах; фрагменты, целиком помещающиеся в файл, пробуются раньше неполных),
+# минимальная длина фрагмента (в миллисекундах) и частота дискретизации, с которой работает распознаватель Shazam:
+RECOGNITION_WINDOW = 12
+RECOGNITION_WINDOW_OFFSETS = (30, 0, 60, 90)
+RECOGNITION_MIN_WINDOW = 3000
+RECOGNITION_SAMPLE_RATE = 16000
+
+# Пул HTTP-соединений общей асинхронной среды: максимальное количество соединений всего и с одним сервером:
+HTTP_POOL_LIMIT = 100
+HTTP_POOL_LIMIT_PER_HOST = 20
+
+# Метрики: границы интервалов гистограмм времени выполнения (в миллисекундах) и время выполнения
+# распознавания (в секундах), после которого запрос записывается в журнал медленных запросов:
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+SLOW_REQUEST_THRESHOLD = 5.0
+
+# Время (в секундах), в течение которого хит-парад считается свежим и берётся из кэша без обновления:
+CHARTS_CACHE_TTL = 3 * 60 * 60
+
+# Предварительная загрузка хит-парадов: интервал между загрузками всех хит-парадов (в секундах),
+# количество одновременных запросов к ShazamAPI и максимальное количество запросов в секунду:
+CHARTS_PREWARM_INTERVAL = 2 * 60 * 60
+CHARTS_PREWARM_CONCURRENCY = 4
+CHARTS_PREWARM_RATE = 2
+
+# Время (в секундах), в течение которого информация об исполнителе из кэша считается свежей, и то же время
+# для записи о том, что исполнитель в Shazam не найден (такая запись обновляется чаще):
+ARTIST_CACHE_TTL = 24 * 60 * 60
+ARTIST_NEGATIVE_CACHE_TTL = 10 * 60
+
+# Кэш похожих песен: время (в секундах), в течение которого список считается свежим, то же время для пустого
+# списка (у трека нет похожих песен в Shazam) и максимальное количество треков, для которых хранятся списки:
+RELATED_CACHE_TTL = 7 * 24 * 60 * 60
+RELATED_NEGATIVE_CACHE_TTL = 10 * 60
+RELATED_CACHE_SIZE = 2000
+
+# Предохранитель (circuit breaker) запросов к ShazamAPI: время ожидания ответа (в секундах) по умолчанию
+# и для отдельных методов Shazamio, количество последних запросов, по которым считается доля ошибок,
+# минимальное количество запросов для оценки, доля ошибок, при которой запросы временно прекращаются,
+# и время (в секундах), через которое разрешается пробный запрос:
+SHAZAM_TIMEOUT = 10
+SHAZAM_TIMEOUTS = {'recognize': 20}
+CIRCUIT_WINDOW = 20
+CIRCUIT_MIN_CALLS = 5
+CIRCUIT_FAILURE_RATE = 0.5
+CIRCUIT_RESET_TIMEOUT = 30
+
+# Локальная замена ShazamAPI (см. data/audio_handlers/shazam_standin.py). Если задан адрес замены
+# (переменная окружения PYJAM_SHAZAM_STANDIN, например http://127.0.0.1:8765), то все запросы Shazamio
+# отправляются на неё. Если задана папка записи (PYJAM_SHAZAM_RECORD), то ответы ShazamAPI сохраняются в неё
+# для последующего воспроизведения заменой:
+SHAZAM_STANDIN_URL = os.environ.get('PYJAM_SHAZAM_STANDIN')
+SHAZAM_RECORD_DIR = os.environ.get('PYJAM_SHAZAM_RECORD')
+
+# Пул соединений с базой данных: количество постоянных соединений и дополнительных соединений при нагрузке:
+DB_POOL_SIZE = 10
+DB_POOL_OVERFLOW = 20
+
+# Настройки SQLite, которые задаются каждому новому соединению с БД: журнал WAL (читатели не ждут писателей),
+# синхронизация с диском в режиме NORMAL, размер кэша страниц (в КБ, если значение отрицательное),
+# размер отображаемой в память части файла БД (в байтах) и время ожидания блокировки (в миллисекундах):
+SQLITE_PRAGMAS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -20000,
+                  'mmap_size': 256 * 1024 * 1024, 'busy_timeout': 5000, 'temp_store': 'MEMORY'}
+
+# Очередь записи в БД: максимальное количество записей в одной транзакции и время (в секундах),
+# в течение которого очередь ждёт следующие записи, прежде чем подтвердить транзакцию:
+WRITE_BATCH_SIZE = 50
+WRITE_BATCH_DELAY = 0.01
+
+# Время (в секундах), в течение которого снимок статистики главной страницы считается свежим
+# (снимок также сбрасывается при каждом изменении данных, из которых он состоит):
+PLATFORM_SNAPSHOT_MAX_AGE = 60
+
+# Топ пользователей: количество пользователей на странице по умолчанию и наибольшее количество на странице:
+LEADERBOARD_PAGE_SIZE = 50
+LEADERBOARD_MAX_PAGE_SIZE = 100
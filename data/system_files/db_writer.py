@@ -0,0 +1,109 @@
+""" Очередь записи в БД.
+
+    SQLite допускает только одного писателя одновременно, поэтому небольшие записи (отметка об использовании
+    записи кэша, избранность трека, запись распознанного трека и т.д.) не выполняются каждая в своей
+    транзакции, а передаются в очередь. Единственный поток-писатель собирает записи, пришедшие в течение
+    WRITE_BATCH_DELAY секунд (не более WRITE_BATCH_SIZE), и подтверждает их одной транзакцией.
+
+    Запись - это функция func(session, *args), которая изменяет объекты сессии и НЕ вызывает commit.
+    Функция должна возвращать простые данные (ID, списки и т.д.), а не объекты БД: после записи сессия
+    писателя закрывается. Если транзакция пачки завершилась ошибкой, то записи пачки выполняются
+    по одной, и ошибка передаётся только той записи, которая её вызвала. """
+from data.system_files.constants import WRITE_BATCH_SIZE, WRITE_BATCH_DELAY
+from data.system_files.metrics import observe
+from concurrent.futures import Future
+from data.ORM import db_session
+import threading
+import logging
+import queue
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+class DBWriter:
+    """ Поток-писатель, выполняющий записи из очереди пачками.
+
+        batch_size[int] - максимальное количество записей в одной транзакции;
+        batch_delay[float] - время (в секундах), в течение которого собираются записи пачки. """
+
+    def __init__(self, batch_size=WRITE_BATCH_SIZE, batch_delay=WRITE_BATCH_DELAY):
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """ Ставит запись в очередь и возвращает Future с результатом функции func """
+        self._start()
+        future = Future()
+        self._queue.put((func, args, kwargs, future))
+        return future
+
+    def write(self, func, *args, **kwargs):
+        """ Ставит запись в очередь, дожидается её подтверждения и возвращает результат функции func """
+        return self.submit(func, *args, **kwargs).result()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            # Ждём первую запись, а затем собираем остальные записи пачки:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_delay
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self._execute([item for item in batch if item[3].set_running_or_notify_cancel()])
+            except Exception as e:
+                log.exception(f'Ошибка очереди записи в БД: {e}')
+
+    def _execute(self, batch):
+        """ Выполняет пачку записей одной транзакцией """
+        if not batch:
+            return
+
+        start = time.perf_counter()
+        session = db_session.create_session()
+        try:
+            try:
+                results = [func(session, *args, **kwargs) for func, args, kwargs, future in batch]
+                session.commit()
+            except Exception:
+                session.rollback()
+                results = None
+
+            if results is not None:
+                for (func, args, kwargs, future), result in zip(batch, results):
+                    future.set_result(result)
+                return
+
+            # Транзакция пачки не удалась - выполняем записи по одной:
+            for func, args, kwargs, future in batch:
+                try:
+                    result = func(session, *args, **kwargs)
+                    session.commit()
+                    future.set_result(result)
+                except Exception as e:
+                    session.rollback()
+                    future.set_exception(e)
+        finally:
+            session.close()
+            observe('db_write_batch', time.perf_counter() - start)
+
+
+# Общий для всего приложения писатель:
+db_writer = DBWriter()
@@ -1,13 +1,13 @@
-""" Мини-модуль для асинхронной загрузки массива изображений. Применяется с помощью библиотек Asyncio и Aiohttp. """
+""" Мини-модуль для асинхронной загрузки массива изображений. Применяется с помощью библиотек Asyncio и Aiohttp.
+    Загрузка выполняется через постоянную HTTP-сессию общей асинхронной среды (async_runtime). """
+from data.system_files.async_runtime import http_session
 import asyncio
-import aiohttp
 
 
 # Загрузка файла из интернета:
 async def get_file(filename, url, destination, session):
-    response = await session.get(url, allow_redirects=True)
-    await write_file(filename, destination, response)
-    response.close()
+    async with session.get(url, allow_redirects=True) as response:
+        await write_file(filename, destination, response)
 
 
 # Сохранение полученного из интернета файла:
@@ -20,10 +20,9 @@ async def write_file(filename, destination, response):
 # Получение массива URL-ссылок для загрузки изображений в директорию [destination]:
 async def download_image_handler(background_to_download, destination):
     tasks = []
-    session = aiohttp.ClientSession()
+    session = await http_session()
     for background in background_to_download:
         filename, url = background
         task = asyncio.create_task(get_file(filename, url, destination, session))
         tasks.append(task)
     await asyncio.gather(*tasks)
-    await session.close()
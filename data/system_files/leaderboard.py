@@ -0,0 +1,55 @@
+""" Топ пользователей платформы по количеству распознанных уникальных треков.
+
+    Пользователи упорядочены по users.unique_total (по убыванию), а при равенстве - по ID (раньше
+    зарегистрированный пользователь выше). Администратор (ID 1) в топе не участвует. Порядок совпадает с индексом
+    ix_users_unique_total (unique_total DESC, id), поэтому место пользователя - это один COUNT пользователей
+    выше него по индексу, а страница топа - это чтение участка индекса (ORDER BY ... LIMIT/OFFSET). """
+from data.system_files.constants import LEADERBOARD_PAGE_SIZE, LEADERBOARD_MAX_PAGE_SIZE
+from data.system_files.platform_stats import platform_counters
+from data.ORM.platform_counter import USERS
+from data.ORM.user import User
+from sqlalchemy import func, select
+
+
+def user_rank(session, user_id):
+    """ Возвращает место пользователя в топе (начиная с 1), или 0, если пользователь не участвует в топе """
+    if user_id <= 1:
+        return 0
+    user = session.query(User.unique_total).filter(User.id == user_id).first()
+    if user is None:
+        return 0
+
+    # Пользователи выше: с большим количеством уникальных треков, или с таким же, но зарегистрированные раньше.
+    # Два COUNT по участкам индекса в одном запросе (условие с OR SQLite выполняет заметно медленнее):
+    unique_total = user.unique_total or 0
+    ahead = session.execute(select(
+        select(func.count()).select_from(User)
+        .where(User.unique_total > unique_total, User.id > 1).scalar_subquery() +
+        select(func.count()).select_from(User)
+        .where(User.unique_total == unique_total, User.id > 1, User.id < user_id).scalar_subquery())).scalar()
+    return ahead + 1
+
+
+def leaderboard_size(session):
+    """ Возвращает количество пользователей в топе (по счётчику пользователей платформы) """
+    admins = session.query(func.count(User.id)).filter(User.id <= 1).scalar()
+    return max(0, platform_counters(session)[USERS] - admins)
+
+
+def leaderboard_page(session, page=1, per_page=LEADERBOARD_PAGE_SIZE):
+    """ Возвращает страницу топа: словарь с номером страницы, размером страницы, количеством пользователей в топе
+        и списком пользователей (словари position, id, name, surname, background, total).
+
+        session - сессия БД;
+        page[int] - номер страницы (начиная с 1);
+        per_page[int] - количество пользователей на странице (не больше LEADERBOARD_MAX_PAGE_SIZE). """
+    page = max(1, page)
+    per_page = min(max(1, per_page), LEADERBOARD_MAX_PAGE_SIZE)
+    offset = (page - 1) * per_page
+
+    users = session.query(User.id, User.name, User.surname, User.background, User.unique_total) \
+        .filter(User.id > 1).order_by(User.unique_total.desc(), User.id).offset(offset).limit(per_page).all()
+    return {'page': page, 'per_page': per_page, 'total': leaderboard_size(session),
+            'users': [{'position': offset + index + 1, 'id': user_id, 'name': name, 'surname': surname,
+                       'background': background, 'total': unique_total or 0}
+                      for index, (user_id, name, surname, background, unique_total) in enumerate(users)]}
@@ -0,0 +1,129 @@
+""" Мини-модуль для замера времени выполнения этапов распознавания (загрузка файла, декодирование,
+    обращение к ShazamAPI, запись в БД, загрузка обложки и т.д.).
+
+    Время каждого этапа попадает в гистограмму этого этапа (см. snapshot), а этапы, выполненные внутри
+    trace(), дополнительно собираются в разбивку одного запроса: если запрос выполнялся дольше
+    SLOW_REQUEST_THRESHOLD секунд, то разбивка записывается в журнал медленных запросов.
+
+    Разбивка хранится в контекстной переменной (contextvars), поэтому этапы, выполненные в потоках пула,
+    попадают в разбивку запроса, если задача передана пулу в копии контекста:
+        executor.submit(contextvars.copy_context().run, func, *args) """
+from data.system_files.constants import LATENCY_BUCKETS, SLOW_REQUEST_THRESHOLD
+from contextlib import contextmanager
+import contextvars
+import threading
+import logging
+import time
+
+
+# Журнал медленных запросов:
+slow_log = logging.getLogger('pyjam.slow_requests')
+
+
+class Histogram:
+    """ Гистограмма времени выполнения этапа (в миллисекундах) """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последний интервал - всё, что больше последней границы
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """ Добавляет значение value (в миллисекундах) """
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p):
+        """ Оценка перцентиля p (0-100) по гистограмме: верхняя граница интервала """
+        if not self.count:
+            return 0.0
+
+        rank = self.count * p / 100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return float(self.buckets[i]) if i < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count,
+                'avg_ms': round(self.total / self.count, 2) if self.count else 0.0,
+                'max_ms': round(self.max, 2),
+                'p50_ms': self.percentile(50), 'p95_ms': self.percentile(95), 'p99_ms': self.percentile(99),
+                'buckets': {f'<={bound}': count for bound, count in zip(self.buckets, self.counts)} |
+                           {'inf': self.counts[-1]}}
+
+
+__histograms = dict()
+__lock = threading.Lock()
+
+# Разбивка текущего запроса по этапам: {этап: время в секундах} (None - вне trace()):
+__breakdown = contextvars.ContextVar('breakdown', default=None)
+
+
+def observe(name, seconds):
+    """ Записывает время выполнения этапа name (в секундах) в гистограмму и в разбивку текущего запроса """
+    with __lock:
+        if name not in __histograms:
+            __histograms[name] = Histogram()
+        __histograms[name].observe(seconds * 1000)
+
+        # Разбивку одного запроса могут дополнять несколько потоков пула одновременно:
+        breakdown = __breakdown.get()
+        if breakdown is not None:
+            breakdown[name] = breakdown.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name):
+    """ Замер времени выполнения этапа name:
+            with stage('shazam'):
+                ... """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+@contextmanager
+def trace(name, threshold=SLOW_REQUEST_THRESHOLD):
+    """ Собирает разбивку по этапам для одного запроса name (в пределах текущего контекста, см. описание модуля).
+        Общее время запроса записывается в гистограмму name, а медленный запрос - в журнал. """
+    token = __breakdown.set(dict())
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with __lock:
+            breakdown = dict(__breakdown.get())
+        __breakdown.reset(token)
+        observe(name, elapsed)
+
+        if elapsed > threshold:
+            stages = ', '.join(f'{stage_name}={seconds * 1000:.0f}ms' for stage_name, seconds in breakdown.items())
+            slow_log.warning(f'Медленный запрос {name}: {elapsed * 1000:.0f}ms ({stages})')
+
+
+def snapshot():
+    """ Возвращает статистику по всем этапам: {этап: {count, avg_ms, max_ms, p50_ms, ...}} """
+    with __lock:
+        return {name: histogram.to_dict() for name, histogram in sorted(__histograms.items())}
+
+
+def reset():
+    """ Очищает все гистограммы """
+    with __lock:
+        __histograms.clear()
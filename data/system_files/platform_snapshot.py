@@ -0,0 +1,69 @@
+""" Кэш снимка статистики главной страницы.
+
+    Статистика платформы и топы (см. platform_stats.py) одинаковы для всех посетителей, поэтому главная страница
+    берёт их из снимка, а не запрашивает у БД. Снимок собирается заново, если он старше PLATFORM_SNAPSHOT_MAX_AGE
+    секунд или если после его сборки изменились данные, из которых он состоит: обработчики записи (распознавание,
+    избранные треки, удаление трека из библиотеки, регистрация, изменение профиля и изображения, сброс оформления
+    администратором и удаление пользователя) вызывают invalidate().
+    Одновременные запросы устаревшего снимка объединяются: снимок собирает только первый из них. """
+from data.system_files.constants import PLATFORM_SNAPSHOT_MAX_AGE
+from data.system_files.single_flight import SingleFlight
+import threading
+import time
+
+
+class SnapshotCache:
+    """ Кэш одного значения (снимка) с ограниченным временем жизни и сбросом при изменении данных.
+
+        max_age[int] - время (в секундах), в течение которого снимок считается свежим. """
+
+    def __init__(self, max_age=PLATFORM_SNAPSHOT_MAX_AGE):
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._snapshot = None  # (снимок, версия данных, время сборки)
+        self._version = 0  # версия данных: увеличивается при каждом изменении
+        self._flight = SingleFlight('platform_snapshot')
+        self._lock = threading.Lock()
+
+    def get(self, builder):
+        """ Возвращает свежий снимок. Если снимка нет, он устарел или данные изменились,
+            то собирает новый снимок функцией builder (без аргументов) """
+        with self._lock:
+            if self._fresh():
+                self.hits += 1
+                return self._snapshot[0]
+            self.misses += 1
+        return self._flight.do('snapshot', self._build, builder)
+
+    def invalidate(self):
+        """ Сбрасывает снимок: вызывается после подтверждения изменений данных, из которых он состоит """
+        with self._lock:
+            self._version += 1
+
+    def stats(self):
+        """ Возвращает счётчики попаданий и промахов кэша и возраст снимка """
+        with self._lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0,
+                    'age': time.monotonic() - self._snapshot[2] if self._snapshot else None}
+
+    def _fresh(self):
+        return self._snapshot is not None and self._snapshot[1] == self._version and \
+            time.monotonic() - self._snapshot[2] < self.max_age
+
+    def _build(self, builder):
+        # Снимок, собранный во время изменения данных, помечается прежней версией и будет собран заново:
+        with self._lock:
+            if self._fresh():
+                return self._snapshot[0]
+            version = self._version
+
+        snapshot = builder()
+        with self._lock:
+            self._snapshot = (snapshot, version, time.monotonic())
+        return snapshot
+
+
+# Общий для всего приложения снимок статистики главной страницы:
+platform_snapshot = SnapshotCache()
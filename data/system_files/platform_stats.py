@@ -0,0 +1,107 @@
+""" Статистика платформы для главной страницы.
+
+    Числа статистики хранятся в таблице platform_counters, а топы читаются запросами ORDER BY ... LIMIT
+    по индексам (см. миграции 3-5). Поэтому статистика собирается за фиксированное количество запросов к БД,
+    независимо от количества пользователей, треков и распознаваний:
+        1. счётчики платформы;
+        2. три самых активных пользователя;
+        3. количество треков в библиотеках самых активных пользователей (GROUP BY);
+        4. три самых популярных трека;
+        5. три самых популярных исполнителя (из таблицы artist_stats).
+    Проверка счётчиков (вывод расхождений с таблицами) и их пересборка:
+        python -m data.system_files.platform_stats
+        python -m data.system_files.platform_stats --rebuild """
+from data.ORM.migrations import build_artist_stats, build_platform_counters
+from data.system_files.artist_stats import top_artists
+from data.ORM.platform_counter import PlatformCounter, USERS, LIBRARY, FAVOURITES, TRACKS, POPULARITY, ARTISTS
+from data.ORM.recognized import Recognized
+from data.ORM.track import Track
+from data.ORM.user import User
+from data.ORM import db_session
+from sqlalchemy import func
+import argparse
+
+
+def platform_counters(session):
+    """ Возвращает все счётчики платформы: {название счётчика: значение} """
+    counters = dict.fromkeys((USERS, LIBRARY, FAVOURITES, TRACKS, POPULARITY, ARTISTS), 0)
+    counters.update(session.query(PlatformCounter.name, PlatformCounter.value).all())
+    return counters
+
+
+def platform_stats(session, top=3):
+    """ Возвращает словарь со статистикой платформы:
+        all_users[int] - количество зарегистрированных пользователей;
+        in_library_tracks[int] - количество треков в библиотеках пользователей;
+        in_feature_tracks[int] - количество избранных треков в библиотеках пользователей;
+        recognized_total[int] - сколько раз распознаны треки платформы;
+        track_on_platform[int] - количество треков на платформе;
+        artist_on_platform[int] - количество исполнителей на платформе;
+        active_users[list] - самые активные пользователи (словари id, name, surname, background, total, in_library);
+        most_popular_tracks[list] - самые популярные треки (объекты Track);
+        best_artists_info[dict] - самые популярные исполнители {Shazam-ID: [треков на платформе, распознаний]}.
+
+        session - сессия БД;
+        top[int] - количество позиций в топах. """
+    counters = platform_counters(session)
+    stats = {'all_users': counters[USERS], 'in_library_tracks': counters[LIBRARY],
+             'in_feature_tracks': counters[FAVOURITES], 'recognized_total': counters[POPULARITY],
+             'track_on_platform': counters[TRACKS], 'artist_on_platform': counters[ARTISTS]}
+
+    # Самые активные пользователи (кроме администратора с ID 1) и количество треков в их библиотеках:
+    users = session.query(User).filter(User.id > 1) \
+        .order_by(User.unique_total.desc(), User.id).limit(top).all()
+    in_library = dict()
+    if users:
+        in_library = dict(session.query(Recognized.user_id, func.count(Recognized.id))
+                          .filter(Recognized.user_id.in_([u.id for u in users])).group_by(Recognized.user_id).all())
+    stats['active_users'] = [{'id': u.id, 'name': u.name, 'surname': u.surname, 'background': u.background,
+                              'total': u.unique_total, 'in_library': in_library.get(u.id, 0)} for u in users]
+
+    # Самые популярные треки и исполнители:
+    stats['most_popular_tracks'] = session.query(Track).order_by(Track.popularity.desc(), Track.id).limit(top).all()
+    stats['best_artists_info'] = top_artists(session, top)
+    return stats
+
+
+def check_platform_counters(session):
+    """ Сравнивает счётчики платформы с таблицами. Возвращает список расхождений:
+        [(название счётчика, значение счётчика, значение по таблицам)] """
+    actual = {USERS: session.query(func.count(User.id)).scalar(),
+              LIBRARY: session.query(func.count(Recognized.id)).scalar(),
+              FAVOURITES: session.query(func.count(Recognized.id)).filter(Recognized.is_favourite == 1).scalar(),
+              TRACKS: session.query(func.count(Track.id)).filter(Track.artist_id.isnot(None)).scalar(),
+              POPULARITY: session.query(func.coalesce(func.sum(Track.popularity), 0))
+              .filter(Track.artist_id.isnot(None)).scalar(),
+              ARTISTS: session.query(func.count(func.distinct(Track.artist_id))).scalar()}
+    counters = platform_counters(session)
+    return [(name, counters[name], value) for name, value in actual.items() if counters[name] != value]
+
+
+def rebuild_platform_counters(session):
+    """ Пересобирает статистику исполнителей и счётчики платформы по таблицам (одной транзакцией) """
+    build_artist_stats(session.connection())
+    build_platform_counters(session.connection())
+    session.commit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Проверка и пересборка счётчиков платформы')
+    parser.add_argument('--db', default='db/PyJam.db')
+    parser.add_argument('--rebuild', action='store_true', help='пересобрать таблицу platform_counters')
+    args = parser.parse_args()
+
+    db_session.global_init(args.db)
+    db_session.migrate()
+    session = db_session.create_session()
+    try:
+        mismatches = check_platform_counters(session)
+        for name, stored, actual in mismatches:
+            print(f'Счётчик {name}: в platform_counters {stored}, по таблицам {actual}')
+        print(f'Расхождений: {len(mismatches)}')
+
+        if args.rebuild:
+            rebuild_platform_counters(session)
+            print(f'Таблица platform_counters пересобрана, расхождений: {len(check_platform_counters(session))}')
+    finally:
+        session.close()
@@ -0,0 +1,106 @@
+""" Кэш распознаваний. Пользователи часто загружают один и тот же файл (рингтон, популярный MP3) много раз,
+    поэтому результат распознавания сохраняется в БД по хешу содержимого файла. При повторной загрузке
+    такого же файла обращение к ShazamAPI не выполняется.
+
+    Чтение кэша ничего не записывает в сессию вызывающего кода: отметка о последнем использовании записи
+    и удаление устаревшей записи выполняются очередью записи в БД (db_writer). """
+from data.system_files.constants import RECOGNITION_CACHE_SIZE, RECOGNITION_CACHE_TTL
+from data.system_files.db_writer import db_writer
+from data.ORM.cached_recognition import CachedRecognition
+import threading
+import time
+
+
+class RecognitionCache:
+    """ Кэш результатов распознавания с ограничением по количеству записей и времени их жизни.
+
+        size[int] - максимальное количество записей в кэше (при переполнении удаляются самые давно
+                    использованные записи);
+        ttl[int] - время жизни записи (в секундах). """
+
+    def __init__(self, size=RECOGNITION_CACHE_SIZE, ttl=RECOGNITION_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0  # количество попаданий в кэш
+        self.misses = 0  # количество промахов
+        self._lock = threading.Lock()
+
+    def get(self, session, digest):
+        """ Возвращает данные о треке в формате recognize_song_handler, или None, если файла нет в кэше.
+
+            session - сессия БД;
+            digest[str] - хеш содержимого файла. """
+        entry = session.query(CachedRecognition).get(digest)
+        now = time.time()
+
+        # Устаревшую запись удаляем и считаем промахом:
+        if entry is not None and now - entry.created > self.ttl:
+            db_writer.submit(_expire, digest, now - self.ttl)
+            entry = None
+
+        if entry is None:
+            self._count(hit=False)
+            return None
+
+        db_writer.submit(_touch, digest, now)
+        self._count(hit=True)
+        return entry.track_key, entry.shazam_id, entry.artist_id, entry.track, entry.band, entry.background
+
+    def put(self, session, digest, track_data):
+        """ Сохраняет результат распознавания в кэш и удаляет лишние записи. Изменения НЕ подтверждаются
+            (commit выполняет вызывающая функция или очередь записи: db_writer.submit(recognition_cache.put, ...)).
+
+            session - сессия БД;
+            digest[str] - хеш содержимого файла;
+            track_data[tuple] - данные, которые вернул recognize_song_handler. """
+        track_key, shazam_id, artist_id, title, band, background = track_data
+        now = time.time()
+
+        entry = CachedRecognition(file_hash=digest, track_key=track_key, shazam_id=shazam_id,
+                                  artist_id=artist_id, track=title, band=band, background=background,
+                                  created=now, last_used=now)
+        session.merge(entry)
+        session.flush()
+        self._evict(session, now)
+
+    def stats(self):
+        """ Возвращает счётчики попаданий и промахов кэша """
+        with self._lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / total if total else 0.0}
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _evict(self, session, now):
+        """ Удаляет устаревшие записи, а также самые давно использованные записи сверх лимита size """
+        session.query(CachedRecognition).filter(CachedRecognition.created < now - self.ttl).delete()
+
+        overflow = session.query(CachedRecognition).count() - self.size
+        if overflow > 0:
+            oldest = session.query(CachedRecognition.file_hash).order_by(
+                CachedRecognition.last_used).limit(overflow).subquery()
+            session.query(CachedRecognition).filter(
+                CachedRecognition.file_hash.in_(oldest.select())).delete(synchronize_session=False)
+
+
+def _touch(session, digest, now):
+    """ Запись для очереди записи в БД: отметка о последнем использовании записи кэша """
+    session.query(CachedRecognition).filter(CachedRecognition.file_hash == digest).update(
+        {CachedRecognition.last_used: now}, synchronize_session=False)
+
+
+def _expire(session, digest, created_before):
+    """ Запись для очереди записи в БД: удаление устаревшей записи кэша """
+    session.query(CachedRecognition).filter(CachedRecognition.file_hash == digest,
+                                            CachedRecognition.created < created_before).delete(
+        synchronize_session=False)
+
+
+# Общий для всего приложения кэш распознаваний:
+recognition_cache = RecognitionCache()
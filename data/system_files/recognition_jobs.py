@@ -0,0 +1,85 @@
+""" Мини-модуль для фонового распознавания треков. Запрос на распознавание ставится в очередь и сразу получает
+    идентификатор задачи, а ограниченный пул потоков-обработчиков выполняет обращения к ShazamAPI и запись
+    результатов в БД. Веб-обработчики при этом не ждут ответа Shazam и остаются свободными. """
+from data.system_files.constants import RECOGNITION_WORKERS, RECOGNITION_QUEUE_LIMIT, RECOGNITION_JOB_TTL
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import uuid
+
+
+# Статусы задачи распознавания:
+PENDING = 'pending'  # задача ожидает свободного обработчика
+RUNNING = 'running'  # задача выполняется
+DONE = 'done'  # задача успешно завершена
+FAILED = 'failed'  # во время выполнения задачи произошла ошибка
+
+
+class QueueOverflowError(Exception):
+    """ Ошибка: очередь задач переполнена, новую задачу поставить нельзя """
+    pass
+
+
+class RecognitionJobQueue:
+    """ Очередь задач распознавания с пулом потоков-обработчиков.
+
+        workers[int] - количество потоков, одновременно выполняющих задачи;
+        limit[int] - максимальное количество невыполненных задач в очереди;
+        ttl[int] - время (в секундах), в течение которого хранится информация о завершённой задаче. """
+
+    def __init__(self, workers=RECOGNITION_WORKERS, limit=RECOGNITION_QUEUE_LIMIT, ttl=RECOGNITION_JOB_TTL):
+        self.limit = limit
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recognition')
+        self._jobs = dict()
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args):
+        """ Ставит функцию func(*args) в очередь и возвращает идентификатор задачи.
+            Если очередь переполнена - вызывает ошибку QueueOverflowError. """
+        with self._lock:
+            self._remove_expired()
+
+            unfinished = len([job for job in self._jobs.values() if job['status'] in (PENDING, RUNNING)])
+            if unfinished >= self.limit:
+                raise QueueOverflowError('Очередь распознавания переполнена')
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {'id': job_id, 'status': PENDING, 'result': None, 'error': None,
+                                  'created': time.time(), 'finished': None}
+
+        self._executor.submit(self._run, job_id, func, args)
+        return job_id
+
+    def status(self, job_id):
+        """ Возвращает копию информации о задаче, или None, если такой задачи нет """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _run(self, job_id, func, args):
+        """ Выполнение задачи в потоке-обработчике """
+        self._update(job_id, status=RUNNING)
+        try:
+            result = func(*args)
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=str(e), finished=time.time())
+        else:
+            self._update(job_id, status=DONE, result=result, finished=time.time())
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def _remove_expired(self):
+        """ Удаляет информацию о задачах, завершённых более ttl секунд назад """
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['finished'] is not None and now - job['finished'] > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+# Общая для всего приложения очередь распознавания:
+recognition_queue = RecognitionJobQueue()
@@ -0,0 +1,377 @@
+""" Обработка распознанного трека: запись трека в БД и добавление его в библиотеку пользователя.
+    Функции модуля выполняются в потоках-обработчиках очереди распознавания (recognition_jobs),
+    поэтому каждая задача работает с собственной сессией БД, а небольшие записи (распознанный трек,
+    результат в кэше распознаваний) передаются в общую очередь записи в БД (db_writer).
+
+    Загруженные файлы не сохраняются в папку static: содержимое файла читается в буфер в памяти
+    (на диск буфер переносится, только если файл больше RECOGNITION_SPOOL_SIZE) и передаётся распознавателю. """
+from data.system_files.constants import RECOGNITION_SPOOL_SIZE, BATCH_RECOGNITION_CONCURRENCY, \
+    BATCH_RECOGNITION_LIMIT, BATCH_UNCOMPRESSED_LIMIT, BATCH_COMPRESSION_RATIO_LIMIT, AUDIO_EXTENSIONS
+from data.audio_handlers.recognize_handler import recognize_song_handler, recognize_song_window
+from data.audio_handlers.fingerprint import index_if_popular
+from data.system_files.image_downloader import download_image_handler
+from data.system_files.async_runtime import run as run_coroutine
+from data.system_files.recognition_cache import recognition_cache
+from data.system_files.platform_snapshot import platform_snapshot
+from data.system_files.db_writer import db_writer
+from data.system_files.track_storage import get_or_create_track
+from data.system_files.metrics import stage, trace, observe
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from data.ORM.user_unique_track import UserUniqueTrack
+from data.ORM.recognized import Recognized
+from data.ORM.user import User
+from data.ORM import db_session
+from sqlalchemy import func
+import contextvars
+import zipfile
+import time
+import hashlib
+
+# Размер блока (в байтах) при потоковом чтении загруженного файла:
+CHUNK_SIZE = 64 * 1024
+
+
+def upsert_recognized_track(session, track_data, user_id=None, background_to_download=None):
+    """ Записывает распознанный трек в БД (или увеличивает количество его распознаний), а затем, если
+        пользователь авторизован, добавляет трек в его библиотеку. Изменения НЕ подтверждаются (commit
+        выполняет вызывающая функция), поэтому несколько треков можно записать одной транзакцией.
+        Возвращает объект трека.
+
+        session - сессия БД;
+        track_data[tuple] - данные, которые возвращает recognize_song_handler;
+        user_id[int] - ID пользователя, распознавшего трек (None - пользователь не авторизован);
+        background_to_download[list] - список, в который добавляется обложка трека для загрузки. """
+    track_key, shazam_id, artist_id, track_title, band, background = track_data
+
+    # Записываем информацию о треке, если его ещё нет в БД (если тот же трек одновременно записывает
+    # другой запрос, то берётся его запись, см. get_or_create_track), а иначе - увеличиваем количество
+    # его распознаний:
+    track, created, covers = get_or_create_track(session, {'shazam_id': shazam_id, 'track_key': track_key,
+                                                           'artist_id': artist_id, 'track': track_title,
+                                                           'band': band, 'background': background})
+    if created:
+        if background_to_download is not None:
+            background_to_download.extend(covers)
+    else:
+        track.popularity += 1
+
+    # Если пользователь авторизован, то записываем информацию о распознанном треке в его библиотеку:
+    if user_id is not None:
+
+        # Но если данный трек уже распознан, то перезаписываем информацию о нём:
+        already_recognized = session.query(Recognized).filter(
+            Recognized.track_id == track.id, Recognized.user_id == user_id).first()
+
+        # Если трек уже распознан, то перезаписываем его в БД, сохраняя данные об избранности:
+        do_favor = 0
+        if already_recognized:
+            if already_recognized.is_favourite:
+                do_favor = 1
+
+            session.delete(already_recognized)
+
+        recognized = Recognized()
+        recognized.user_id = user_id
+        recognized.track_id = track.id
+        recognized.is_favourite = do_favor
+
+        # Увеличиваем количество распознанных пользователем уникальных треков, если этот
+        # трек он распознал впервые:
+        add_unique_track(session, user_id, track.id)
+
+        session.add(recognized)
+        session.flush()
+
+    return track
+
+
+def add_unique_track(session, user_id, track_id):
+    """ Добавляет трек в уникальные треки пользователя (если пользователь распознал его впервые) и увеличивает
+        счётчик уникальных треков пользователя. Изменения НЕ подтверждаются. Возвращает True, если трек добавлен.
+
+        session - сессия БД;
+        user_id[int] - ID пользователя;
+        track_id[int] - ID трека в БД. """
+    if session.query(UserUniqueTrack).get((user_id, track_id)) is not None:
+        return False
+
+    session.add(UserUniqueTrack(user_id=user_id, track_id=track_id))
+    session.query(User).filter(User.id == user_id).update({User.unique_total: User.unique_total + 1},
+                                                          synchronize_session=False)
+    return True
+
+
+def unique_tracks_count(session, user_id):
+    """ Возвращает количество уникальных треков, которые распознал пользователь """
+    return session.query(func.count(UserUniqueTrack.track_id)).filter(UserUniqueTrack.user_id == user_id).scalar()
+
+
+def _write_recognized_track(session, track_data, user_id):
+    """ Запись для очереди записи в БД (см. upsert_recognized_track). Возвращает ID трека и обложки для загрузки """
+    background_to_download = []
+    track = upsert_recognized_track(session, track_data, user_id, background_to_download)
+    return track.id, background_to_download
+
+
+def save_recognized_track(track_data, user_id=None):
+    """ Записывает распознанный трек в БД и библиотеку пользователя (см. upsert_recognized_track) через очередь
+        записи в БД, дожидается подтверждения и загружает обложку трека. Возвращает ID трека в БД.
+
+        track_data[tuple] - данные, которые возвращает recognize_song_handler;
+        user_id[int] - ID пользователя, распознавшего трек (None - пользователь не авторизован). """
+    with stage('db_upsert'):
+        track_id, background_to_download = db_writer.write(_write_recognized_track, track_data, user_id)
+    platform_snapshot.invalidate()
+
+    # Загружаем изображение:
+    if background_to_download:
+        with stage('image_download'):
+            run_coroutine(download_image_handler(background_to_download, 'track'))
+    return track_id
+
+
+def toggle_favourite(session, user_id, recognized_id):
+    """ Запись для очереди записи в БД: делает трек в библиотеке пользователя избранным, и наоборот.
+        Возвращает True, если трек принадлежит пользователю (и его статус изменён).
+
+        session - сессия БД;
+        user_id[int] - ID пользователя;
+        recognized_id[int] - ID записи библиотеки (Recognized). """
+    recognized = session.query(Recognized).filter(Recognized.user_id == user_id,
+                                                  Recognized.id == recognized_id).first()
+    if not recognized:
+        return False
+
+    recognized.is_favourite = 0 if recognized.is_favourite else 1
+    return True
+
+
+def spool_upload(stream):
+    """ Потоково читает загруженный файл в буфер и одновременно вычисляет хеш его содержимого.
+        Возвращает буфер (указатель установлен на начало) и хеш файла.
+
+        stream - поток с содержимым файла (например, request.files['file'].stream). """
+    buffer = SpooledTemporaryFile(max_size=RECOGNITION_SPOOL_SIZE)
+    hasher = hashlib.sha256()
+
+    chunk = stream.read(CHUNK_SIZE)
+    while chunk:
+        hasher.update(chunk)
+        buffer.write(chunk)
+        chunk = stream.read(CHUNK_SIZE)
+
+    buffer.seek(0)
+    return buffer, hasher.hexdigest()
+
+
+def recognize_cached(session, digest, user_id=None):
+    """ Ищет загруженный файл в кэше распознаваний. Если файл уже распознавался, то сразу записывает трек
+        в БД и библиотеку пользователя (без обращения к ShazamAPI) и возвращает ID трека в БД.
+        Иначе возвращает None.
+
+        session - сессия БД;
+        digest[str] - хеш содержимого загруженного аудиофайла;
+        user_id[int] - ID пользователя, распознавшего трек (None - пользователь не авторизован). """
+    with stage('cache_lookup'):
+        track_data = recognition_cache.get(session, digest)
+    if track_data is None:
+        return None
+    return save_recognized_track(track_data, user_id)
+
+
+def recognize_upload(buffer, user_id=None, digest=None):
+    """ Задача для очереди распознавания: распознаёт загруженный файл, записывает результат в БД и закрывает буфер.
+        Возвращает ID трека в БД, или 0, если трек распознать не удалось.
+
+        buffer - буфер с содержимым файла (см. spool_upload);
+        user_id[int] - ID пользователя, распознавшего трек (None - пользователь не авторизован);
+        digest[str] - хеш содержимого файла; если указан, то результат распознавания сохраняется в кэш. """
+    session = db_session.create_session()
+    try:
+        with trace('recognize_job'):
+            # Распознавателю передаётся сам буфер: содержимое файла не копируется в память на всё время
+            # распознавания (большой файл остаётся на диске, см. spool_upload):
+            track_data, window = recognize_song_window(buffer, session=session)
+
+            # Если программа не смогла определить трек, то возвращаем 0:
+            if track_data is None:
+                return 0
+
+            if digest is not None:
+                db_writer.submit(recognition_cache.put, digest, track_data)
+            track_id = save_recognized_track(track_data, user_id)
+
+            # Популярные треки добавляем в локальный индекс отпечатков (по уже декодированному фрагменту,
+            # по которому трек распознан), чтобы в следующий раз распознать их без обращения к ShazamAPI:
+            if window is not None:
+                try:
+                    with stage('fingerprint_index'):
+                        index_if_popular(session, track_id, window)
+                except Exception as e:
+                    status_error = e
+            return track_id
+    finally:
+        session.close()
+        buffer.close()
+
+
+class BatchTooLargeError(Exception):
+    """ Ошибка: пакетный запрос содержит слишком много файлов или слишком большие (сильно сжатые) архивы """
+    pass
+
+
+def _check_archive(archive, count, size):
+    """ Проверяет аудиофайлы ZIP-архива по его оглавлению (до распаковки). count[int] и size[int] - количество
+        и суммарный размер уже прочитанных файлов запроса. Возвращает список аудиофайлов архива (ZipInfo). """
+    entries = [info for info in archive.infolist()
+               if not info.is_dir() and info.filename.lower().endswith(AUDIO_EXTENSIONS)]
+    for info in entries:
+        count += 1
+        size += info.file_size
+        if count > BATCH_RECOGNITION_LIMIT:
+            raise BatchTooLargeError(f'Необходимо отправить от 1 до {BATCH_RECOGNITION_LIMIT} аудиофайлов')
+        if size > BATCH_UNCOMPRESSED_LIMIT:
+            raise BatchTooLargeError('Слишком большой размер распакованных файлов')
+        if info.file_size > BATCH_COMPRESSION_RATIO_LIMIT * max(info.compress_size, 1):
+            raise BatchTooLargeError(f'Слишком сильно сжатый файл: {info.filename}')
+    return entries
+
+
+def _buffer_size(buffer):
+    """ Размер содержимого буфера (в байтах); указатель остаётся в начале буфера """
+    buffer.seek(0, 2)
+    size = buffer.tell()
+    buffer.seek(0)
+    return size
+
+
+def spool_batch(files):
+    """ Читает файлы пакетного запроса в буферы. ZIP-архивы распаковываются: из них берутся только
+        аудиофайлы (см. AUDIO_EXTENSIONS). Возвращает список кортежей (имя файла, буфер, хеш).
+        Суммарный размер файлов учитывает и обычные, и распакованные файлы; количество и размер файлов
+        архива проверяются по его оглавлению до распаковки:
+        при превышении ограничений вызывается ошибка BatchTooLargeError (уже прочитанные буферы закрываются).
+
+        files[list] - загруженные файлы (request.files.getlist(...)). """
+    uploads = []
+    size = 0  # суммарный размер прочитанных файлов
+    try:
+        for f in files:
+            if not f.filename:
+                continue
+
+            # Обычный аудиофайл:
+            if not f.filename.lower().endswith('.zip'):
+                if len(uploads) >= BATCH_RECOGNITION_LIMIT:
+                    raise BatchTooLargeError(f'Необходимо отправить от 1 до {BATCH_RECOGNITION_LIMIT} аудиофайлов')
+                buffer, digest = spool_upload(f.stream)
+                uploads.append((f.filename, buffer, digest))
+                size += _buffer_size(buffer)
+                if size > BATCH_UNCOMPRESSED_LIMIT:
+                    raise BatchTooLargeError('Слишком большой суммарный размер файлов')
+                continue
+
+            # ZIP-архив - проверяем его оглавление, а затем извлекаем из него аудиофайлы:
+            archive_buffer, _ = spool_upload(f.stream)
+            try:
+                with zipfile.ZipFile(archive_buffer) as archive:
+                    entries = _check_archive(archive, len(uploads), size)
+                    for info in entries:
+                        size += info.file_size
+                        with archive.open(info) as stream:
+                            buffer, digest = spool_upload(stream)
+                        uploads.append((f'{f.filename}/{info.filename}', buffer, digest))
+            finally:
+                archive_buffer.close()
+    except Exception:
+        for name, buffer, digest in uploads:
+            buffer.close()
+        raise
+    return uploads
+
+
+def _recognize_buffer(buffer):
+    """ Распознаёт содержимое буфера (выполняется в потоке пула пакетного распознавания) """
+    return recognize_song_handler(buffer)
+
+
+def recognize_batch(session, uploads, user_id=None, concurrency=BATCH_RECOGNITION_CONCURRENCY):
+    """ Пакетное распознавание. Файлы, которых нет в кэше, распознаются параллельно (не более concurrency
+        файлов одновременно), а все треки и записи библиотеки пользователя сохраняются одной транзакцией.
+        Возвращает отчёт: список словарей с результатом для каждого файла.
+
+        session - сессия БД;
+        uploads[list] - список кортежей (имя файла, буфер, хеш), см. spool_batch;
+        user_id[int] - ID пользователя, распознавшего треки (None - пользователь не авторизован);
+        concurrency[int] - максимальное количество одновременных обращений к ShazamAPI. """
+    results = dict()  # номер файла -> данные о треке (в формате recognize_song_handler)
+    errors = dict()  # номер файла -> текст ошибки
+    cached = set()  # номера файлов, результат для которых взят из кэша
+
+    try:
+        # 1. Ищем файлы в кэше распознаваний:
+        for index, (name, buffer, digest) in enumerate(uploads):
+            track_data = recognition_cache.get(session, digest)
+            if track_data is not None:
+                results[index] = track_data
+                cached.add(index)
+
+        # 2. Остальные файлы распознаём параллельно:
+        pending = [index for index in range(len(uploads)) if index not in results]
+        if pending:
+            # Каждая задача выполняется в копии текущего контекста, чтобы этапы распознавания (декодирование,
+            # локальный индекс, ShazamAPI) попали в разбивку задачи пакетного распознавания (см. metrics.py):
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+                futures = {index: executor.submit(contextvars.copy_context().run, _recognize_buffer,
+                                                  uploads[index][1]) for index in pending}
+                for index, future in futures.items():
+                    try:
+                        results[index] = future.result()
+                    except Exception as e:
+                        errors[index] = str(e)
+
+        # 3. Записываем все распознанные треки одной транзакцией:
+        background_to_download = []
+        report = []
+        upsert_start = time.perf_counter()
+        for index, (name, buffer, digest) in enumerate(uploads):
+            if index in errors:
+                report.append({'file': name, 'status': 'error', 'error': errors[index]})
+                continue
+
+            track_data = results[index]
+            if track_data is None:
+                report.append({'file': name, 'status': 'not_recognized', 'track_id': 0})
+                continue
+
+            track = upsert_recognized_track(session, track_data, user_id, background_to_download)
+            report.append({'file': name, 'status': 'cached' if index in cached else 'recognized',
+                           'track_id': track.id, 'title': track.track, 'band': track.band})
+        session.commit()
+        platform_snapshot.invalidate()
+        observe('db_upsert', time.perf_counter() - upsert_start)
+
+        # Сохраняем новые результаты в кэш (через очередь записи) и загружаем обложки:
+        for index, track_data in results.items():
+            if track_data is not None and index not in cached:
+                db_writer.submit(recognition_cache.put, uploads[index][2], track_data)
+
+        if background_to_download:
+            with stage('image_download'):
+                run_coroutine(download_image_handler(background_to_download, 'track'))
+        return report
+    finally:
+        for name, buffer, digest in uploads:
+            buffer.close()
+
+
+def recognize_batch_job(uploads, user_id=None):
+    """ Задача для очереди распознавания: пакетное распознавание (см. recognize_batch) с собственной сессией БД.
+        Возвращает отчёт по каждому файлу. """
+    session = db_session.create_session()
+    try:
+        with trace('recognize_batch_job'):
+            return recognize_batch(session, uploads, user_id)
+    finally:
+        session.close()
@@ -0,0 +1,127 @@
+""" Кэш похожих песен в БД (таблица related_tracks).
+
+    Список похожих песен для трека хранится по его track_key в виде ссылок на треки в таблице tracks,
+    поэтому повторный просмотр страницы похожих песен - это один запрос с JOIN к таблице tracks.
+    Списки старше RELATED_CACHE_TTL секунд отдаются сразу, но обновляются в фоне. Кэш хранит списки
+    не более чем для RELATED_CACHE_SIZE треков: при переполнении удаляются самые старые списки.
+
+    Если у трека нет похожих песен, то вместо списка хранится одна запись без ссылки на трек (track_id = NULL):
+    такой пустой список тоже берётся из кэша, но обновляется через RELATED_NEGATIVE_CACHE_TTL секунд. """
+from data.system_files.constants import RELATED_CACHE_TTL, RELATED_NEGATIVE_CACHE_TTL, RELATED_CACHE_SIZE
+from data.audio_handlers.similiar_songs_handler import get_similiar_songs
+from data.system_files.image_downloader import download_image_handler
+from data.system_files.track_storage import bulk_upsert_tracks
+from data.system_files.async_runtime import run
+from data.system_files.single_flight import coalesce
+from concurrent.futures import ThreadPoolExecutor
+from data.ORM.related_track import RelatedTrack
+from data.ORM.track import Track
+from data.ORM import db_session
+from sqlalchemy import func
+import threading
+import logging
+import time
+
+
+log = logging.getLogger(__name__)
+
+# Потоки для фонового обновления списков и ключи треков, списки которых обновляются в данный момент:
+__executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='related-refresh')
+__refreshing = set()
+__lock = threading.Lock()
+
+
+def _evict(session):
+    """ Удаляет самые старые списки похожих песен, если списков больше RELATED_CACHE_SIZE """
+    total = session.query(func.count(func.distinct(RelatedTrack.track_key))).scalar()
+    if total <= RELATED_CACHE_SIZE:
+        return
+
+    oldest = session.query(RelatedTrack.track_key).group_by(RelatedTrack.track_key) \
+        .order_by(func.max(RelatedTrack.updated)).limit(total - RELATED_CACHE_SIZE)
+    session.query(RelatedTrack).filter(RelatedTrack.track_key.in_([key for key, in oldest])) \
+        .delete(synchronize_session=False)
+
+
+def store_related(session, track_key):
+    """ Загружает похожие песни из ShazamAPI, записывает их (и недостающие треки) в БД и загружает обложки.
+        Возвращает список похожих песен (объектов Track) без дубликатов. """
+    songs = get_similiar_songs(track_key)
+    items = [{'track_key': key, 'shazam_id': shazam_id, 'artist_id': artist_id,
+              'track': title, 'band': band, 'background': background}
+             for key, shazam_id, artist_id, title, band, background in songs]
+    tracks, background_to_download = bulk_upsert_tracks(session, items)
+
+    # В ответе может оказаться несколько одинаковых песен, поэтому избавляемся от дубликатов (сохраняя порядок):
+    tracks = list(dict.fromkeys(tracks))
+
+    # Заменяем старый список новым:
+    now = time.time()
+    session.query(RelatedTrack).filter(RelatedTrack.track_key == track_key).delete(synchronize_session=False)
+    session.add_all([RelatedTrack(track_key=track_key, position=position, track_id=track.id, updated=now)
+                     for position, track in enumerate(tracks)])
+    if not tracks:
+        session.add(RelatedTrack(track_key=track_key, position=0, track_id=None, updated=now))
+    _evict(session)
+    session.commit()
+
+    if background_to_download:
+        run(download_image_handler(background_to_download, 'track'))
+    return tracks
+
+
+@coalesce
+def _fill(track_key):
+    """ Первая загрузка списка похожих песен (с собственной сессией БД). Одновременные запросы одного
+        трека объединяются, поэтому одни и те же треки не записываются в БД несколько раз. """
+    session = db_session.create_session()
+    try:
+        store_related(session, track_key)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _refresh(track_key):
+    """ Фоновое обновление списка похожих песен (с собственной сессией БД) """
+    session = db_session.create_session()
+    try:
+        store_related(session, track_key)
+    except Exception as e:
+        session.rollback()
+        log.warning(f'Не удалось обновить похожие песни для трека {track_key}: {e}')
+    finally:
+        session.close()
+        with __lock:
+            __refreshing.discard(track_key)
+
+
+def related_tracks(session, track_key):
+    """ Возвращает список похожих песен (объектов Track) для трека с ключом track_key.
+
+        session - сессия БД;
+        track_key[int] - KEY (ключ) трека в Shazam. """
+    # Запись пустого списка не ссылается на трек, поэтому треки присоединяются внешним JOIN:
+    query = session.query(Track, RelatedTrack.updated) \
+        .select_from(RelatedTrack) \
+        .outerjoin(Track, RelatedTrack.track_id == Track.id) \
+        .filter(RelatedTrack.track_key == track_key) \
+        .order_by(RelatedTrack.position)
+    rows = query.all()
+
+    # Списка ещё нет в кэше - загружаем его синхронно:
+    if not rows:
+        _fill(track_key)
+        return [track for track, updated in query.all() if track is not None]
+
+    # Устаревший список отдаём сразу, а обновляем в фоне (пустой список устаревает быстрее):
+    tracks = [track for track, updated in rows if track is not None]
+    ttl = RELATED_CACHE_TTL if tracks else RELATED_NEGATIVE_CACHE_TTL
+    if time.time() - min(updated for track, updated in rows) > ttl:
+        with __lock:
+            if track_key not in __refreshing:
+                __refreshing.add(track_key)
+                __executor.submit(_refresh, track_key)
+    return tracks
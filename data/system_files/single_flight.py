@@ -0,0 +1,89 @@
+""" Мини-модуль объединения одинаковых одновременных запросов (single-flight).
+
+    Если несколько потоков одновременно вызывают одну и ту же функцию с одинаковыми аргументами
+    (например, десятки посетителей открыли один и тот же хит-парад), то к ShazamAPI обращается только
+    первый из них, а остальные дожидаются и получают его результат (или его ошибку). Количество
+    объединённых вызовов доступно через stats(). """
+from functools import wraps
+import threading
+
+
+class _Call:
+    """ Выполняющийся вызов: результат (или ошибка) и событие завершения """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """ Группа вызовов, которые объединяются по ключу.
+
+        name[str] - название группы (для статистики). """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0  # всего вызовов
+        self.collapsed = 0  # вызовов, которые получили результат чужого запроса
+        self._inflight = dict()  # ключ -> выполняющийся вызов
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """ Выполняет func(*args, **kwargs), если вызов с ключом key ещё не выполняется,
+            иначе - дожидается выполняющегося вызова и возвращает его результат """
+        with self._lock:
+            self.calls += 1
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.event.set()
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self.calls, 'collapsed': self.collapsed, 'in_flight': len(self._inflight)}
+
+
+__groups = dict()
+__lock = threading.Lock()
+
+
+def coalesce(func):
+    """ Декоратор: одновременные вызовы func с одинаковыми аргументами объединяются в один """
+    name = f'{func.__module__}.{func.__qualname__}'
+    group = SingleFlight(name)
+    with __lock:
+        __groups[name] = group
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return group.do((args, tuple(sorted(kwargs.items()))), func, *args, **kwargs)
+
+    wrapper.single_flight = group
+    return wrapper
+
+
+def stats():
+    """ Возвращает статистику по всем объединяемым функциям: {функция: {calls, collapsed, in_flight}} """
+    with __lock:
+        groups = list(__groups.items())
+    return {name: group.stats() for name, group in sorted(groups)}
@@ -0,0 +1,137 @@
+""" Пакетная запись треков в БД. Треки, полученные от ShazamAPI (хит-парады, похожие песни, лучшие песни
+    исполнителя), записываются не по одному: все shazam_id ищутся в БД одним запросом, а недостающие треки
+    добавляются одной пачкой. """
+from data.system_files.constants import UNKNOWN_SONG, identifier
+from data.system_files.image_downloader import download_image_handler
+from data.system_files.async_runtime import run
+from sqlalchemy.exc import IntegrityError
+from data.ORM.track import Track
+import os
+
+
+# Количество shazam_id в одном SQL-запросе (ограничение SQLite на количество параметров):
+QUERY_CHUNK = 500
+
+# Количество попыток записи новых треков (при одновременной записи тех же треков другими запросами):
+INSERT_ATTEMPTS = 3
+
+
+def cover_path(filename):
+    """ Путь к обложке трека (в том виде, в котором он хранится в БД) """
+    return f'/static/img/track/{filename}'
+
+
+def _prepare_tracks(session, shazam_ids, items):
+    """ Загружает уже существующие треки и создаёт (но не добавляет в сессию) недостающие.
+        Возвращает словарь {shazam_id: трек}, список новых треков и список обложек для загрузки. """
+
+    # Загружаем все уже существующие треки одним запросом (частями по QUERY_CHUNK):
+    existing = dict()
+    for i in range(0, len(shazam_ids), QUERY_CHUNK):
+        for track in session.query(Track).filter(Track.shazam_id.in_(shazam_ids[i:i + QUERY_CHUNK])):
+            existing.setdefault(track.shazam_id, track)
+
+    # Создаём недостающие треки:
+    background_to_download = []
+    new_tracks = []
+    for item in items:
+        if item['shazam_id'] in existing:
+            continue
+
+        track = Track()
+        track.track_key = item['track_key']
+        track.shazam_id = item['shazam_id']
+        track.artist_id = item['artist_id']
+        track.track = item['track']
+        track.band = item['band']
+        track.popularity = 1
+
+        if item['background'] == UNKNOWN_SONG:
+            track.background = f'/static/img/system/{UNKNOWN_SONG}'
+        else:
+            filename = identifier(format_=".png")
+            track.background = cover_path(filename)
+            background_to_download.append([filename, item['background']])
+
+        existing[track.shazam_id] = track
+        new_tracks.append(track)
+    return existing, new_tracks, background_to_download
+
+
+def _insert_missing(session, items):
+    """ Загружает существующие треки и добавляет недостающие (см. _prepare_tracks).
+        Возвращает словарь {shazam_id: трек}, список добавленных треков и список обложек для загрузки. """
+    shazam_ids = list({item['shazam_id'] for item in items})
+
+    # Тот же трек может одновременно записываться другим запросом (хит-парад, похожие песни, распознавание).
+    # Поэтому новые треки добавляются в точке сохранения (SAVEPOINT): если другой запрос успел записать трек
+    # с тем же shazam_id (ошибка уникального индекса), то откатываем только точку сохранения,
+    # заново загружаем существующие треки и повторяем запись недостающих:
+    for attempt in range(INSERT_ATTEMPTS):
+        existing, new_tracks, background_to_download = _prepare_tracks(session, shazam_ids, items)
+        if not new_tracks:
+            break
+        try:
+            with session.begin_nested():
+                session.add_all(new_tracks)
+                session.flush()
+            break
+        except IntegrityError:
+            if attempt == INSERT_ATTEMPTS - 1:
+                raise
+
+    return existing, new_tracks, background_to_download
+
+
+def bulk_upsert_tracks(session, items):
+    """ Записывает в БД треки, которых там ещё нет. Изменения НЕ подтверждаются (commit выполняет
+        вызывающая функция). Возвращает список треков (объектов Track) в исходном порядке, а также
+        список обложек новых треков для загрузки (см. download_image_handler).
+
+        session - сессия БД;
+        items[list] - список словарей с ключами: shazam_id, track_key, artist_id, track, band, background
+                      (background - ссылка на обложку или UNKNOWN_SONG). """
+    existing, new_tracks, background_to_download = _insert_missing(session, items)
+    return [existing[item['shazam_id']] for item in items], background_to_download
+
+
+def get_or_create_track(session, item):
+    """ Возвращает трек с shazam_id из item, а если его ещё нет в БД - записывает его (с той же защитой
+        от одновременной записи, что и bulk_upsert_tracks). Изменения НЕ подтверждаются.
+        Возвращает трек, признак того, что трек добавлен этим вызовом, и список обложек для загрузки.
+
+        session - сессия БД;
+        item[dict] - данные трека (см. bulk_upsert_tracks). """
+    existing, new_tracks, background_to_download = _insert_missing(session, [item])
+    track = existing[item['shazam_id']]
+    return track, track in new_tracks, background_to_download
+
+
+def store_tracks(session, items):
+    """ Записывает в БД треки, которых там ещё нет (см. bulk_upsert_tracks), подтверждает изменения одним
+        коммитом и загружает обложки новых треков. Возвращает список треков (объектов Track) в исходном порядке.
+
+        session - сессия БД;
+        items[list] - список словарей с данными треков (см. bulk_upsert_tracks). """
+    tracks, background_to_download = bulk_upsert_tracks(session, items)
+    session.commit()
+
+    if background_to_download:
+        run(download_image_handler(background_to_download, 'track'))
+    return tracks
+
+
+def missing_covers(tracks, items):
+    """ Возвращает список обложек для загрузки: для треков, файл обложки которых отсутствует на диске.
+
+        tracks[list] - треки (см. bulk_upsert_tracks);
+        items[list] - исходные данные треков (в том же порядке), содержащие ссылки на обложки. """
+    background_to_download = []
+    for track, item in zip(tracks, items):
+        if item['background'] == UNKNOWN_SONG or not track.background.startswith(cover_path('')):
+            continue
+
+        filename = track.background[len(cover_path('')):]
+        if not os.path.exists(f'static/img/track/{filename}'):
+            background_to_download.append([filename, item['background']])
+    return background_to_download
@@ -0,0 +1,73 @@
+""" Мини-модуль кэша с ограниченным временем жизни записей и обновлением в фоне (stale-while-revalidate).
+
+    Свежая запись возвращается сразу. Устаревшая запись тоже возвращается сразу, но для неё запускается
+    одно фоновое обновление. Если обновление завершилось ошибкой (например, сбой на стороне ShazamAPI),
+    то кэш продолжает отдавать последнее удачно загруженное значение. """
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import logging
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+class StaleWhileRevalidateCache:
+    """ Кэш результатов функции loader, ключ - аргументы функции.
+
+        loader - функция, загружающая значение;
+        ttl[int] - время (в секундах), в течение которого значение считается свежим;
+        workers[int] - количество потоков для фонового обновления. """
+
+    def __init__(self, loader, ttl, workers=2):
+        self.loader = loader
+        self.ttl = ttl
+        self._entries = dict()  # ключ -> (значение, время загрузки)
+        self._refreshing = set()  # ключи, для которых сейчас выполняется фоновое обновление
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cache-refresh')
+
+    def get(self, *key):
+        """ Возвращает значение для ключа key. Если значения ещё нет в кэше, то загружает его синхронно
+            (ошибка загрузки в этом случае передаётся вызывающему коду). """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            # Устаревшее значение отдаём сразу, а обновление запускаем в фоне (одно на ключ):
+            if entry is not None:
+                value, loaded = entry
+                if time.time() - loaded > self.ttl and key not in self._refreshing:
+                    self._refreshing.add(key)
+                    self._executor.submit(self._refresh, key)
+                return value
+
+        value = self.loader(*key)
+        self.put(value, *key)
+        return value
+
+    def put(self, value, *key):
+        """ Записывает значение для ключа key (например, при предварительной загрузке) """
+        with self._lock:
+            self._entries[key] = (value, time.time())
+
+    def refresh(self, *key):
+        """ Синхронно загружает свежее значение для ключа key и возвращает его """
+        value = self.loader(*key)
+        self.put(value, *key)
+        return value
+
+    def age(self, *key):
+        """ Возвращает возраст значения (в секундах), или None, если значения нет в кэше """
+        with self._lock:
+            entry = self._entries.get(key)
+            return time.time() - entry[1] if entry else None
+
+    def _refresh(self, key):
+        """ Фоновое обновление: при ошибке оставляем последнее удачное значение """
+        try:
+            self.refresh(*key)
+        except Exception as e:
+            log.warning(f'Не удалось обновить значение {key} в кэше: {e}')
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
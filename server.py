@@ -1,17 +1,15 @@
 # Модули для работы с Flask
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from flask import Flask, render_template, redirect, request, url_for
+from flask import Flask, render_template, redirect, request, url_for, jsonify
 from flask_restful import Api, abort
 
 # Библиотека для работы с функцией "Поделиться"
 from urllib.parse import urlparse
-import asyncio  # Asyncio - для асинхронной загрузки изображений
+import asyncio
+import os
 
 # Обработчики ShazamAPI
-from data.audio_handlers.similiar_songs_handler import get_similiar_songs
-from data.audio_handlers.about_artist_handler import get_artist_info
-from data.audio_handlers.recognize_handler import recognize_song_handler
-from data.audio_handlers.charts_handler import charts_handler
+from data.audio_handlers.charts_handler import get_charts
 
 # Форма регистрации и авторизации
 from data.forms.user_change_password_form import ChangePasswordForm
@@ -21,28 +19,51 @@ from data.forms.login_form import LoginForm
 from data.forms.user_form import UserForm
 
 # API-формы:
+from data.api import recognize_json_api
 from data.api import artist_json_api
 from data.api import track_json_api
+from data.api import leaderboard_json_api
 
 # ORM-модели
 from data.ORM import db_session
+from data.ORM.user_unique_track import UserUniqueTrack
 from data.ORM.recognized import Recognized
 from data.ORM.artist import Artist
 from data.ORM.track import Track
 from data.ORM.user import User
 
 # Константы и системные функции
+from data.system_files.recognition_jobs import recognition_queue, QueueOverflowError, DONE, FAILED
 from data.system_files.image_downloader import download_image_handler
+from data.system_files.async_runtime import run as run_coroutine
+from data.system_files.recognition_cache import recognition_cache
+from data.system_files.artist_cache import cached_artist_info, cached_artists_info
+from data.system_files.related_cache import related_tracks
+from data.system_files.circuit_breaker import CircuitOpenError
+from data.system_files.track_storage import store_tracks
+from data.system_files.charts_prewarmer import charts_prewarmer
+from data.system_files.metrics import stage, trace
+from data.system_files import metrics, single_flight, circuit_breaker
+from data.system_files.recognition_service import spool_upload, recognize_upload, recognize_cached, toggle_favourite, \
+    unique_tracks_count
+from data.system_files.db_writer import db_writer
+from data.system_files.artist_stats import artist_stats, artists_with_stats
+from data.system_files.platform_stats import platform_stats
+from data.system_files.platform_snapshot import platform_snapshot
+from data.system_files.leaderboard import user_rank
 from data.system_files.constants import *
 
-# Для удаления загруженных на сервер файлов
-import os
-
 
 # Инициализация приложения:
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'FFFFF0-JHKMQ1-KRMB89-KLLLVV-ZZHMN5'  # Секретный ключ
 
+# Подключение к БД. Каждый запрос к серверу работает со своей сессией (db_sess передаёт обращения сессии
+# текущего запроса), а по окончании запроса сессия закрывается (см. shutdown_session).
+# Таблицы и миграции БД создаются не при импорте, а при запуске сервера или перед первым запросом (см. prepare_database):
+db_session.global_init("db/PyJam.db")
+db_sess = db_session.scoped()
+
 # Инициализация объекта класса Api, для работы с REST-API библиотеки Flask:
 api = Api(app)
 
@@ -54,6 +75,15 @@ api.add_resource(track_json_api.TrackAllJsonAPI, '/api/v1/track')
 api.add_resource(artist_json_api.ArtistJsonAPI, '/api/v1/artist/<int:artist_id>')
 api.add_resource(artist_json_api.ArtistAllJsonAPI, '/api/v1/artist')
 
+# Добавление API фонового распознавания:
+api.add_resource(recognize_json_api.RecognizeJsonAPI, '/api/v1/recognize')
+api.add_resource(recognize_json_api.RecognizeBatchJsonAPI, '/api/v1/recognize/batch')
+api.add_resource(recognize_json_api.RecognizeBatchJobJsonAPI, '/api/v1/recognize/batch/<job_id>')
+api.add_resource(recognize_json_api.RecognizeJobJsonAPI, '/api/v1/recognize/<job_id>')
+
+# Добавление API топа пользователей:
+api.add_resource(leaderboard_json_api.LeaderboardJsonAPI, '/api/v1/leaderboard')
+
 # Инициализация объекта LoginManager, функции для загрузки пользователя:
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -70,6 +100,38 @@ def dt_prefix():
     return ''
 
 
+def start_background_tasks():
+    """ Запуск планировщика предварительной загрузки хит-парадов. При запуске с перезагрузчиком Werkzeug
+        (app.run(debug=True)) модуль выполняется в двух процессах, поэтому планировщик запускается только
+        в процессе, который обрабатывает запросы (WERKZEUG_RUN_MAIN), - иначе загрузки выполнялись бы дважды """
+    if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        charts_prewarmer.start()
+
+
+# Подготовлено ли приложение к обработке запросов (см. prepare_database):
+application_prepared = False
+
+
+@app.before_request
+def prepare_database():
+    """ Подготовка приложения перед первым запросом (дальше - ничего не делает): создание таблиц и выполнение
+        миграций БД, затем запуск фоновых задач (как при запуске python server.py, так и под WSGI-сервером) """
+    global application_prepared
+    if application_prepared:
+        return
+
+    # Одновременные первые запросы безопасны: migrate() и запуск планировщика выполняются только один раз:
+    db_session.migrate()
+    start_background_tasks()
+    application_prepared = True
+
+
+@app.teardown_appcontext
+def shutdown_session(exception=None):
+    """ Закрытие сессии БД по окончании запроса """
+    db_session.remove_session()
+
+
 @login_manager.user_loader
 def load_user(user_id):
     """ Загрузка пользователя """
@@ -97,118 +159,95 @@ def rules():
     return render_template(f'/information_pages/rules{dt_prefix()}.html')
 
 
-@app.route('/', methods=["GET", "POST"])
-def main():
-    """  Главная страница платформы PyJam.
-         Данная страница отображает основную статистику по всему сайту,
-         а также топы: самых активных пользователей, самых популярных треков, самых популярных исполнителей. """
-
-    # Загрузка информации о зарегистрированных пользователях:
-    users = list(sorted(db_sess.query(User).all(), key=lambda us: len(us.unique.split('&')), reverse=True))
-
-    # Загрузка информации о библиотеке сайта:
-    big_library = db_sess.query(Recognized).all()
-
-    # Загрузка информации обо всех загруженных на сайт треков:
-    tracks = list(sorted(db_sess.query(Track).all(), key=lambda t: t.popularity, reverse=True))
-
-    # Загрузка статистики обо всех зарегистрированных пользователях на платформе,
-    # загрузка топа самых активных пользователей:
-    all_users = len(users)  # количество зарегистрированных пользователей
-    active_users = list()  # топ активных пользователей хранится в этом списке
-
-    # Загружаем информацию для топа (берём первых трёх самых активных пользователей)
-    for u in users:
-        if u.id > 1:
-            user_library = db_sess.query(Recognized).filter(Recognized.user_id == u.id).all()
-            user_info = dict()
-            user_info['id'] = u.id
-            user_info['name'] = u.name
-            user_info['surname'] = u.surname
-            user_info['background'] = u.background
-            user_info['total'] = len(u.unique.split('&')) - 1
-            user_info['in_library'] = len(user_library)
-            active_users.append(user_info)
-        if len(active_users) == 3:
-            break
-
-    # Загрузка статистики обо всех треках, находящихся в библиотеках у пользователей,
-    # загрузка статистики обо всех треках, которые избраны у пользователей в библиотеках:
-    in_library_tracks = len(big_library)
-    in_feature_tracks = len([rec for rec in big_library if rec.is_favourite == 1])
+def main_page_snapshot():
+    """ Собирает снимок статистики главной страницы (см. platform_snapshot.py): словарь с данными для шаблона.
+        Треки и исполнители в снимке хранятся в виде словарей, чтобы снимок не зависел от сессии БД. """
+
+    # Загрузка статистики платформы и топов (счётчиками и запросами по индексам, см. platform_stats.py):
+    stats = platform_stats(db_sess)
+    all_users = stats['all_users']  # количество зарегистрированных пользователей
+    active_users = stats['active_users']  # топ активных пользователей
+
+    # Статистика обо всех треках, находящихся в библиотеках у пользователей,
+    # статистика обо всех треках, которые избраны у пользователей в библиотеках:
+    in_library_tracks = stats['in_library_tracks']
+    in_feature_tracks = stats['in_feature_tracks']
 
     # Всего распознано треков, треков на платформе, исполнителей на платформе (суммарно)
-    recognized_total = sum([track.popularity for track in tracks])
-    track_on_platform = len(tracks)
-    artist_on_platform = len(set([t.artist_id for t in tracks]))
+    recognized_total = stats['recognized_total']
+    track_on_platform = stats['track_on_platform']
+    artist_on_platform = stats['artist_on_platform']
 
-    # Загрузка информации о самых популярных треках на платформе (по количеству распознаний):
-    most_popular_tracks = []
-    for track in tracks[:3]:
-        most_popular_tracks.append(track)
+    # Самые популярные треки на платформе (по количеству распознаний):
+    most_popular_tracks = [{'id': track.id, 'track': track.track, 'band': track.band, 'artist_id': track.artist_id,
+                            'background': track.background, 'popularity': track.popularity}
+                           for track in stats['most_popular_tracks']]
 
-    # Загрузка информации о самых популярных исполнителях на платформе (по количеству распознанных треков):
+    # Самые популярные исполнители на платформе (по количеству треков на платформе, затем - по количеству распознаний):
     most_popular_artists = []
-    best_artists_info = dict()
-
-    for track in tracks:
-        artist_shazam_id = track.artist_id  # берём Shazam_Id исполнителя из трека:
-        if artist_shazam_id not in best_artists_info:
-            best_artists_info[artist_shazam_id] = [0, 0]  # подсчитываем количество распознаний и треков на платформе
-        best_artists_info[artist_shazam_id][0] += 1  # счётчик на платформе
-        best_artists_info[artist_shazam_id][1] += track.popularity  # счётчик распознаний всех треков исполнителя
-    if 0 in best_artists_info:
-        del best_artists_info[0]
-
-    # После обработки информации об исполнителях, загружаем ключи трёх самых популярных исполнителей:
-    best_artist_shazam_ids = list(sorted(best_artists_info.keys(),
-                                         key=lambda x: best_artists_info[x], reverse=True))[:3]
-
-    # А дальше - загружаем информацию о них, а затем - выводим все данные:
-    for artist_shazam_id in best_artist_shazam_ids:
-        is_artist_on_platform = db_sess.query(Artist).filter(Artist.shazam_id == artist_shazam_id).first()
-
-        # Если исполнителя нет в БД - загружаем информацию о нём и добавляем в БД,
-        # иначе - просто берём информацию из БД:
-        if not is_artist_on_platform:
-            background_to_download = []  # список для загрузки изображений с интернета
-            artist_info = get_artist_info(artist_shazam_id)[0]
-            artist_id, artist_title, artist_genre, artist_background = artist_info
-
-            artist = Artist()
-            artist.shazam_id = artist_shazam_id
-            artist.artist = artist_title
-            artist.genre = artist_genre
-
-            if artist_background == UNKNOWN_SONG:
-                artist.background = url_for('static', filename=f'img/system/{UNKNOWN_SONG}')
-            else:
-                filename = identifier(format_=".png")
-                artist.background = url_for('static', filename=f'img/artist/{filename}')
-                background_to_download.append([filename, artist_background])
+    best_artists_info = stats['best_artists_info']  # Shazam_Id исполнителя -> [треков на платформе, распознаний]
+    best_artist_shazam_ids = list(best_artists_info.keys())
+
+    # А дальше - загружаем информацию о них, а затем - выводим все данные. Исполнители, которых ещё нет в БД,
+    # загружаются одной параллельной пачкой (если ShazamAPI недоступен, то такие исполнители пропускаются):
+    artists_on_platform = {artist.shazam_id: artist for artist in
+                           db_sess.query(Artist).filter(Artist.shazam_id.in_(best_artist_shazam_ids))}
+    missing_artist_ids = [i for i in best_artist_shazam_ids if i not in artists_on_platform]
+    missing_artists_info = cached_artists_info(db_sess, missing_artist_ids) if missing_artist_ids else dict()
+
+    background_to_download = []  # список для загрузки изображений с интернета
+    for artist_shazam_id in missing_artist_ids:
+        if artist_shazam_id not in missing_artists_info:
+            continue
+        artist_id, artist_title, artist_genre, artist_background = missing_artists_info[artist_shazam_id][0]
 
-            # Добавляем исполнителя, коммитим изменения:
-            db_sess.add(artist)
-            db_sess.commit()
+        artist = Artist()
+        artist.shazam_id = artist_shazam_id
+        artist.artist = artist_title
+        artist.genre = artist_genre
 
-            # Добавляем изображение в очередь на загрузку:
-            most_popular_artists.append([artist, best_artists_info[artist_shazam_id]])
-            asyncio.run(download_image_handler(
-                background_to_download, 'artist'))
+        if artist_background == UNKNOWN_SONG:
+            artist.background = url_for('static', filename=f'img/system/{UNKNOWN_SONG}')
         else:
-            most_popular_artists.append([is_artist_on_platform, best_artists_info[artist_shazam_id]])
+            filename = identifier(format_=".png")
+            artist.background = url_for('static', filename=f'img/artist/{filename}')
+            background_to_download.append([filename, artist_background])
+
+        db_sess.add(artist)
+        artists_on_platform[artist_shazam_id] = artist
+
+    # Коммитим изменения (одним коммитом для всех новых исполнителей) и загружаем изображения:
+    if any(i in missing_artists_info for i in missing_artist_ids):
+        db_sess.commit()
+    if background_to_download:
+        run_coroutine(download_image_handler(background_to_download, 'artist'))
+
+    for artist_shazam_id in best_artist_shazam_ids:
+        if artist_shazam_id in artists_on_platform:
+            artist = artists_on_platform[artist_shazam_id]
+            most_popular_artists.append([{'shazam_id': artist.shazam_id, 'artist': artist.artist,
+                                          'background': artist.background}, best_artists_info[artist_shazam_id]])
 
     # Отображаем статистику, если хотя-бы одна из позиций - ненулевая (такое может быть в самом начале работы сайта)
     show_statistics = any([all_users, recognized_total, in_library_tracks, in_feature_tracks,
                            track_on_platform, artist_on_platform])
 
+    return dict(all_users=all_users, active_users=active_users,
+                show_statistics=show_statistics, recognized_total=recognized_total,
+                library_tracks=in_library_tracks, feature_tracks=in_feature_tracks,
+                track_on_platform=track_on_platform, artist_on_platform=artist_on_platform,
+                most_popular_tracks=most_popular_tracks, most_popular_artists=most_popular_artists)
+
+
+@app.route('/', methods=["GET", "POST"])
+def main():
+    """  Главная страница платформы PyJam.
+         Данная страница отображает основную статистику по всему сайту,
+         а также топы: самых активных пользователей, самых популярных треков, самых популярных исполнителей.
+         Статистика одинакова для всех посетителей, поэтому берётся из снимка (см. main_page_snapshot). """
+
     # Отображаем информацию:
-    return render_template(f'nav_pages/main{dt_prefix()}.html',
-                           all_users=all_users, active_users=active_users,
-                           show_statistics=show_statistics, recognized_total=recognized_total,
-                           library_tracks=in_library_tracks, feature_tracks=in_feature_tracks,
-                           track_on_platform=track_on_platform, artist_on_platform=artist_on_platform,
-                           most_popular_tracks=most_popular_tracks, most_popular_artists=most_popular_artists)
+    return render_template(f'nav_pages/main{dt_prefix()}.html', **platform_snapshot.get(main_page_snapshot))
 
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -272,6 +311,7 @@ def reqister():
         user.set_password(form.password.data)
         db_sess.add(user)
         db_sess.commit()
+        platform_snapshot.invalidate()
 
         # Отправляем пользователя на страницу для авторизации:
         return redirect('/login')
@@ -345,98 +385,60 @@ def recognize():
                 return render_template(f'/nav_pages/recognize_song{dt_prefix()}.html',
                                        message='Вы не отправили файл', background=background)
 
-            # Создаём уникальный путь для аудиофайла, которое мы будем загружать,
-            # а затем сохраняем файл по указанному пути. После система его распознаёт и автоматически удаляет файл:
-            file_path = 'static/music/' + identifier(format_='.mp3')
-            f.save(file_path)
-
-            # Распознавание песни и удаление файла:
-            track_data = recognize_song_handler(file_path)
-            os.remove(file_path)
-
-            # Если программа не смогла определить трек, то уведомляем пользователя об этом:
-            if track_data is None:
-                return redirect('/recognize/track/0')
-
-            # Если определение прошло успешно, то обрабатываем полученную информацию и формируем ответ:
-            # Берём данные о треке:
-            track_key, shazam_id, artist_id, track_title, band, background = track_data
-
-            # Проверяем, существует ли распознанный трек в БД:
-            existing = db_sess.query(Track).filter(Track.shazam_id == shazam_id).first()
-            background_to_download = []
-
-            # Если трека ещё нет в БД, то записываем информацию о нём,
-            # а иначе - увеличиваем количество его распознаний:
-            if not existing:
-                track = Track()
-                track.track_key = track_key
-                track.shazam_id = shazam_id
-                track.artist_id = artist_id
-                track.track = track_title
-                track.band = band
-
-                # Загружаем изображение (обложку трека) с помощью асинхронной функции.
-                # Сохраняем путь к обложке трека в специальном поле в БД [Tracks]
-                if background == UNKNOWN_SONG:
-                    track.background = url_for('static', filename=f'img/system/{UNKNOWN_SONG}')
-                else:
-                    filename = identifier(format_=".png")
-                    track.background = url_for('static', filename=f'img/track/{filename}')
-                    background_to_download.append([filename, background])
-
-                # Добавляем трек в БД и коммитим изменения:
-                db_sess.add(track)
-                db_sess.commit()
-                track_id = track.id
-
-                # Загружаем изображение:
-                asyncio.run(download_image_handler(background_to_download, 'track'))
-            else:
-                existing.popularity += 1
-                track_id = existing.id
-                db_sess.commit()
-
-            # Если пользователь авторизован, то записываем информацию о распознанном треке в его библиотеку:
-            if current_user.is_authenticated:
-
-                # Но если данный трек уже распознан, то перезаписываем информацию о нём:
-                already_recognized = db_sess.query(Recognized).filter(
-                    Recognized.track_id == track_id, Recognized.user_id == current_user.id).first()
-
-                # Если трек уже распознан, то перезаписываем его в БД, сохраняя данные об избранности:
-                do_favor = 0
-                if already_recognized:
-                    if already_recognized.is_favourite:
-                        do_favor = 1
-
-                    db_sess.delete(already_recognized)
+            with trace('recognize_request'):
+                # Читаем файл в буфер (в памяти, без записи в папку static) и вычисляем хеш его содержимого:
+                with stage('upload'):
+                    buffer, digest = spool_upload(f.stream)
+
+                # Если такой же файл уже распознавался, то берём результат из кэша и сразу показываем трек:
+                user_id = current_user.id if current_user.is_authenticated else None
+                track_id = recognize_cached(db_sess, digest, user_id)
+            if track_id is not None:
+                buffer.close()
+                return redirect(f'/recognize/track/{track_id}')
+
+            # Ставим задачу в очередь распознавания, если очередь переполнена - уведомляем пользователя.
+            # Обработчик очереди распознаёт файл прямо из буфера и записывает результат в БД:
+            try:
+                job_id = recognition_queue.submit(recognize_upload, buffer, user_id, digest)
+            except QueueOverflowError:
+                buffer.close()
+                return render_template(f'/nav_pages/recognize_song{dt_prefix()}.html', background=background,
+                                       message='Сервер перегружен. Попробуйте ещё раз через минуту!')
+
+            # Переводим пользователя на страницу ожидания результата:
+            return redirect(f'/recognize/job/{job_id}')
+    except Exception as e:
+        status_error = e
+        return render_template(f'/nav_pages/recognize_song{dt_prefix()}.html',
+                               message='Произошла ошибка. Попробуйте ещё раз!')
 
-                recognized = Recognized()
-                recognized.user_id = current_user.id
-                recognized.track_id = track_id
-                recognized.is_favourite = do_favor
 
-                # Увеличиваем количество распознанных пользователем уникальных треков, если этот
-                # трек он распознал впервые:
-                user = db_sess.query(User).filter(User.id == current_user.id).first()
-                user_unique_total = user.unique.split('&')
+@app.route('/recognize/job/<job_id>')
+def recognize_job(job_id):
+    """ Страница ожидания результата фонового распознавания.
+        Пока задача выполняется, страница автоматически обновляется; после завершения задачи
+        пользователь переходит на страницу распознанного трека. """
+    background = url_for('static', filename=f'img/system/{UNKNOWN_SONG}')
+    job = recognition_queue.status(job_id)
 
-                if str(track_id) not in user_unique_total:
-                    user.unique += f'{track_id}&'
-                    user.unique_total += 1
+    # Если задачи не существует (или информация о ней уже устарела), то возвращаем обычную страницу:
+    if job is None:
+        return redirect('/recognize')
 
-                # Сохраняем изменения:
-                db_sess.add(recognized)
-                db_sess.commit()
+    # Задача завершена - переводим пользователя на страницу трека (0 - трек не удалось распознать):
+    if job['status'] == DONE:
+        return redirect(f'/recognize/track/{job["result"]}')
 
-            # Обновляем страницу:
-            return redirect(f'/recognize/track/{track_id}')
-    except Exception as e:
-        status_error = e
-        return render_template(f'/nav_pages/recognize_song{dt_prefix()}.html',
+    # Во время распознавания произошла ошибка:
+    if job['status'] == FAILED:
+        return render_template(f'/nav_pages/recognize_song{dt_prefix()}.html', background=background,
                                message='Произошла ошибка. Попробуйте ещё раз!')
 
+    # Задача ещё выполняется - отображаем страницу ожидания:
+    return render_template(f'/nav_pages/recognize_song{dt_prefix()}.html', background=background,
+                           message='Трек распознаётся, подождите немного...', refresh=True)
+
 
 @app.route('/charts/<country>/<genre>')
 @app.route('/charts/<country>')
@@ -459,39 +461,18 @@ def charts(country=None, genre=None):
 
     # Получаем информацию с помощью ShazamAPI (Shazamio), и если ошибки не возникает - возвращаем хит-парад!
     try:
-        # Обрабатываем запрос, получаем данные:
-        data = charts_handler(country=country, genre=genre)
-        background_to_download = list()  # создаём список для загрузки изображений
-        top = list()  # создаём список, в котором будут храниться все хиты
+        # Обрабатываем запрос, получаем данные (из кэша хит-парадов, если они там уже есть):
+        data = get_charts(country, genre)
+
+        # Все треки хит-парада, о которых API предоставил информацию, записываем в БД одной пачкой
+        # (треки, которых ещё нет в БД, добавляются одним коммитом, а их обложки загружаются):
+        stored = iter(store_tracks(db_sess, [i for i in data if 'shazam_id' in i]))
 
-        # Пробегаемся по каждому элементу полученных данных, формируя из них хит-парад,
-        # при этом добавляя каждый элемент в БД, если его в ней ещё нет:
+        # Формируем хит-парад в исходном порядке; треки без информации от API просто отображаем на странице:
+        top = list()
         for i in data:
-            # Если API предоставил информацию, то загружаем её в БД, иначе - просто отображаем её на странице:
             if 'shazam_id' in i:
-                existing = db_sess.query(Track).filter(Track.shazam_id == i['shazam_id']).first()
-
-                if not existing:
-                    track = Track()
-                    track.track_key = i['track_key']
-                    track.shazam_id = i['shazam_id']
-                    track.artist_id = i['artist_id']
-                    track.track = i['track']
-                    track.band = i['band']
-
-                    if i['background'] == UNKNOWN_SONG:
-                        track.background = url_for('static', filename=f'img/system/{UNKNOWN_SONG}')
-                    else:
-                        filename = identifier(format_=".png")
-                        track.background = url_for('static', filename=f'img/track/{filename}')
-                        background_to_download.append([filename, i['background']])
-
-                    db_sess.add(track)
-                    db_sess.commit()
-                    top.append(track)
-
-                else:
-                    top.append(db_sess.query(Track).filter(Track.shazam_id == i['shazam_id']).first())
+                top.append(next(stored))
             else:
                 none_track = Track()
                 none_track.id = 0
@@ -510,10 +491,6 @@ def charts(country=None, genre=None):
         # Доступные жанры для определённой страны:
         available_genres = AVAILABLE_GENRES[country]
 
-        # Загружаем изображения, которые были добавлены в очередь на загрузку:
-        if background_to_download:
-            asyncio.run(download_image_handler(background_to_download, 'track'))
-
         # Возвращаем информацию:
         return render_template(f'/nav_pages/charts{dt_prefix()}.html', top=top, available_genres=available_genres,
                                country=country_list[country], country_code=country, genres_list=genres_list,
@@ -543,16 +520,8 @@ def commons(page_type):
 
     # Фильтр Artists: отображаем всех загруженных на платформу исполнителей:
     elif page_type == 'artists':
-        all_artists = []
-
-        for art in db_sess.query(Artist).all():
-            # Список со всеми треками исполнителя, а также получение количества всех треков исполнителя:
-            all_artist_tracks = db_sess.query(Track).filter(Track.artist_id == art.shazam_id).all()
-            platform_tracks = len(all_artist_tracks)
-            apt = sum([t.popularity for t in all_artist_tracks])
-            all_artists.append([art, apt, platform_tracks])
-
-        all_artists.sort(key=lambda x: x[1], reverse=True)
+        # Исполнители вместе с количеством распознаний и треков на платформе (одним запросом):
+        all_artists = artists_with_stats(db_sess)
         return render_template(f'/nav_pages/commons{dt_prefix()}.html', all_artists=all_artists,
                                page_type='artists')
     return redirect('/commons/tracks')
@@ -599,43 +568,15 @@ def similiar_songs(track_id):
         if not track_key:
             return render_template(f'/information_pages/similiar_songs{dt_prefix()}.html')
 
-        # Получаем информацию обо всех похожих песнях:
-        songs = get_similiar_songs(track_key)
-        similiar_tracks = list()
-        background_to_download = []
-
-        # Загружаем такие песни в БД, если они ещё не находятся в ней, а затем - отображаем на странице:
-        for i in songs:
-            track_key, track_shazam_id, artist_id, track_title, band, background = i
-            is_track_in_db = db_sess.query(Track).filter(Track.shazam_id == track_shazam_id).first()
-
-            if not is_track_in_db:
-                track = Track()
-                track.track_key = track_key
-                track.shazam_id = track_shazam_id
-                track.artist_id = artist_id
-                track.track = track_title
-                track.band = band
-
-                if background == UNKNOWN_SONG:
-                    track.background = url_for('static', filename=f'img/system/{UNKNOWN_SONG}')
-                else:
-                    filename = identifier(format_=".png")
-                    track.background = url_for('static', filename=f'img/track/{filename}')
-                    background_to_download.append([filename, background])
-
-                db_sess.add(track)
-                db_sess.commit()
-                similiar_tracks.append(track)
-            else:
-                track = is_track_in_db
-                similiar_tracks.append(track)
-
-        # В список может загрузиться несколько одинаковых песен, поэтому, избавляемся от дубликатов:
-        similiar_tracks = list(set(similiar_tracks))
-
-        # Загрузка изображений:
-        asyncio.run(download_image_handler(background_to_download, 'track'))
+        # Получаем все похожие песни (из кэша, либо из ShazamAPI с записью в БД). Если ShazamAPI сейчас
+        # недоступен или не ответил вовремя, то вместо похожих песен отображаем самые популярные треки
+        # того же исполнителя:
+        try:
+            similiar_tracks = related_tracks(db_sess, track_key)
+        except (KeyError, CircuitOpenError, asyncio.TimeoutError):
+            similiar_tracks = db_sess.query(Track).filter(Track.artist_id == track_owner.artist_id,
+                                                          Track.id != track_owner.id) \
+                .order_by(Track.popularity.desc()).limit(LIMIT_CONSTANT).all()
 
         # Возвращаем информацию:
         return render_template(f'/information_pages/similiar_songs{dt_prefix()}.html', track_owner=track_owner,
@@ -671,11 +612,13 @@ def download_artist(artist_id):
     if not artist_existing:
         background_to_download = []
 
-        # Если получить информацию об исполнителе не удалось, то ловим ошибку и возвращаем пустую страницу с
-        # соответствующим сообщением:
+        # Если получить информацию об исполнителе не удалось (в том числе если ShazamAPI недоступен или не ответил
+        # вовремя), то ловим ошибку и возвращаем пустую страницу с соответствующим сообщением:
         try:
-            all_artist_info = get_artist_info(artist_shazam_id)
-        except KeyError:
+            all_artist_info = cached_artist_info(db_sess, artist_shazam_id)
+        except (KeyError, CircuitOpenError, asyncio.TimeoutError):
+            all_artist_info = None
+        if all_artist_info is None:
             return render_template(f'/information_pages/about_artist{dt_prefix()}.html')
 
         # Если всё прошло успешно, то загружаем данные:
@@ -694,7 +637,7 @@ def download_artist(artist_id):
 
         db_sess.add(artist)
         db_sess.commit()
-        asyncio.run(download_image_handler(
+        run_coroutine(download_image_handler(
             background_to_download, 'artist'))
 
     # Получаем ID исполнителя в БД, а затем - производим трансфер на другую страницу:
@@ -734,44 +677,27 @@ def about_artist(artist_id):
         artist_shazam_id = artist.shazam_id
 
         # Список, в котором будут храниться лучшие треки исполнителя:
-        best_artist_tracks = get_artist_info(artist_shazam_id)[1]
-        best_tracks = list()
-
-        # Обрабатываем информацию, по необходимости добавляем информацию о треке в БД, если его ещё не существует у нас:
-        background_to_download = []
-        for i in best_artist_tracks:
-            track_shazam_id, track_title, band, background = i
-            is_track_in_db = db_sess.query(Track).filter(Track.shazam_id == track_shazam_id).first()
-
-            if not is_track_in_db:
-                track = Track()
-                track.track_key = 0  # ShazamAPI не предоставляет ключ для лучших песен артиста...
-                track.shazam_id = track_shazam_id
-                track.artist_id = artist_shazam_id
-                track.track = track_title
-                track.band = band
-
-                if background == UNKNOWN_SONG:
-                    track.background = url_for('static', filename=f'img/system/{UNKNOWN_SONG}')
-                else:
-                    filename = identifier(format_=".png")
-                    track.background = url_for('static', filename=f'img/track/{filename}')
-                    background_to_download.append([filename, background])
-
-                db_sess.add(track)
-                db_sess.commit()
-                best_tracks.append(track)
-            else:
-                track = is_track_in_db
-                best_tracks.append(track)
+        # Если ShazamAPI сейчас недоступен или не ответил вовремя, то лучшие треки берём из треков исполнителя
+        # на платформе (см. ниже):
+        try:
+            best_artist_tracks = cached_artist_info(db_sess, artist_shazam_id)[1]
+            upstream_available = True
+        except (KeyError, CircuitOpenError, asyncio.TimeoutError):
+            best_artist_tracks = []
+            upstream_available = False
+
+        # Добавляем лучшие треки исполнителя в БД одной пачкой (если их ещё не существует у нас).
+        # ShazamAPI не предоставляет ключ для лучших песен артиста, поэтому track_key = 0:
+        best_tracks = store_tracks(db_sess, [{'shazam_id': track_shazam_id, 'track_key': 0,
+                                              'artist_id': artist_shazam_id, 'track': track_title,
+                                              'band': band, 'background': background}
+                                             for track_shazam_id, track_title, band, background in best_artist_tracks])
 
         # Список со всеми треками исполнителя, а также получение количества всех треков исполнителя:
         all_artist_tracks = db_sess.query(Track).filter(Track.artist_id == artist_shazam_id).all()
-        platform_tracks = len(all_artist_tracks)
-        artist_popularity_total = sum([t.popularity for t in all_artist_tracks])
-
-        # Загрузка изображений:
-        asyncio.run(download_image_handler(background_to_download, 'track'))
+        platform_tracks, artist_popularity_total = artist_stats(db_sess, artist_shazam_id)
+        if not upstream_available:
+            best_tracks = list(sorted(all_artist_tracks, key=lambda t: t.popularity, reverse=True))
 
         # Отображение страницы:
         return render_template(f'/information_pages/about_artist{dt_prefix()}.html',
@@ -824,6 +750,7 @@ def delete_track(track_id):
         if track_to_delete:
             db_sess.delete(track_to_delete)
             db_sess.commit()
+            platform_snapshot.invalidate()
 
     # Перезагружаем библиотеку:
     return redirect('/library')
@@ -858,17 +785,10 @@ def feature_track(track_id):
 
     # Проверка авторизации:
     if current_user.is_authenticated:
-        track = db_sess.query(Recognized).filter(Recognized.user_id == current_user.id,
-                                                 Recognized.id == track_id).first()
 
-        # Если трек принадлежит пользователю - меняем его статус и обновляем страницу:
-        if track:
-            if not track.is_favourite:
-                track.is_favourite = 1
-            else:
-                track.is_favourite = 0
-
-            db_sess.commit()
+        # Если трек принадлежит пользователю - меняем его статус (через очередь записи в БД) и обновляем страницу:
+        if db_writer.write(toggle_favourite, current_user.id, track_id):
+            platform_snapshot.invalidate()
             return redirect('/library')
     return redirect('/featured')
 
@@ -892,20 +812,15 @@ def cabinet():
     if current_user.is_authenticated:
 
         # Собираем статистику пользователя, чтобы отобразить её в ЛК:
-        users = [u for u in db_sess.query(User).all() if u.id > 1]
         user = db_sess.query(User).filter(User.id == current_user.id).first()
 
-        user_unique_total = len(user.unique.split('&')) - 1
+        user_unique_total = unique_tracks_count(db_sess, user.id)
         user_in_library = len(db_sess.query(Recognized).filter(Recognized.user_id == user.id).all())
         user_in_featured = len(db_sess.query(Recognized).filter(Recognized.user_id == user.id,
                                                                 Recognized.is_favourite == 1).all())
 
-        try:
-            user_in_top = (list(sorted(users, key=lambda u: len(u.unique.split('&')), reverse=True))
-                           .index(user) + 1)
-        except Exception as e:
-            status_error = e
-            user_in_top = 0
+        # Место пользователя в топе (0 - пользователь не участвует в топе), см. leaderboard.py:
+        user_in_top = user_rank(db_sess, user.id)
 
         # Если пользователь не загружает изображение в свой профиль, то отправляем статистику и доступ к функциям:
         if request.method == 'GET':
@@ -930,6 +845,7 @@ def cabinet():
             f.save(file_path)
             user.background = f'/{file_path}'
             db_sess.commit()
+            platform_snapshot.invalidate()
             return redirect('/cabinet')
 
     # Загружаем ЛК:
@@ -952,6 +868,7 @@ def cabinet_set_default_profile():
 
         # Сохраняем изменения и производим обновление страницы:
         db_sess.commit()
+        platform_snapshot.invalidate()
     return redirect('/cabinet')
 
 
@@ -1028,6 +945,7 @@ def edit_cabinet():
 
             # Сохраняем изменения, переводим пользователя в личный кабинет:
             db_sess.commit()
+            platform_snapshot.invalidate()
             return redirect('/cabinet')
 
         # Загружаем форму
@@ -1137,14 +1055,16 @@ def delete_profile():
 
             # Если пройдены все условия, то удаляем аккаунт:
 
-            # Прежде всего, удаляем библиотеку пользователя из БД:
+            # Прежде всего, удаляем библиотеку и уникальные треки пользователя из БД:
             recognized_by_user = db_sess.query(Recognized).filter(Recognized.user_id == user.id).all()
             for r in recognized_by_user:
                 db_sess.delete(r)
+            db_sess.query(UserUniqueTrack).filter(UserUniqueTrack.user_id == user.id).delete()
 
             # Удаляем пользователя, подтверждаем изменения, переводим пользователя на страницу авторизации:
             db_sess.delete(user)
             db_sess.commit()
+            platform_snapshot.invalidate()
             return redirect('/login')
 
         # Загружаем форму:
@@ -1171,7 +1091,7 @@ def user_information(user_id):
         link = f'{o.netloc}/user/{user_id}'
 
         # Загрузка статистики:
-        recognized_total = len(user.unique.split('&')) - 1
+        recognized_total = unique_tracks_count(db_sess, user.id)
         user_lib = db_sess.query(Recognized).filter(Recognized.user_id == user.id).all()
         in_library = len(user_lib)
         in_featured = len([1 for u in user_lib if u.is_favourite == 1])
@@ -1210,6 +1130,21 @@ def administrator():
     return render_template(f'/admin_page/admin{dt_prefix()}.html', users=users)
 
 
+@app.route('/administrator/metrics')
+def admin_metrics():
+    """ Данная функция возвращает (в формате JSON) статистику времени выполнения этапов распознавания:
+        загрузки файла, декодирования, обращения к ShazamAPI, записи в БД, загрузки обложки и т.д.,
+        статистику кэша распознаваний и снимка статистики главной страницы, количество объединённых одинаковых запросов к ShazamAPI,
+        а также состояние предохранителей запросов к ShazamAPI.
+        Доступна только администратору сайта. """
+
+    # Проверяем, является ли пользователь администратором:
+    is_admin()
+    return jsonify({'stages': metrics.snapshot(), 'recognition_cache': recognition_cache.stats(),
+                    'platform_snapshot': platform_snapshot.stats(),
+                    'single_flight': single_flight.stats(), 'circuit_breakers': circuit_breaker.stats()})
+
+
 @app.route('/administrator/reset_user/<int:user_id>')
 def admin_reset_user(user_id):
     """ Данная функция позволяет очистить оформление пользователя, а также выдать ему предупреждение.
@@ -1236,6 +1171,7 @@ def admin_reset_user(user_id):
 
         # Сохраняем изменения, направляем администратора обратно в кабинет:
         db_sess.commit()
+        platform_snapshot.invalidate()
     return redirect('/administrator')
 
 
@@ -1276,25 +1212,23 @@ def admin_delete_user(user_id):
     if user:
         if user.warns >= 3:
 
-            # Удаляем библиотку пользователя из БД:
+            # Удаляем библиотку и уникальные треки пользователя из БД:
             recognized_by_user = db_sess.query(Recognized).filter(Recognized.user_id == user.id).all()
             for rec in recognized_by_user:
                 db_sess.delete(rec)
+            db_sess.query(UserUniqueTrack).filter(UserUniqueTrack.user_id == user.id).delete()
 
             # Удаляем пользователя, возвращаем администратора в кабинет:
             db_sess.delete(user)
             db_sess.commit()
+            platform_snapshot.invalidate()
     return redirect('/administrator')
 
 
 if __name__ == '__main__':
-    # Загружаем сессию БД:
-    db_session.global_init("db/PyJam.db")
-    db_sess = db_session.create_session()
-
-    # Специальное условие библиотеки Asyncio для OC Windows:
-    policy = asyncio.WindowsSelectorEventLoopPolicy()
-    asyncio.set_event_loop_policy(policy)
+    # Создаём таблицы и выполняем миграции БД (планировщик хит-парадов запускается перед первым запросом,
+    # см. prepare_database):
+    db_session.migrate()
 
     # Запускаем приложение:
     app.run(debug=True)
@@ -0,0 +1,77 @@
+""" Проверка локального распознавания по отпечаткам (data/audio_handlers/fingerprint.py) без сети и FFMPEG:
+    отпечатки синтетического сигнала записываются во временную БД, после чего фрагмент того же сигнала
+    должен распознаваться, а посторонний шум - нет. """
+from data.audio_handlers.fingerprint import FFT_SIZE, find_peaks, index_track, local_recognize, spectrogram
+from data.system_files.constants import FINGERPRINT_SAMPLE_RATE
+from data.ORM.db_session import SqlAlchemyBase
+from data.ORM.track import Track
+from pydub import AudioSegment
+import sqlalchemy.orm as orm
+import sqlalchemy as sa
+import numpy as np
+import pytest
+
+
+def to_segment(samples):
+    """ Массив отсчётов (-1..1) -> AudioSegment (моно, 16 бит, FINGERPRINT_SAMPLE_RATE) """
+    pcm = (np.clip(samples, -1, 1) * 32767).astype(np.int16)
+    return AudioSegment(data=pcm.tobytes(), sample_width=2, frame_rate=FINGERPRINT_SAMPLE_RATE, channels=1)
+
+
+def melody(seconds, seed):
+    """ Синтетическая «мелодия»: последовательность аккордов из случайных частот с небольшим шумом """
+    rng = np.random.default_rng(seed)
+    note = FINGERPRINT_SAMPLE_RATE // 5  # длина одного аккорда - 0.2 секунды
+    t = np.arange(note) / FINGERPRINT_SAMPLE_RATE
+    chords = [sum(np.sin(2 * np.pi * f * t) for f in rng.uniform(200, 4000, 3)) / 3
+              for _ in range(seconds * 5)]
+    return np.concatenate(chords) * 0.8 + rng.normal(0, 0.01, seconds * 5 * note)
+
+
+@pytest.fixture
+def session(tmp_path):
+    # noinspection PyUnresolvedReferences
+    from data.ORM import __all_models
+    engine = sa.create_engine(f'sqlite:///{tmp_path / "fingerprints.db"}')
+    SqlAlchemyBase.metadata.create_all(engine)
+    session = orm.sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def indexed_track(session):
+    track = Track(shazam_id=101, track_key=202, artist_id=303, track='Синтетический трек', band='PyJam',
+                  background='/static/img/system/unknown_song.png', popularity=1)
+    session.add(track)
+    session.commit()
+
+    samples = melody(40, seed=1)
+    assert index_track(session, track.id, to_segment(samples)) > 0
+    return track, samples
+
+
+def test_excerpt_is_recognized(session, indexed_track):
+    track, samples = indexed_track
+    # Фрагмент из середины трека, начало которого не совпадает с границей кадра спектрограммы:
+    start = 12 * FINGERPRINT_SAMPLE_RATE + 137
+    excerpt = samples[start:start + 8 * FINGERPRINT_SAMPLE_RATE]
+
+    assert local_recognize(to_segment(excerpt), session) == (202, 101, 303, 'Синтетический трек', 'PyJam',
+                                                             '/static/img/system/unknown_song.png')
+
+
+def test_unrelated_audio_is_rejected(session, indexed_track):
+    noise = np.random.default_rng(2).normal(0, 0.3, 8 * FINGERPRINT_SAMPLE_RATE)
+    assert local_recognize(to_segment(noise), session) is None
+    assert local_recognize(to_segment(melody(8, seed=3)), session) is None
+
+
+def test_frequency_bins_fit_hash():
+    # Номер частотной полосы занимает 10 бит хеша, поэтому полос не больше 1024 (без полосы Найквиста):
+    assert spectrogram(np.zeros(FFT_SIZE * 4, dtype=np.float32)).shape[1] == 1024
+
+    # Сигнал на частоте Найквиста не должен давать пиков, которые в хеше совпадут с постоянной составляющей:
+    nyquist = np.cos(np.pi * np.arange(5 * FINGERPRINT_SAMPLE_RATE)) * 0.5 + melody(5, seed=4) * 0.1
+    assert find_peaks(spectrogram(nyquist))[:, 1].max() < 1024
@@ -0,0 +1,26 @@
+""" Проверка определения вида запроса к ShazamAPI по ссылке (data/audio_handlers/shazam_standin.py).
+    Ссылки строятся по шаблонам Shazamio (shazamio.misc.ShazamUrl), по которым клиент действительно отправляет запросы. """
+from data.audio_handlers.shazam_standin import endpoint_kind
+import pytest
+
+ShazamUrl = pytest.importorskip('shazamio.misc').ShazamUrl
+
+# Общие параметры шаблонов:
+PARAMS = {'language': 'ru', 'endpoint_country': 'RU', 'device': 'web', 'limit': 100, 'offset': 0,
+          'uuid_1': '00000000-0000-4000-8000-000000000001', 'uuid_2': '00000000-0000-4000-8000-000000000002'}
+
+
+@pytest.mark.parametrize('template, values, kind', [
+    (ShazamUrl.SEARCH_FROM_FILE, {}, 'recognize'),
+    (ShazamUrl.TOP_TRACKS_WORLD, {}, 'top_tracks'),
+    (ShazamUrl.TOP_TRACKS_COUNTRY, {'country_code': 'RU'}, 'top_tracks'),
+    (ShazamUrl.TOP_TRACKS_CITY, {'city_id': 524901}, 'top_tracks'),
+    (ShazamUrl.GENRE_WORLD, {'genre': 'pop'}, 'top_tracks'),
+    (ShazamUrl.GENRE_COUNTRY, {'country': 'RU', 'genre': 'pop'}, 'top_tracks'),
+    (ShazamUrl.RELATED_SONGS, {'track_id': 40333609}, 'related_tracks'),
+    (ShazamUrl.SEARCH_ARTIST_V2, {'artist_id': 1081606072}, 'artist_about'),
+    (ShazamUrl.ABOUT_TRACK, {'track_id': 40333609}, 'other'),
+    (ShazamUrl.LOCATIONS, {}, 'other'),
+])
+def test_endpoint_kind(template, values, kind):
+    assert endpoint_kind(template.format(**PARAMS, **values)) == kind